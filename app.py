@@ -1,12 +1,13 @@
+# Medir las importaciones desde antes de cargar cualquier módulo de la app
+from utils.import_profiler import import_profiler
+import_profiler.start()
+
 import streamlit as st
 import pandas as pd
 from utils.portfolio import Portfolio
 from utils.market_data import MarketData
-from utils.ai_advisor import AIAdvisor
-from utils.news import NewsService
-from utils.report_generator import ReportGenerator
-from utils.recommendation_engine import RecommendationEngine
 from utils.alert_manager import AlertManager
+from utils.indicators import ALERT_METRICS, METRICS_BY_TYPE, SIGNED_METRICS
 from utils.data_aggregator import DataAggregator
 from utils.advertising import AdvertisingManager
 from utils.gamification import render_gamification_ui
@@ -15,11 +16,18 @@ from utils.broker_compatibility import BrokerCompatibility
 from utils.risk_profiler import RiskProfiler
 from utils.timeline import render_investment_journey
 from utils.auth import AuthManager, require_auth
-from utils.monetization import MonetizationManager
 from utils.launch_manager import LaunchManager
 from utils.loading_screen import render_loading_screen, show_loading_overlay, remove_loading_overlay
-from utils.feedback import FeedbackManager
-from utils.donations import DonationManager
+from utils.shared_cache import shared_cache
+from utils.single_flight import single_flight
+from utils.rate_limiter import scheduler
+from utils.prewarmer import start_prewarmer
+from utils.provider_router import quote_router
+from utils.db import db_pool
+from utils.llm_cache import llm_cache
+from utils.migrations import run_migrations
+from utils.notifications import start_outbox_sender
+from utils.registry import services, SHARED, SESSION
 from datetime import datetime
 
 # Page config
@@ -30,38 +38,60 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+services.begin_run()
+
+# Segundos entre refrescos automáticos de cada sección (None = solo al interactuar)
+FRAGMENT_REFRESH = {
+    'dashboard': 60,
+    'performance': None,
+    'market_overview': 60,
+    'alerts': 30
+}
+
 # Show loading screen while initializing
 show_loading_overlay()
 
-# Initialize session state and managers
-if 'auth_manager' not in st.session_state:
-    st.session_state.auth_manager = AuthManager()
+# Aplicar las migraciones de esquema pendientes (una vez por proceso)
+try:
+    run_migrations()
+except Exception as e:
+    st.error(f"Error aplicando migraciones de la base de datos: {str(e)}")
+
+# Mantener calientes en segundo plano las instantáneas de índices y sectores (una vez por proceso)
+start_prewarmer()
+
+# Enviar en segundo plano los correos de la bandeja de salida (una vez por proceso)
+start_outbox_sender()
+
+services.mark('arranque del proceso')
+
+# Servicios: los compartidos se crean una vez por proceso y los de sesión al primer uso
+services.register('auth_manager', AuthManager, SHARED)
+services.register('launch_manager', LaunchManager, SHARED)
+services.register('monetization_manager', 'utils.monetization:MonetizationManager', SHARED)
+services.register('alert_manager', AlertManager, SESSION)
+services.register('ad_manager', AdvertisingManager, SESSION)
+services.register('portfolio_aggregator', PortfolioAggregator, SESSION)
+services.register('feedback_manager', 'utils.feedback:FeedbackManager', SESSION)
+services.register('donation_manager', 'utils.donations:DonationManager', SESSION)
+
+# Initialize session state
+if 'user' not in st.session_state:
+    st.session_state.user = None
 if 'portfolios' not in st.session_state:
-    if st.session_state.auth_manager.is_authenticated():
-        user = st.session_state.auth_manager.get_current_user()
+    if services.auth_manager.is_authenticated():
+        user = services.auth_manager.get_current_user()
         st.session_state.portfolios = Portfolio.load_user_portfolios(user['id'])
     else:
         st.session_state.portfolios = {}
 if 'current_report' not in st.session_state:
     st.session_state.current_report = None
-if 'alert_manager' not in st.session_state:
-    st.session_state.alert_manager = AlertManager()
 if 'page' not in st.session_state:
     st.session_state.page = "Dashboard"
-if 'ad_manager' not in st.session_state:
-    st.session_state.ad_manager = AdvertisingManager()
-if 'portfolio_aggregator' not in st.session_state:
-    st.session_state.portfolio_aggregator = PortfolioAggregator()
 if 'risk_profile' not in st.session_state:
     st.session_state.risk_profile = None
-if 'monetization_manager' not in st.session_state:
-    st.session_state.monetization_manager = MonetizationManager()
-if 'launch_manager' not in st.session_state:
-    st.session_state.launch_manager = LaunchManager()
-if 'feedback_manager' not in st.session_state:
-    st.session_state.feedback_manager = FeedbackManager()
-if 'donation_manager' not in st.session_state:
-    st.session_state.donation_manager = DonationManager()
+
+services.mark('estado de sesión')
 
 # Remove loading overlay after initialization
 remove_loading_overlay()
@@ -74,38 +104,38 @@ def main():
 
     # Verificar si el usuario es administrador
     is_admin = False
-    if st.session_state.auth_manager.is_authenticated():
-        is_admin = st.session_state.auth_manager.is_admin()
+    if services.auth_manager.is_authenticated():
+        is_admin = services.auth_manager.is_admin()
 
     # Renderizar UI de autenticación o lista de espera
-    if not st.session_state.auth_manager.is_authenticated():
-        st.session_state.auth_manager.render_login_ui()
+    if not services.auth_manager.is_authenticated():
+        services.auth_manager.render_login_ui()
     elif not is_admin:  # Si no es admin, verificar acceso
-        user = st.session_state.auth_manager.get_current_user()
-        if not st.session_state.launch_manager.check_access_allowed(user['id']):
+        user = services.auth_manager.get_current_user()
+        if not services.launch_manager.check_access_allowed(user['id']):
             st.warning("Tu acceso está pendiente de aprobación.")
-            st.session_state.launch_manager.render_waitlist_ui()
+            services.launch_manager.render_waitlist_ui()
     else:
         if is_admin:
             show_authenticated_content()
         else:
             # Verificar acceso permitido
-            user = st.session_state.auth_manager.get_current_user()
-            if st.session_state.launch_manager.check_access_allowed(user['id']):
+            user = services.auth_manager.get_current_user()
+            if services.launch_manager.check_access_allowed(user['id']):
                 show_authenticated_content()
             else:
                 st.warning("Tu acceso está pendiente de aprobación.")
-                st.session_state.launch_manager.render_waitlist_ui()
+                services.launch_manager.render_waitlist_ui()
 
 @require_auth
 def show_authenticated_content():
     """Mostrar contenido para usuarios autenticados"""
     # Verificar acceso de administrador
-    is_admin = st.session_state.auth_manager.is_admin()
+    is_admin = services.auth_manager.is_admin()
 
     # Panel de control de lanzamiento solo para admin
     if is_admin:
-        st.session_state.launch_manager.render_admin_launch_control()
+        services.launch_manager.render_admin_launch_control()
         st.markdown("---")
 
     # Navegación mejorada
@@ -129,23 +159,24 @@ def show_authenticated_content():
         st.sidebar.markdown("### Panel de Administración")
         compatibility_checker = BrokerCompatibility()
         compatibility_checker.render_compatibility_ui()
-        st.session_state.monetization_manager.render_admin_metrics()  # Nuevas métricas
+        services.monetization_manager.render_admin_metrics()  # Nuevas métricas
+        show_data_layer_metrics()
         st.markdown("---")
 
-    # Navegación principal
+    # Navegación principal: el callback cambia la página antes de la ejecución que
+    # provoca el clic, así que no hace falta un segundo st.rerun()
     for page_name, display_name in pages.items():
-        clicked = st.sidebar.button(
+        st.sidebar.button(
             display_name,
             key=f"nav_{page_name}",
             use_container_width=True,
-            help=f"Ir a {display_name}"
+            help=f"Ir a {display_name}",
+            on_click=go_to,
+            args=(page_name,)
         )
-        if clicked:
-            st.session_state.page = page_name
-            st.rerun()
 
     # Mostrar anuncio en la barra lateral
-    st.session_state.ad_manager.render_sidebar_ad()
+    services.ad_manager.render_sidebar_ad()
 
     # Contenido principal
     if st.session_state.page == "Perfil de Riesgo":
@@ -169,12 +200,28 @@ def show_authenticated_content():
     elif st.session_state.page == "Membresía":
         show_membership()
     elif st.session_state.page == "Feedback":
-        st.session_state.feedback_manager.render_feedback_ui()
+        services.feedback_manager.render_feedback_ui()
     elif st.session_state.page == "Donaciones":
-        st.session_state.donation_manager.render_donation_ui()
+        services.donation_manager.render_donation_ui()
+
+
+def go_to(page_name: str):
+    """Callback de navegación entre páginas"""
+    st.session_state.page = page_name
 
 
 def show_dashboard():
+    # Cada sección se refresca por su cuenta sin volver a ejecutar el resto de la página
+    dashboard_tiles()
+
+    # Separador visual
+    st.markdown("---")
+
+    dashboard_performance()
+
+
+@st.fragment(run_every=FRAGMENT_REFRESH['dashboard'])
+def dashboard_tiles():
     # Crear un layout de tarjetas para información importante
     col1, col2, col3 = st.columns(3)
 
@@ -190,7 +237,7 @@ def show_dashboard():
             st.metric("", f"${total_value:,.2f}")
         else:
             if st.button("Crear Primera Cartera", key="create_first_portfolio"):
-                st.session_state.page = "Gestión de Carteras"
+                go_to("Gestión de Carteras")
                 st.rerun()
 
     with col2:
@@ -205,7 +252,7 @@ def show_dashboard():
                  delta=f"{sp500_return:.2f}%",
                  delta_color='normal' if sp500_return > 0 else 'inverse')
         if st.button("Ver Más Noticias", key="see_more_news"):
-            st.session_state.page = "Noticias del Mercado"
+            go_to("Noticias del Mercado")
             st.rerun()
 
     with col3:
@@ -219,17 +266,17 @@ def show_dashboard():
                                  if p.get_total_value() > 0])
             st.metric("", f"{completed_goals} completados")
             if st.button("Ver Progreso", key="see_progress"):
-                st.session_state.page = "Progreso"
+                go_to("Progreso")
                 st.rerun()
         else:
             st.info("Define tus objetivos")
             if st.button("Configurar Objetivos", key="set_goals"):
-                st.session_state.page = "Progreso"
+                go_to("Progreso")
                 st.rerun()
 
-    # Separador visual
-    st.markdown("---")
 
+@st.fragment(run_every=FRAGMENT_REFRESH['performance'])
+def dashboard_performance():
     # Sección de rendimiento de carteras
     if st.session_state.portfolios:
         st.subheader("📊 Rendimiento de Carteras")
@@ -241,12 +288,12 @@ def show_dashboard():
                 st.plotly_chart(portfolio.create_performance_chart(performance_data),
                               use_container_width=True)
                 if st.button("Gestionar Cartera", key=f"manage_{name}"):
-                    st.session_state.page = "Gestión de Carteras"
+                    go_to("Gestión de Carteras")
                     st.rerun()
     else:
         st.info("🚀 ¡Comienza tu viaje de inversión! Crea tu primera cartera en la sección 'Gestión de Carteras'.")
         if st.button("Comenzar Ahora", key="start_investing"):
-            st.session_state.page = "Gestión de Carteras"
+            go_to("Gestión de Carteras")
             st.rerun()
 
 
@@ -257,10 +304,10 @@ def show_portfolio_management():
     tabs = st.tabs(["Carteras Conectadas", "Gestión Manual", "Conectar Broker"])
 
     with tabs[0]:
-        st.session_state.portfolio_aggregator.render_connected_portfolios()
+        services.portfolio_aggregator.render_connected_portfolios()
 
     with tabs[1]:
-        st.session_state.portfolio_aggregator.render_manual_import_guide()
+        services.portfolio_aggregator.render_manual_import_guide()
         with st.expander("Añadir Nueva Cartera", expanded=True):
             portfolio_name = st.text_input("Nombre de la Cartera", key="portfolio_name_input")
 
@@ -280,7 +327,7 @@ def show_portfolio_management():
                         try:
                             # Crear o obtener la cartera
                             if portfolio_name not in st.session_state.portfolios:
-                                user = st.session_state.auth_manager.get_current_user()
+                                user = services.auth_manager.get_current_user()
                                 portfolio = Portfolio(portfolio_name, user['id'])
                                 portfolio.save()  # Guardar la cartera primero
                                 # Recargar todas las carteras del usuario
@@ -290,7 +337,7 @@ def show_portfolio_management():
                                 st.session_state.portfolios[portfolio_name].add_position(symbol, shares)
                                 st.session_state.portfolios[portfolio_name].save()
                                 # Recargar las carteras después de añadir la posición
-                                user = st.session_state.auth_manager.get_current_user()
+                                user = services.auth_manager.get_current_user()
                                 st.session_state.portfolios = Portfolio.load_user_portfolios(user['id'])
                                 st.success(f"¡Cartera '{portfolio_name}' creada y acción {symbol} añadida correctamente!")
                                 st.rerun()
@@ -333,45 +380,19 @@ def show_market_news():
     st.header("Noticias del Mercado")
 
     # Mostrar anuncio de educación
-    st.session_state.ad_manager.render_inline_ad("education")
+    services.ad_manager.render_inline_ad("education")
 
     # Inicializar servicios
     data_aggregator = DataAggregator()
 
+    market_overview(data_aggregator)
+
     # Mostrar indicador de carga
     with st.spinner():
         render_loading_screen("Cargando noticias del mercado")
         try:
             # Obtener noticias de múltiples fuentes
             news = data_aggregator.get_financial_news(days=7)
-            market_data = data_aggregator.get_market_movers()
-            sector_data = data_aggregator.get_sector_performance()
-
-            # Mostrar datos del mercado
-            st.subheader("📊 Visión General del Mercado")
-            market_cols = st.columns(3)
-
-            for idx, (index, data) in enumerate(market_data.items()):
-                with market_cols[idx]:
-                    delta_color = 'normal' if data['change'] > 0 else 'inverse'
-                    st.metric(
-                        data['name'],
-                        f"${data['price']:,.2f}",
-                        f"{data['change']:+.2f}%",
-                        delta_color=delta_color
-                    )
-
-            # Mostrar rendimiento sectorial
-            st.subheader("🏢 Rendimiento por Sector")
-            sector_cols = st.columns(4)
-            for idx, (sector, data) in enumerate(sector_data.items()):
-                with sector_cols[idx % 4]:
-                    delta_color = 'normal' if data['change'] > 0 else 'inverse'
-                    st.metric(
-                        data['name'],
-                        f"{data['change']:+.2f}%",
-                        delta_color=delta_color
-                    )
 
             # Filtros y actualización de noticias
             col1, col2 = st.columns([3, 1])
@@ -403,11 +424,51 @@ def show_market_news():
             st.button("🔄 Reintentar", on_click=lambda: st.rerun(), key="retry_news_button")
 
 
+@st.fragment(run_every=FRAGMENT_REFRESH['market_overview'])
+def market_overview(data_aggregator: DataAggregator):
+    # Los índices y sectores se leen de las instantáneas precalentadas en memoria
+    try:
+        market_snapshot = data_aggregator.get_market_snapshot('market_movers')
+        sector_snapshot = data_aggregator.get_market_snapshot('sector_performance')
+
+        # Mostrar datos del mercado
+        st.subheader("📊 Visión General del Mercado")
+        market_cols = st.columns(3)
+
+        for idx, (index, data) in enumerate(market_snapshot['data'].items()):
+            with market_cols[idx]:
+                delta_color = 'normal' if data['change'] > 0 else 'inverse'
+                st.metric(
+                    data['name'],
+                    f"${data['price']:,.2f}",
+                    f"{data['change']:+.2f}%",
+                    delta_color=delta_color
+                )
+
+        # Mostrar rendimiento sectorial
+        st.subheader("🏢 Rendimiento por Sector")
+        sector_cols = st.columns(4)
+        for idx, (sector, data) in enumerate(sector_snapshot['data'].items()):
+            with sector_cols[idx % 4]:
+                delta_color = 'normal' if data['change'] > 0 else 'inverse'
+                st.metric(
+                    data['name'],
+                    f"{data['change']:+.2f}%",
+                    delta_color=delta_color
+                )
+
+        updated_at = min(market_snapshot['updated_at'], sector_snapshot['updated_at'])
+        age = int((datetime.now() - updated_at).total_seconds())
+        st.caption(f"📡 Datos de mercado actualizados hace {age} s ({updated_at.strftime('%H:%M:%S')})")
+    except Exception as e:
+        st.error(f"Error obteniendo datos del mercado: {str(e)}")
+
+
 def show_ai_advisor():
     st.header("Asesor Financiero AI")
 
     # Mostrar anuncio de herramientas
-    st.session_state.ad_manager.render_inline_ad("tools")
+    services.ad_manager.render_inline_ad("tools")
 
     st.write("""
     💡 Tu asesor financiero personal, potenciado por IA.
@@ -421,18 +482,32 @@ def show_ai_advisor():
     question = st.text_area("Haz tu pregunta financiera:")
     if st.button("Obtener Asesoramiento", key="get_advice_button"):
         if question:
+            from utils.ai_advisor import AIAdvisor
             advisor = AIAdvisor()
-            with st.spinner():
-                render_loading_screen("Analizando tu pregunta")
-                try:
-                    response = advisor.get_advice(question)
-                    st.write(response)
-                except Exception as e:
-                    st.error(f"Error al obtener asesoramiento: {str(e)}")
+            # La respuesta se pinta según llegan los fragmentos: la espera es hasta el primero
+            timing = {}
+            try:
+                st.write_stream(advisor.stream_advice(question, timing))
+                show_stream_timing(timing)
+            except Exception as e:
+                st.error(f"Error al obtener asesoramiento: {str(e)}")
         else:
             st.warning("Por favor, introduce una pregunta.")
 
 
+def show_stream_timing(timing: dict):
+    """Pie con la espera hasta el primer fragmento y la duración total de la respuesta"""
+    if not timing:
+        return
+    if timing['cached']:
+        st.caption(f"⚡ Respuesta reutilizada del caché en {timing['total_ms'] / 1000:.1f} s")
+    else:
+        st.caption(
+            f"⏱️ Primer fragmento en {timing['ttft_ms'] / 1000:.1f} s · "
+            f"respuesta completa en {timing['total_ms'] / 1000:.1f} s"
+        )
+
+
 def show_reports():
     st.header("Generador de Informes de Inversión")
 
@@ -451,9 +526,13 @@ def show_reports():
     with col2:
         if st.button("🔄 Generar Informe", key="generate_report_button"):
             with st.spinner("Generando informe personalizado..."):
+                from utils.report_generator import ReportGenerator
                 report_generator = ReportGenerator()
                 portfolio = st.session_state.portfolios[selected_portfolio]
-                st.session_state.current_report = report_generator.generate_complete_report(portfolio)
+                # La sección de IA se transmite más abajo, ya con el resto del informe a la vista
+                st.session_state.current_report = report_generator.generate_complete_report(
+                    portfolio, include_ai=False
+                )
 
     if st.session_state.current_report:
         report = st.session_state.current_report
@@ -471,7 +550,26 @@ def show_reports():
 
         # Recomendaciones de IA
         with st.expander("🤖 Recomendaciones de IA", expanded=True):
-            st.markdown(report['ai_recommendations'])
+            portfolio = st.session_state.portfolios.get(report.get('portfolio_name'))
+            if report.get('ai_error'):
+                # El fallo se guarda en el informe: otra interacción no vuelve a llamar a OpenAI
+                st.error(f"Error al generar las recomendaciones: {report['ai_error']}")
+                if st.button("🔁 Reintentar", key="retry_ai_recommendations_button"):
+                    report['ai_error'] = None
+                    st.rerun()
+            elif report['ai_recommendations'] is None and portfolio is not None:
+                from utils.report_generator import ReportGenerator
+                timing = {}
+                try:
+                    report['ai_recommendations'] = st.write_stream(
+                        ReportGenerator().stream_ai_recommendations(portfolio, timing=timing)
+                    )
+                    show_stream_timing(timing)
+                except Exception as e:
+                    report['ai_error'] = str(e)
+                    st.rerun()
+            elif report['ai_recommendations']:
+                st.markdown(report['ai_recommendations'])
 
         # Opciones de exportación (futura implementación)
         st.download_button(
@@ -510,6 +608,7 @@ def show_recommendations():
     # Botón para generar recomendaciones
     if st.button("Analizar Portafolio", key="analyze_portfolio_button"):
         with st.spinner("Analizando portafolio y condiciones de mercado..."):
+            from utils.recommendation_engine import RecommendationEngine
             recommendation_engine = RecommendationEngine()
             recommendations = recommendation_engine.get_portfolio_recommendations(portfolio)
 
@@ -595,7 +694,11 @@ def show_recommendations():
 
 def show_alerts():
     st.header("🔔 Sistema de Alertas")
+    alerts_panel()
 
+
+@st.fragment(run_every=FRAGMENT_REFRESH['alerts'])
+def alerts_panel():
     # Crear nueva alerta
     with st.expander("➕ Crear Nueva Alerta", expanded=True):
         col1, col2 = st.columns(2)
@@ -606,6 +709,11 @@ def show_alerts():
                 "Tipo de Alerta",
                 ["precio", "volumen", "indicador técnico"]
             )
+            metric = st.selectbox(
+                "Métrica",
+                METRICS_BY_TYPE[alert_type],
+                format_func=lambda x: ALERT_METRICS[x]
+            )
 
         with col2:
             condition = st.selectbox(
@@ -613,20 +721,45 @@ def show_alerts():
                 ["above", "below"],
                 format_func=lambda x: "Mayor que" if x == "above" else "Menor que"
             )
-            target_value = st.number_input("Valor Objetivo", min_value=0.0)
+            if metric in SIGNED_METRICS:
+                target_value = st.number_input(
+                    "Valor Objetivo", value=0.0,
+                    help="Mayor que 0: la media rápida cruza por encima de la lenta"
+                )
+            else:
+                target_value = st.number_input("Valor Objetivo", min_value=0.0)
 
         email = st.text_input("Email para Notificaciones (opcional)")
 
+        rearm = st.checkbox(
+            "Reactivar automáticamente",
+            help="Tras dispararse, la alerta vuelve a quedar pendiente cuando el valor sale de la banda"
+        )
+        hysteresis, cooldown_minutes = 0.0, 0
+        if rearm:
+            col3, col4 = st.columns(2)
+            with col3:
+                hysteresis = st.number_input(
+                    "Banda de histéresis", min_value=0.0,
+                    help="Cuánto debe alejarse el valor del objetivo (en sus mismas unidades) para rearmarse"
+                )
+            with col4:
+                cooldown_minutes = st.number_input(
+                    "Enfriamiento (minutos)", min_value=0, value=60, step=5,
+                    help="Tiempo mínimo entre dos disparos de la misma alerta"
+                )
+
         if st.button("Crear Alerta", key="create_alert_button"):
-            if symbol and target_value > 0:
-                alert_id = st.session_state.alert_manager.add_alert(
-                    symbol, alert_type, condition, target_value, email
+            if symbol and (target_value > 0 or metric in SIGNED_METRICS):
+                alert_id = services.alert_manager.add_alert(
+                    symbol, alert_type, condition, target_value, email, metric,
+                    rearm, hysteresis, int(cooldown_minutes)
                 )
                 st.success(f"¡Alerta creada! ID: {alert_id}")
 
     # Mostrar alertas existentes
     st.subheader("📋 Alertas Activas")
-    alerts = st.session_state.alert_manager.get_alerts()
+    alerts = services.alert_manager.get_alerts()
 
     if not alerts:
         st.info("No hay alertas configuradas.")
@@ -641,22 +774,116 @@ def show_alerts():
                         with st.container():
                             st.markdown(f"""
                             #### {'🔔' if not alert.triggered else '✅'} {alert.symbol}
-                            - **Tipo:** {alert.alert_type}
+                            - **Tipo:** {alert.alert_type} ({ALERT_METRICS.get(alert.metric, '-')})
                             - **Condición:** {'>' if alert.condition == 'above' else '<'} {alert.target_value}
-                            - **Estado:** {'Activada' if alert.triggered else 'Pendiente'}
+                            - **Estado:** {'Activada' if alert.triggered else 'Pendiente'}{' · se rearma' if alert.rearm else ''}
+                            - **Disparos:** {alert.trigger_count}
                             - **Creada:** {alert.created_at.strftime('%Y-%m-%d %H:%M')}
                             """)
 
-                            if not alert.triggered:
+                            if not alert.triggered or alert.rearm:
                                 # Usar key única para cada botón
                                 delete_key = f"delete_{alert.id}_{i}_{j}"
                                 if st.button("🗑️ Eliminar", key=delete_key):
-                                    st.session_state.alert_manager.remove_alert(alert.id)
-                                    st.rerun()
+                                    services.alert_manager.remove_alert(alert.id)
+                                    st.rerun(scope="fragment")
 
     # Información sobre actualizaciones
     st.markdown("---")
-    st.caption("💡 Las alertas se verifican automáticamente cada 5 minutos")
+    worker = services.alert_manager.worker_status()
+    if worker and worker['running']:
+        st.caption(
+            f"💡 Las alertas se verifican automáticamente cada {worker['interval_seconds'] / 60:g} minutos "
+            f"(última verificación hace {worker['age_seconds'] / 60:.0f} min)"
+        )
+    else:
+        st.warning(
+            "⚠️ El evaluador de alertas no está en marcha: las alertas no se verificarán "
+            "hasta que se inicie con `python -m utils.alert_worker`"
+        )
+
+
+def show_data_layer_metrics():
+    """Mostrar métricas del caché compartido y de la deduplicación de peticiones"""
+    st.header("⚡ Capa de Datos de Mercado")
+
+    cache_stats = shared_cache.stats()
+    flight_stats = single_flight.stats()
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Entradas en Caché", f"{cache_stats['entries']}/{cache_stats['max_entries']}")
+    col2.metric("Peticiones Deduplicadas", flight_stats['deduplicated'])
+    col3.metric("Peticiones al Proveedor", flight_stats['executions'])
+
+    with st.expander("Detalle por tipo y por clave"):
+        st.dataframe(pd.DataFrame.from_dict(cache_stats['by_kind'], orient='index'), use_container_width=True)
+        if flight_stats['by_key']:
+            by_key = pd.DataFrame.from_dict(
+                {str(key): values for key, values in flight_stats['by_key'].items()},
+                orient='index'
+            )
+            st.dataframe(by_key.sort_values('deduplicated', ascending=False), use_container_width=True)
+
+    with st.expander("Limitación por proveedor"):
+        provider_stats = pd.DataFrame.from_dict(scheduler.stats(), orient='index')
+        st.dataframe(provider_stats.drop(columns=['queue_by_priority']), use_container_width=True)
+
+    snapshot_stats = Portfolio.snapshot_stats
+    st.caption(
+        f"Valoraciones de cartera reutilizadas: {snapshot_stats['hits']} · "
+        f"recalculadas: {snapshot_stats['misses']}"
+    )
+
+    with st.expander("Enrutado de cotizaciones"):
+        st.dataframe(pd.DataFrame.from_dict(quote_router.stats(), orient='index'), use_container_width=True)
+
+    with st.expander("Arranque de la sesión"):
+        startup = services.startup_report()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**Primera ejecución (primer pintado)**")
+            st.dataframe(pd.DataFrame(startup['first_run']), use_container_width=True)
+        with col2:
+            st.markdown("**Última ejecución**")
+            st.dataframe(pd.DataFrame(startup['last_run']), use_container_width=True)
+        st.markdown("**Servicios**")
+        st.dataframe(pd.DataFrame(startup['services']), use_container_width=True)
+
+    with st.expander("Tiempos de importación"):
+        st.caption("'arranque' se carga antes del primer pintado; 'diferida', al abrir una página")
+        st.dataframe(pd.DataFrame(import_profiler.by_package()), use_container_width=True)
+        st.dataframe(pd.DataFrame(import_profiler.report()), use_container_width=True)
+
+    with st.expander("Caché de respuestas de IA"):
+        llm_stats = llm_cache.stats()
+        hits = sum(values['hits'] for values in llm_stats.values())
+        lookups = hits + sum(values['misses'] for values in llm_stats.values())
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Tasa de aciertos", f"{hits / lookups:.0%}" if lookups else "-")
+        col2.metric("Coste ahorrado", f"${sum(v['cost_saved_usd'] for v in llm_stats.values()):.2f}")
+        col3.metric("Tiempo ahorrado", f"{sum(v['time_saved_ms'] for v in llm_stats.values()) / 1000:.0f} s")
+        if llm_stats:
+            st.dataframe(pd.DataFrame.from_dict(llm_stats, orient='index'), use_container_width=True)
+        latency_stats = llm_cache.latency_stats()
+        if latency_stats:
+            st.caption("Tiempo hasta el primer fragmento frente a la respuesta completa")
+            st.dataframe(pd.DataFrame.from_dict(latency_stats, orient='index'), use_container_width=True)
+        try:
+            st.caption("Entradas guardadas (todos los procesos)")
+            st.dataframe(pd.DataFrame.from_dict(llm_cache.storage_stats(), orient='index'),
+                         use_container_width=True)
+        except Exception as e:
+            st.caption(f"No se pudo leer el caché: {str(e)}")
+
+    with st.expander("Conexiones a la base de datos"):
+        pool_stats = db_pool.stats()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("En uso", f"{pool_stats['in_use']}/{pool_stats['max_size']}")
+        col2.metric("Espera p95", f"{pool_stats['p95_wait_ms']:.1f} ms")
+        col3.metric("Préstamos sin devolver a tiempo", pool_stats['leaks'])
+        if pool_stats['suspected_leaks']:
+            st.dataframe(pd.DataFrame(pool_stats['suspected_leaks']), use_container_width=True)
+        st.json({k: v for k, v in pool_stats.items() if k != 'suspected_leaks'})
 
 
 def show_progress():
@@ -682,7 +909,7 @@ def show_risk_profile():
 
 
 def show_membership(): # New function for membership page
-    st.session_state.monetization_manager.render_membership_ui()
+    services.monetization_manager.render_membership_ui()
 
 
 def custom_css():
@@ -773,4 +1000,10 @@ def custom_css():
 custom_css()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+        services.mark('render')
+    finally:
+        services.end_run()
+        # Lo que se importe a partir de ahora se carga bajo demanda desde una página
+        import_profiler.set_phase('diferida')
\ No newline at end of file
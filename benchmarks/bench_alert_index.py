@@ -0,0 +1,72 @@
+"""Comparación del recorrido lineal de alertas con AlertIndex
+
+Uso: python -m benchmarks.bench_alert_index [--sizes 1000 100000 1000000] [--symbols 2000]
+"""
+import argparse
+import random
+import time
+from utils.alert_index import AlertIndex, ABOVE, BELOW
+
+def make_alerts(size: int, symbols: int, seed: int = 7):
+    rng = random.Random(seed)
+    names = [f"SYM{i}" for i in range(symbols)]
+    return [
+        (alert_id, rng.choice(names), rng.choice((ABOVE, BELOW)), rng.uniform(50, 150))
+        for alert_id in range(1, size + 1)
+    ], names
+
+def linear_match(alerts, symbol: str, value: float):
+    """Recorrido de todas las alertas comparando cada umbral, para un solo precio"""
+    triggered = []
+    for alert_id, alert_symbol, condition, threshold in alerts:
+        if alert_symbol != symbol:
+            continue
+        if condition == ABOVE and value > threshold:
+            triggered.append(alert_id)
+        elif condition == BELOW and value < threshold:
+            triggered.append(alert_id)
+    return triggered
+
+def run(size: int, symbols: int, ticks: int):
+    alerts, names = make_alerts(size, symbols)
+    rng = random.Random(size)
+    quotes = [(rng.choice(names), rng.uniform(50, 150)) for _ in range(ticks)]
+
+    started = time.perf_counter()
+    index = AlertIndex.build(alerts)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    # El recorrido lineal es O(n) por cotización: con muchas alertas basta con pocas
+    linear_ticks = max(1, min(ticks, 2_000_000 // size))
+    started = time.perf_counter()
+    expected = [linear_match(alerts, symbol, value) for symbol, value in quotes[:linear_ticks]]
+    linear_us = (time.perf_counter() - started) / linear_ticks * 1e6
+
+    started = time.perf_counter()
+    for symbol, value in quotes:
+        index.match(symbol, value)
+    index_us = (time.perf_counter() - started) / ticks * 1e6
+
+    for (symbol, value), ids in zip(quotes, expected):
+        assert sorted(index.match(symbol, value)) == sorted(ids)
+
+    return {
+        'alerts': size,
+        'build_ms': round(build_ms, 1),
+        'linear_us_per_tick': round(linear_us, 1),
+        'index_us_per_tick': round(index_us, 2),
+        'speedup': round(linear_us / index_us, 1) if index_us else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de AlertIndex frente al recorrido lineal")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--symbols', type=int, default=2_000)
+    parser.add_argument('--ticks', type=int, default=10_000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(run(size, args.symbols, args.ticks))
+
+if __name__ == "__main__":
+    main()
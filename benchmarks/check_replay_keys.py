@@ -0,0 +1,54 @@
+"""Comprobación de que las descargas de históricos se graban con la misma clave cada día
+
+Simula las sincronizaciones de HistoryStore en dos días seguidos con el grabador en
+modo record sobre un directorio temporal y yfinance sustituido por una descarga vacía:
+si los argumentos dependieran de la fecha, cada día dejaría una grabación distinta.
+
+Uso: python -m benchmarks.check_replay_keys
+"""
+import os
+import tempfile
+from datetime import date, timedelta
+import pandas as pd
+from utils import data_sources, replay
+from utils.history_store import HistoryStore
+
+class _EmptyYFinance:
+    @staticmethod
+    def download(**kwargs) -> pd.DataFrame:
+        return pd.DataFrame()
+
+def recordings(directory: str) -> int:
+    return sum(len(files) for _, _, files in os.walk(directory))
+
+def check(day: date) -> dict:
+    store = HistoryStore(cache=None)
+    symbols = ['AAPL', 'MSFT']
+    cases = {
+        # Primera sincronización: un año completo
+        'first_sync': lambda today: today - timedelta(days=365),
+        # Sincronizaciones siguientes: desde el último día guardado (ayer)
+        'incremental_sync': lambda today: today - timedelta(days=1)
+    }
+    results = {}
+    for name, start_for in cases.items():
+        with tempfile.TemporaryDirectory() as directory:
+            replay.recorder = replay.DataRecorder(mode='record', directory=directory)
+            for today in (day, day + timedelta(days=1)):
+                store._download(symbols, start_for(today), today=today)
+            results[name] = recordings(directory)
+    return results
+
+def main():
+    original_yf, original_recorder = data_sources._yf, replay.recorder
+    data_sources._yf = lambda priority=None: _EmptyYFinance
+    try:
+        results = check(date.today())
+    finally:
+        data_sources._yf, replay.recorder = original_yf, original_recorder
+    print(results)
+    for name, count in results.items():
+        assert count == 1, f"{name}: {count} grabaciones para dos días, se esperaba 1"
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,57 @@
 import os
+import time
+from typing import Dict, Iterator, Optional
 from openai import OpenAI
 from .market_data import MarketData
 from .news import NewsService
+from .replay import recorder
+from .llm_cache import llm_cache, complete_chat, stream_chat
 import streamlit as st
 
 class AIAdvisor:
     def __init__(self):
         self.model = "gpt-3.5-turbo"  # Cambiado a gpt-3.5-turbo
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY") or ("offline" if recorder.offline else None))
         self.market_data = MarketData()
         self.news_service = NewsService()
 
+    def _params(self) -> Dict:
+        # Parámetros de la petición sin los mensajes: con la pregunta forman la clave del caché
+        return dict(model=self.model)
+
+    def _create(self, question: str):
+        # La respuesta se identifica por modelo y pregunta: el contexto incluye la hora actual.
+        # El contexto de mercado se prepara aquí, solo cuando el caché no tiene la respuesta.
+        def create():
+            request = self._advice_request(question)
+            return recorder.call(
+                'openai.advice', [request['model'], question],
+                lambda: complete_chat(self.client, request)
+            )
+        return create
+
+    def _cache_context(self, question: str) -> str:
+        # El caché reutiliza la respuesta dentro del tramo de tiempo de 'advice'
+        return ' '.join(question.lower().split())
+
+    def _complete(self, question: str) -> str:
+        """Llamar a OpenAI a través del caché y del grabador y devolver el texto generado"""
+        return llm_cache.get_or_create(
+            'advice', self._params(), self._create(question),
+            context=self._cache_context(question)
+        )
+
+    def _stream(self, question: str, started: float, timing: Optional[Dict]) -> Iterator[str]:
+        """Como _complete, pero devolviendo los fragmentos según los genera el modelo"""
+        # El grabador guarda respuestas completas: al grabar o reproducir no se transmite
+        stream_create = None if recorder.mode != 'live' else (
+            lambda usage: stream_chat(self.client, self._advice_request(question), usage)
+        )
+        return llm_cache.stream(
+            'advice', self._params(), self._create(question), stream_create,
+            context=self._cache_context(question), started=started, timing=timing
+        )
+
     def get_market_context(self):
         """Obtener contexto del mercado en tiempo real"""
         try:
@@ -35,55 +76,67 @@ class AIAdvisor:
     def get_advice(self, question: str) -> str:
         """Obtener asesoramiento financiero usando AI"""
         try:
-            market_context = self.get_market_context()
-            
-            # Si la pregunta menciona un símbolo específico, obtener su cotización
-            common_tickers = {
-                "nvidia": "NVDA",
-                "apple": "AAPL",
-                "microsoft": "MSFT",
-                "amazon": "AMZN",
-                "google": "GOOGL",
-                "meta": "META",
-                "tesla": "TSLA"
-            }
-            
-            stock_data = ""
-            for company, ticker in common_tickers.items():
-                if company.lower() in question.lower():
-                    try:
-                        quote = self.market_data.get_real_time_quote(ticker)
-                        stock_data = f"\nCotización actual de {company.title()} ({ticker}): {quote}\n"
-                        break
-                    except:
-                        pass
-            
-            market_context = f"{market_context}\n{stock_data}" if stock_data else market_context
-
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """Eres un asesor financiero profesional que responde en español.
-                        Proporciona consejos claros, concisos y precisos basados en:
-                        1. La pregunta del usuario
-                        2. El contexto actual del mercado
-                        3. Las últimas noticias relevantes y su sentimiento
-
-                        Incluye advertencias cuando sea apropiado.
-                        Mantén un tono profesional pero accesible."""
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Contexto del mercado:
-                        {market_context}
-
-                        Pregunta del usuario:
-                        {question}"""
-                    }
-                ]
-            )
-            return response.choices[0].message.content
+            return self._complete(question)
         except Exception as e:
-            return f"Error al obtener asesoramiento: {str(e)}"
\ No newline at end of file
+            return f"Error al obtener asesoramiento: {str(e)}"
+
+    def stream_advice(self, question: str, timing: Optional[Dict] = None) -> Iterator[str]:
+        """Como get_advice, pero entregando la respuesta por fragmentos (para st.write_stream)
+
+        timing recibe ttft_ms (desde la llamada; si no hay respuesta en caché incluye
+        preparar el contexto de mercado), total_ms y cached.
+        """
+        started = time.perf_counter()
+        yield from self._stream(question, started, timing)
+
+    def _advice_request(self, question: str) -> Dict:
+        """Petición a OpenAI con la pregunta y el contexto de mercado actual"""
+        market_context = self.get_market_context()
+        
+        # Si la pregunta menciona un símbolo específico, obtener su cotización
+        common_tickers = {
+            "nvidia": "NVDA",
+            "apple": "AAPL",
+            "microsoft": "MSFT",
+            "amazon": "AMZN",
+            "google": "GOOGL",
+            "meta": "META",
+            "tesla": "TSLA"
+        }
+        
+        stock_data = ""
+        for company, ticker in common_tickers.items():
+            if company.lower() in question.lower():
+                try:
+                    quote = self.market_data.get_real_time_quote(ticker)
+                    stock_data = f"\nCotización actual de {company.title()} ({ticker}): {quote}\n"
+                    break
+                except:
+                    pass
+        
+        market_context = f"{market_context}\n{stock_data}" if stock_data else market_context
+
+        return dict(
+            self._params(),
+            messages=[
+                {
+                    "role": "system",
+                    "content": """Eres un asesor financiero profesional que responde en español.
+                    Proporciona consejos claros, concisos y precisos basados en:
+                    1. La pregunta del usuario
+                    2. El contexto actual del mercado
+                    3. Las últimas noticias relevantes y su sentimiento
+
+                    Incluye advertencias cuando sea apropiado.
+                    Mantén un tono profesional pero accesible."""
+                },
+                {
+                    "role": "user",
+                    "content": f"""Contexto del mercado:
+                    {market_context}
+
+                    Pregunta del usuario:
+                    {question}"""
+                }
+            ]
+        )
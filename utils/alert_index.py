@@ -0,0 +1,111 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Tuple
+
+ABOVE = 'above'
+BELOW = 'below'
+
+class _SymbolBook:
+    """Umbrales ordenados de un símbolo, con los ids de alerta en listas paralelas"""
+
+    __slots__ = ('above_thresholds', 'above_ids', 'below_thresholds', 'below_ids')
+
+    def __init__(self):
+        self.above_thresholds: List[float] = []
+        self.above_ids: List[int] = []
+        self.below_thresholds: List[float] = []
+        self.below_ids: List[int] = []
+
+    def side(self, condition: str) -> Tuple[List[float], List[int]]:
+        if condition == ABOVE:
+            return self.above_thresholds, self.above_ids
+        return self.below_thresholds, self.below_ids
+
+    def __len__(self) -> int:
+        return len(self.above_ids) + len(self.below_ids)
+
+class AlertIndex:
+    """Índice de alertas por símbolo para buscar las que se cumplen con bisect
+
+    Una alerta 'above' se cumple cuando el valor supera su umbral y una 'below' cuando
+    queda por debajo. Con los umbrales ordenados, las alertas cumplidas son siempre un
+    prefijo (above) o un sufijo (below) de la lista: O(log n + k) por cotización.
+    """
+
+    def __init__(self):
+        self._books: Dict[str, _SymbolBook] = {}
+        # id -> (símbolo, condición, umbral), para poder borrar sin recorrer el índice
+        self._alerts: Dict[int, Tuple[str, str, float]] = {}
+
+    @classmethod
+    def build(cls, alerts: Iterable[Tuple[int, str, str, float]]) -> 'AlertIndex':
+        """Construir el índice de una vez ordenando cada lista, en vez de insertar una a una"""
+        index = cls()
+        grouped: Dict[Tuple[str, str], List[Tuple[float, int]]] = {}
+        for alert_id, symbol, condition, threshold in alerts:
+            if condition not in (ABOVE, BELOW) or alert_id in index._alerts:
+                continue
+            symbol = symbol.upper()
+            threshold = float(threshold)
+            index._alerts[alert_id] = (symbol, condition, threshold)
+            grouped.setdefault((symbol, condition), []).append((threshold, alert_id))
+
+        for (symbol, condition), entries in grouped.items():
+            entries.sort()
+            thresholds, ids = index._books.setdefault(symbol, _SymbolBook()).side(condition)
+            thresholds.extend(threshold for threshold, _ in entries)
+            ids.extend(alert_id for _, alert_id in entries)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    def __contains__(self, alert_id: int) -> bool:
+        return alert_id in self._alerts
+
+    def symbols(self) -> List[str]:
+        return list(self._books)
+
+    def add(self, alert_id: int, symbol: str, condition: str, threshold: float):
+        """Insertar una alerta manteniendo el orden de su lista"""
+        if condition not in (ABOVE, BELOW):
+            raise ValueError(f"Condición de alerta no válida: {condition}")
+        if alert_id in self._alerts:
+            self.remove(alert_id)
+        symbol = symbol.upper()
+        threshold = float(threshold)
+        thresholds, ids = self._books.setdefault(symbol, _SymbolBook()).side(condition)
+        position = bisect_right(thresholds, threshold)
+        thresholds.insert(position, threshold)
+        ids.insert(position, alert_id)
+        self._alerts[alert_id] = (symbol, condition, threshold)
+
+    def remove(self, alert_id: int) -> bool:
+        """Quitar una alerta; devuelve False si no estaba en el índice"""
+        entry = self._alerts.pop(alert_id, None)
+        if entry is None:
+            return False
+        symbol, condition, threshold = entry
+        book = self._books[symbol]
+        thresholds, ids = book.side(condition)
+        # Entre los umbrales iguales se busca el id concreto
+        position = bisect_left(thresholds, threshold)
+        while ids[position] != alert_id:
+            position += 1
+        del thresholds[position]
+        del ids[position]
+        if not len(book):
+            del self._books[symbol]
+        return True
+
+    def match(self, symbol: str, value: float) -> List[int]:
+        """Ids de las alertas del símbolo que se cumplen con el valor dado"""
+        book = self._books.get(symbol.upper())
+        if book is None:
+            return []
+        above = bisect_left(book.above_thresholds, value)
+        below = bisect_right(book.below_thresholds, value)
+        return book.above_ids[:above] + book.below_ids[below:]
+
+    def threshold(self, alert_id: int) -> Tuple[str, str, float]:
+        """Símbolo, condición y umbral de una alerta indexada"""
+        return self._alerts[alert_id]
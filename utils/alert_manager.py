@@ -1,77 +1,139 @@
 import streamlit as st
 from datetime import datetime
+from textwrap import dedent
 from typing import Dict, List, Optional
+from .db import connection
+from .indicators import ALERT_METRICS, resolve_metric
+
+ALERT_COLUMNS = ("id, symbol, alert_type, condition, target_value, user_email, created_at, triggered, "
+                 "last_check, metric, rearm, hysteresis, cooldown_minutes, trigger_count")
 
 class Alert:
-    def __init__(self, symbol: str, alert_type: str, condition: str, 
-                 target_value: float, user_email: Optional[str] = None):
-        self.id = datetime.now().strftime("%Y%m%d%H%M%S")
+    def __init__(self, symbol: str, alert_type: str, condition: str,
+                 target_value: float, user_email: Optional[str] = None,
+                 metric: Optional[str] = None, rearm: bool = False,
+                 hysteresis: float = 0.0, cooldown_minutes: int = 0):
+        self.id = None
         self.symbol = symbol.upper()
-        self.alert_type = alert_type  # 'price', 'volume', 'technical'
+        self.alert_type = alert_type  # 'precio', 'volumen', 'indicador técnico'
         self.condition = condition    # 'above', 'below'
+        self.metric = resolve_metric(alert_type, metric)  # clave de ALERT_METRICS
         self.target_value = target_value
         self.user_email = user_email
         self.created_at = datetime.now()
         self.triggered = False
         self.last_check = None
+        # Rearme: tras dispararse vuelve a quedar pendiente cuando el valor sale de la
+        # banda de histéresis (en unidades de la métrica) y ha pasado el enfriamiento
+        self.rearm = rearm
+        self.hysteresis = hysteresis
+        self.cooldown_minutes = cooldown_minutes
+        self.trigger_count = 0
+
+    @classmethod
+    def from_row(cls, row: tuple) -> 'Alert':
+        """Construir una alerta a partir de una fila con las columnas de ALERT_COLUMNS"""
+        (alert_id, symbol, alert_type, condition, target_value, user_email, created_at, triggered,
+         last_check, metric, rearm, hysteresis, cooldown_minutes, trigger_count) = row
+        alert = cls(symbol, alert_type, condition, target_value, user_email, metric,
+                    rearm, hysteresis, cooldown_minutes)
+        alert.trigger_count = trigger_count
+        alert.id = alert_id
+        alert.created_at = created_at
+        alert.triggered = triggered
+        alert.last_check = last_check
+        return alert
 
 class AlertManager:
-    def __init__(self):
-        if 'alerts' not in st.session_state:
-            st.session_state.alerts = {}
+    """Alertas del usuario de la sesión, guardadas en Postgres
+
+    La evaluación la hace el proceso utils.alert_worker; aquí solo se crean,
+    listan y eliminan.
+    """
+
+    def _user_id(self) -> Optional[int]:
+        user = st.session_state.get('user')
+        return user['id'] if user else None
 
-    def add_alert(self, symbol: str, alert_type: str, condition: str, 
-                  target_value: float, user_email: Optional[str] = None) -> str:
+    def add_alert(self, symbol: str, alert_type: str, condition: str,
+                  target_value: float, user_email: Optional[str] = None,
+                  metric: Optional[str] = None, rearm: bool = False,
+                  hysteresis: float = 0.0, cooldown_minutes: int = 0) -> int:
         """Añadir una nueva alerta"""
-        alert = Alert(symbol, alert_type, condition, target_value, user_email)
-        st.session_state.alerts[alert.id] = alert
+        alert = Alert(symbol, alert_type, condition, target_value, user_email, metric,
+                      rearm, hysteresis, cooldown_minutes)
+        if alert.metric is None:
+            raise ValueError(f"Métrica no válida para una alerta de {alert_type}: {metric}")
+        if hysteresis < 0 or cooldown_minutes < 0:
+            raise ValueError("La banda de histéresis y el enfriamiento no pueden ser negativos")
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO alerts (user_id, symbol, alert_type, condition, target_value, user_email,
+                                    metric, rearm, hysteresis, cooldown_minutes)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (self._user_id(), alert.symbol, alert.alert_type, alert.condition,
+                  alert.target_value, alert.user_email or None, alert.metric,
+                  alert.rearm, alert.hysteresis, alert.cooldown_minutes))
+            alert.id = cur.fetchone()[0]
+            conn.commit()
         return alert.id
 
-    def remove_alert(self, alert_id: str) -> bool:
+    def remove_alert(self, alert_id: int) -> bool:
         """Eliminar una alerta existente"""
-        if alert_id in st.session_state.alerts:
-            del st.session_state.alerts[alert_id]
-            return True
-        return False
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM alerts WHERE id = %s AND user_id = %s",
+                (alert_id, self._user_id())
+            )
+            removed = cur.rowcount > 0
+            conn.commit()
+        return removed
 
     def get_alerts(self, symbol: Optional[str] = None) -> List[Alert]:
         """Obtener todas las alertas o filtrar por símbolo"""
-        alerts = st.session_state.alerts.values()
+        query = f"SELECT {ALERT_COLUMNS} FROM alerts WHERE user_id = %s AND active"
+        params = [self._user_id()]
         if symbol:
-            alerts = [a for a in alerts if a.symbol == symbol.upper()]
-        return list(alerts)
-
-    def check_alerts(self, market_data: Dict[str, float]) -> List[Alert]:
-        """Verificar si alguna alerta debe activarse"""
-        triggered_alerts = []
-        
-        for alert in st.session_state.alerts.values():
-            if alert.triggered:
-                continue
-                
-            current_value = market_data.get(alert.symbol)
-            if current_value is None:
-                continue
-
-            alert.last_check = datetime.now()
-            
-            if alert.condition == 'above' and current_value > alert.target_value:
-                alert.triggered = True
-                triggered_alerts.append(alert)
-            elif alert.condition == 'below' and current_value < alert.target_value:
-                alert.triggered = True
-                triggered_alerts.append(alert)
-
-        return triggered_alerts
-
-    def format_alert_message(self, alert: Alert) -> str:
-        """Formatear mensaje de alerta para notificación"""
+            query += " AND symbol = %s"
+            params.append(symbol.upper())
+        query += " ORDER BY created_at"
+
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            return [Alert.from_row(row) for row in cur.fetchall()]
+
+    def worker_status(self) -> Optional[Dict]:
+        """Último latido del evaluador de alertas: segundos desde él e intervalo entre ciclos
+
+        None si el evaluador no ha funcionado nunca contra esta base de datos.
+        """
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT EXTRACT(EPOCH FROM (NOW() - last_seen)), interval_seconds
+                FROM worker_heartbeats
+                WHERE name = 'alert_worker'
+            """)
+            row = cur.fetchone()
+        if row is None:
+            return None
+        age, interval = float(row[0]), float(row[1])
+        # Se da por parado si se ha saltado más de un ciclo (con margen para ciclos lentos)
+        return {'age_seconds': age, 'interval_seconds': interval, 'running': age <= 2 * interval + 60}
+
+    def format_alert_message(self, alert: Alert, observed_value: Optional[float] = None) -> str:
+        """Formatear mensaje de alerta para notificación
+
+        observed_value es el valor de la métrica que ha activado la alerta, si se conoce.
+        """
         condition_text = "superado" if alert.condition == "above" else "caído por debajo de"
-        return f"""
+        metric_text = ALERT_METRICS.get(alert.metric, alert.alert_type)
+        observed_text = f" (valor observado: {observed_value:,.2f})" if observed_value is not None else ""
+        return dedent(f"""
         🔔 Alerta de {alert.symbol}
-        
-        El {alert.alert_type} ha {condition_text} {alert.target_value}
-        
+
+        {metric_text} ha {condition_text} {alert.target_value:g}{observed_text}
+
         Configurado el: {alert.created_at.strftime("%Y-%m-%d %H:%M")}
         Activado el: {datetime.now().strftime("%Y-%m-%d %H:%M")}
-        """
+        """).strip()
@@ -0,0 +1,392 @@
+"""Evaluador de alertas fuera del proceso de Streamlit
+
+Uso: python -m utils.alert_worker [--interval 300] [--once]
+"""
+import argparse
+import heapq
+import time
+import pandas as pd
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from psycopg2.extras import execute_values
+from .db import connection
+from .migrations import run_migrations
+from .quote_engine import QuoteEngine
+from .rate_limiter import BACKGROUND
+from .alert_index import ABOVE, BELOW, AlertIndex
+from .history_store import get_history_store
+from .indicators import IndicatorBook, resolve_metric
+from .alert_manager import ALERT_COLUMNS, Alert, AlertManager
+from .notifications import enqueue_many, start_outbox_sender
+
+# Evita que dos evaluadores procesen el mismo ciclo a la vez
+WORKER_LOCK_KEY = 0x414C5254
+
+# Nombre con el que el evaluador deja su latido en worker_heartbeats
+HEARTBEAT_NAME = 'alert_worker'
+
+# Los avisos de alertas de un mismo usuario se agrupan en un resumen
+ALERT_DIGEST_KEY = 'alerts'
+
+# Sesiones de histórico con las que se siembran los indicadores de un símbolo nuevo
+INDICATOR_SEED_DAYS = 120
+
+class RearmRule(NamedTuple):
+    """Lo mínimo para mover una alerta rearmable entre el índice de disparo y el de rearme"""
+    metric: str
+    symbol: str
+    condition: str
+    target: float
+    band: float
+    cooldown: float  # segundos
+
+    def rearm_side(self) -> Tuple[str, float]:
+        """Condición y umbral opuestos: la alerta se rearma al salir de la banda de histéresis"""
+        if self.condition == ABOVE:
+            return BELOW, self.target - self.band
+        return ABOVE, self.target + self.band
+
+class AlertWorker:
+    """Evalúa las alertas pendientes contra índices de umbrales que viven entre ciclos
+
+    Hay un AlertIndex por métrica (precio, volumen, RSI...). Cada ciclo solo lee las
+    alertas nuevas (id mayor que el último visto); los índices se reconstruyen enteros
+    cada rebuild_every ciclos para soltar las alertas borradas. Una alerta borrada que
+    siga en un índice no genera evento: la actualización final solo afecta a filas que
+    siguen pendientes. Las métricas distintas del precio salen de un IndicatorBook que
+    se actualiza solo con las barras nuevas de cada símbolo.
+
+    Una alerta rearmable, al dispararse, pasa a rearm_indexes con la condición opuesta
+    y el umbral desplazado por su banda de histéresis: un valor que oscila sobre el
+    objetivo no vuelve a dispararla. Al salir de la banda se rearma, y si aún no ha
+    pasado su enfriamiento espera en un montículo fuera de los índices.
+    """
+
+    def __init__(self, quote_engine: Optional[QuoteEngine] = None, interval: float = 300.0,
+                 rebuild_every: int = 12, history_store=None):
+        self.quote_engine = quote_engine or QuoteEngine(batch_size=200)
+        self.history_store = history_store or get_history_store()
+        self.interval = interval
+        self.rebuild_every = rebuild_every
+        self.indexes: Dict[str, AlertIndex] = {}
+        self.rearm_indexes: Dict[str, AlertIndex] = {}
+        self.rules: Dict[int, RearmRule] = {}
+        self.indicators = IndicatorBook()
+        # Alertas disparadas: momento (monotonic) en que termina su enfriamiento
+        self._ready_at: Dict[int, float] = {}
+        # Alertas rearmadas que aún se están enfriando: (momento, id)
+        self._cooling: List[Tuple[float, int]] = []
+        self._last_id = 0
+        self._cycles_since_rebuild = None
+
+    def _pending_rows(self, conn, after_id: int = 0) -> List[tuple]:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, symbol, alert_type, metric, condition, target_value, triggered,
+                       rearm, hysteresis, cooldown_minutes,
+                       GREATEST(0, EXTRACT(EPOCH FROM (
+                           CASE WHEN triggered
+                                THEN COALESCE(triggered_at, NOW()) + make_interval(mins => cooldown_minutes)
+                                ELSE COALESCE(armed_at, NOW())
+                           END - NOW()
+                       ))) AS wait
+                FROM alerts
+                WHERE active AND (NOT triggered OR rearm) AND id > %s
+                ORDER BY id
+            """, (after_id,))
+            return cur.fetchall()
+
+    def sync_index(self, conn) -> int:
+        """Poner los índices al día; devuelve cuántas alertas se han cargado"""
+        rebuild = self._cycles_since_rebuild is None or self._cycles_since_rebuild >= self.rebuild_every
+        rows = self._pending_rows(conn, 0 if rebuild else self._last_id)
+        now = time.monotonic()
+        if rebuild:
+            self.rules, self._ready_at, self._cooling = {}, {}, []
+
+        armed: Dict[str, List[tuple]] = {}
+        disarmed: Dict[str, List[tuple]] = {}
+        for (alert_id, symbol, alert_type, metric, condition, target_value, triggered,
+             rearm, hysteresis, cooldown_minutes, wait) in rows:
+            metric = resolve_metric(alert_type, metric)
+            if metric is None or condition not in (ABOVE, BELOW):
+                continue
+            if rearm:
+                rule = self.rules[alert_id] = RearmRule(
+                    metric, symbol.upper(), condition, float(target_value),
+                    float(hysteresis or 0), (cooldown_minutes or 0) * 60.0
+                )
+            if triggered:
+                side, threshold = rule.rearm_side()
+                disarmed.setdefault(metric, []).append((alert_id, symbol, side, threshold))
+                self._ready_at[alert_id] = now + float(wait)
+            elif rearm and wait > 0:
+                heapq.heappush(self._cooling, (now + float(wait), alert_id))
+            else:
+                armed.setdefault(metric, []).append((alert_id, symbol, condition, target_value))
+
+        if rebuild:
+            self.indexes = {metric: AlertIndex.build(alerts) for metric, alerts in armed.items()}
+            self.rearm_indexes = {metric: AlertIndex.build(alerts) for metric, alerts in disarmed.items()}
+            self._cycles_since_rebuild = 0
+        else:
+            for target, grouped in ((self.indexes, armed), (self.rearm_indexes, disarmed)):
+                for metric, alerts in grouped.items():
+                    index = target.setdefault(metric, AlertIndex())
+                    for alert in alerts:
+                        index.add(*alert)
+            self._cycles_since_rebuild += 1
+        if rows:
+            self._last_id = max(self._last_id, rows[-1][0])
+        return len(rows)
+
+    def release_cooled(self) -> int:
+        """Devolver al índice de disparo las alertas rearmadas cuyo enfriamiento ha terminado"""
+        now = time.monotonic()
+        released = 0
+        while self._cooling and self._cooling[0][0] <= now:
+            _, alert_id = heapq.heappop(self._cooling)
+            rule = self.rules.get(alert_id)
+            if rule is not None:
+                self.indexes.setdefault(rule.metric, AlertIndex()).add(
+                    alert_id, rule.symbol, rule.condition, rule.target
+                )
+                released += 1
+        return released
+
+    def pending_count(self) -> int:
+        return sum(len(index) for index in self.indexes.values())
+
+    def watched_count(self) -> int:
+        """Alertas en algún índice (pendientes de disparo o de rearme)"""
+        return self.pending_count() + sum(len(index) for index in self.rearm_indexes.values())
+
+    def watched_symbols(self, price: bool) -> List[str]:
+        """Símbolos con alertas de precio (price=True) o de otras métricas en algún índice"""
+        return list(dict.fromkeys(
+            symbol
+            for indexes in (self.indexes, self.rearm_indexes)
+            for metric, index in indexes.items() if (metric == 'price') == price
+            for symbol in index.symbols()
+        ))
+
+    def update_indicators(self, symbols: List[str]) -> int:
+        """Pasar al IndicatorBook las barras posteriores a la última que tiene cada símbolo"""
+        if not symbols:
+            return 0
+        today = date.today()
+        known = [self.indicators.last_date(symbol) for symbol in symbols if symbol in self.indicators]
+        new = [symbol for symbol in symbols if symbol not in self.indicators]
+
+        bars = []
+        if new:
+            bars += self.history_store.get_bars(new, today - timedelta(days=INDICATOR_SEED_DAYS))
+        if known:
+            # La barra abierta se vuelve a pedir porque su cierre puede haber cambiado
+            bars += self.history_store.get_bars(
+                [symbol for symbol in symbols if symbol in self.indicators], min(known)
+            )
+        bars.sort(key=lambda bar: bar[1])
+        return self.indicators.update_many(bars)
+
+    def _scan(self, indexes: Dict[str, AlertIndex], prices: pd.Series) -> Dict[int, float]:
+        """Alertas cumplidas de los índices, sin retirarlas: {id de alerta: valor observado}"""
+        hits = {}
+        for metric, index in indexes.items():
+            for symbol in index.symbols():
+                if metric == 'price':
+                    value = prices.get(symbol)
+                else:
+                    value = self.indicators.metrics(symbol).get(metric)
+                if value is None:
+                    continue
+                for alert_id in index.match(symbol, float(value)):
+                    hits[alert_id] = float(value)
+        return hits
+
+    @staticmethod
+    def _retire(indexes: Dict[str, AlertIndex], alert_ids) -> int:
+        """Quitar de los índices unas alertas; se llama cuando su cambio ya está guardado"""
+        removed = 0
+        for alert_id in alert_ids:
+            for index in indexes.values():
+                if index.remove(alert_id):
+                    removed += 1
+                    break
+        return removed
+
+    def evaluate(self, prices: pd.Series) -> Dict[int, float]:
+        """Alertas del índice de disparo que se cumplen con los valores actuales"""
+        return self._scan(self.indexes, prices)
+
+    def apply_triggers(self, triggered: Dict[int, float]):
+        """Con el disparo ya guardado, retirar las alertas y pasar las rearmables al índice de rearme"""
+        self._retire(self.indexes, triggered)
+        now = time.monotonic()
+        for alert_id in triggered:
+            rule = self.rules.get(alert_id)
+            if rule is None:
+                continue
+            side, threshold = rule.rearm_side()
+            self.rearm_indexes.setdefault(rule.metric, AlertIndex()).add(
+                alert_id, rule.symbol, side, threshold
+            )
+            self._ready_at[alert_id] = now + rule.cooldown
+
+    def rearm(self, prices: pd.Series) -> Dict[int, float]:
+        """Alertas que han salido de su banda: {id: segundos de enfriamiento restantes}"""
+        now = time.monotonic()
+        return {
+            alert_id: max(0.0, self._ready_at.get(alert_id, now) - now)
+            for alert_id in self._scan(self.rearm_indexes, prices)
+        }
+
+    def apply_rearms(self, rearmed: Dict[int, float]):
+        """Con el rearme ya guardado, mover las alertas al montículo de enfriamiento"""
+        self._retire(self.rearm_indexes, rearmed)
+        now = time.monotonic()
+        for alert_id in rearmed:
+            heapq.heappush(self._cooling, (self._ready_at.pop(alert_id, now), alert_id))
+        self.release_cooled()
+
+    def record_rearms(self, conn, rearmed: Dict[int, float]) -> int:
+        """Guardar el rearme; armed_at indica desde cuándo puede volver a dispararse"""
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                UPDATE alerts a
+                SET triggered = false, armed_at = NOW() + make_interval(secs => v.wait), last_check = NOW()
+                FROM (VALUES %s) AS v(id, wait)
+                WHERE a.id = v.id AND a.active AND a.triggered AND a.rearm
+            """, list(rearmed.items()), template="(%s::integer, %s::float)")
+            updated = cur.rowcount
+        conn.commit()
+        return updated
+
+    def record_triggers(self, conn, triggered: Dict[int, float]) -> int:
+        """Marcar las alertas como activadas, guardar sus eventos y encolar los avisos
+
+        Todo va en la misma transacción: si falla, ni la alerta queda activada ni
+        el aviso se envía.
+        """
+        with conn.cursor() as cur:
+            fired = execute_values(cur, f"""
+                WITH fired AS (
+                    UPDATE alerts a
+                    SET triggered = true, triggered_at = NOW(), last_check = NOW(),
+                        armed_at = NULL, trigger_count = a.trigger_count + 1
+                    FROM (VALUES %s) AS v(alert_id, observed_value)
+                    WHERE a.id = v.alert_id AND a.active AND NOT a.triggered
+                    RETURNING a.user_id, {ALERT_COLUMNS}, v.observed_value
+                ), events AS (
+                    INSERT INTO alert_events (alert_id, user_id, symbol, observed_value, target_value, condition)
+                    SELECT id, user_id, symbol, observed_value, target_value, condition FROM fired
+                )
+                SELECT {ALERT_COLUMNS}, observed_value
+                FROM fired
+            """, list(triggered.items()), template="(%s::integer, %s::float)", fetch=True)
+        alerts = [(Alert.from_row(row[:-1]), row[-1]) for row in fired]
+        formatter = AlertManager()
+        enqueue_many((
+            (alert.user_email, 'alert', f"🔔 Alerta de {alert.symbol}",
+             formatter.format_alert_message(alert, observed_value), ALERT_DIGEST_KEY)
+            for alert, observed_value in alerts
+            if alert.user_email
+        ), conn)
+        conn.commit()
+        return len(fired)
+
+    def heartbeat(self, conn):
+        """Registrar que el evaluador sigue en marcha y cada cuánto revisa las alertas"""
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO worker_heartbeats (name, interval_seconds, last_seen)
+                VALUES (%s, %s, NOW())
+                ON CONFLICT (name) DO UPDATE SET
+                    interval_seconds = EXCLUDED.interval_seconds,
+                    last_seen = EXCLUDED.last_seen
+            """, (HEARTBEAT_NAME, self.interval))
+        conn.commit()
+
+    def run_cycle(self) -> Dict:
+        """Evaluar todas las alertas pendientes pidiendo cada símbolo una sola vez"""
+        started = time.perf_counter()
+        stats = {'alerts': 0, 'loaded': 0, 'symbols': 0, 'priced': 0, 'bars': 0,
+                 'triggered': 0, 'rearmed': 0, 'cooling': 0, 'skipped': False}
+
+        with connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (WORKER_LOCK_KEY,))
+                if not cur.fetchone()[0]:
+                    stats['skipped'] = True
+                    return stats
+            try:
+                self.heartbeat(conn)
+                stats['loaded'] = self.sync_index(conn)
+                conn.commit()
+                self.release_cooled()
+                stats['alerts'] = self.watched_count()
+                stats['cooling'] = len(self._cooling)
+                if not stats['alerts']:
+                    return stats
+
+                loaded = time.perf_counter()
+                # Las alertas en enfriamiento no están en ningún índice: no piden datos
+                symbols = self.watched_symbols(price=True)
+                prices = self.quote_engine.get_prices(symbols, priority=BACKGROUND)
+                indicator_symbols = self.watched_symbols(price=False)
+                stats['bars'] = self.update_indicators(indicator_symbols)
+                stats['symbols'] = len(set(symbols).union(indicator_symbols))
+                stats['priced'] = len(prices)
+                fetched = time.perf_counter()
+
+                triggered = self.evaluate(prices)
+                if triggered:
+                    stats['triggered'] = self.record_triggers(conn, triggered)
+                    # Solo tras confirmar la transacción: si falla, los índices no cambian
+                    self.apply_triggers(triggered)
+                rearmed = self.rearm(prices)
+                if rearmed:
+                    stats['rearmed'] = self.record_rearms(conn, rearmed)
+                    self.apply_rearms(rearmed)
+
+                stats['load_ms'] = (loaded - started) * 1000
+                stats['fetch_ms'] = (fetched - loaded) * 1000
+                stats['evaluate_ms'] = (time.perf_counter() - fetched) * 1000
+                return stats
+            finally:
+                conn.rollback()
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (WORKER_LOCK_KEY,))
+                conn.commit()
+
+    def run_forever(self):
+        """Repetir ciclos cada interval segundos hasta que se interrumpa el proceso"""
+        while True:
+            started = time.monotonic()
+            try:
+                stats = self.run_cycle()
+                print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] Ciclo de alertas: {stats}")
+            except Exception as e:
+                print(f"Error evaluating alerts: {str(e)}")
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluador de alertas de BROKER.IA")
+    parser.add_argument('--interval', type=float, default=300.0, help="Segundos entre ciclos")
+    parser.add_argument('--once', action='store_true', help="Ejecutar un único ciclo y salir")
+    args = parser.parse_args()
+
+    run_migrations()
+    worker = AlertWorker(interval=args.interval)
+    if args.once:
+        print(worker.run_cycle())
+        return
+    sender = start_outbox_sender()
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        if sender:
+            sender.stop()
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,75 @@
 
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import streamlit as st
+from .rate_limiter import scheduler, RateLimitExceeded, INTERACTIVE
 
 class APIIntegrations:
-    def __init__(self):
+    def __init__(self, keys: Optional[Dict[str, str]] = None):
+        # Claves explícitas (p. ej. leídas del entorno fuera de Streamlit); si faltan, st.secrets
+        self.keys = keys or {}
         self.endpoints = {
             'alpha_vantage': 'https://www.alphavantage.co/query',
             'coingecko': 'https://api.coingecko.com/api/v3',
             'polygon': 'https://api.polygon.io/v2'
         }
 
-    def get_stock_data(self, symbol: str) -> Dict[str, Any]:
+    def _key(self, name: str) -> str:
+        if name in self.keys:
+            return self.keys[name]
+        return st.secrets.get(name, "")
+
+    def get_stock_data(self, symbol: str, priority: int = INTERACTIVE,
+                           timeout: Optional[float] = -1) -> Dict[str, Any]:
         """Obtener datos de acciones usando Alpha Vantage"""
         params = {
             'function': 'GLOBAL_QUOTE',
             'symbol': symbol,
-            'apikey': st.secrets.get("ALPHA_VANTAGE_KEY", "")
+            'apikey': self._key("ALPHA_VANTAGE_KEY")
         }
-        response = requests.get(self.endpoints['alpha_vantage'], params=params)
-        return response.json()
+        scheduler.acquire('alpha_vantage', priority, timeout)
+        data = requests.get(self.endpoints['alpha_vantage'], params=params, timeout=10).json()
+        if 'Note' in data or 'Information' in data:
+            scheduler.report_throttled('alpha_vantage')
+            raise RateLimitExceeded('alpha_vantage', 60)
+        return data
 
-    def get_crypto_data(self, crypto_id: str) -> Dict[str, Any]:
+    def get_crypto_data(self, crypto_id: str, priority: int = INTERACTIVE) -> Dict[str, Any]:
         """Obtener datos de criptomonedas usando CoinGecko"""
+        scheduler.acquire('coingecko', priority)
         response = requests.get(f"{self.endpoints['coingecko']}/simple/price",
-            params={'ids': crypto_id, 'vs_currencies': 'usd'})
+            params={'ids': crypto_id, 'vs_currencies': 'usd'}, timeout=10)
+        if response.status_code == 429:
+            scheduler.report_throttled('coingecko')
+            raise RateLimitExceeded('coingecko', 60)
         return response.json()
 
-    def get_real_time_data(self, symbol: str) -> Dict[str, Any]:
+    def get_real_time_data(self, symbol: str, priority: int = INTERACTIVE,
+                               timeout: Optional[float] = -1) -> Dict[str, Any]:
         """Obtener datos en tiempo real usando Polygon"""
-        headers = {'Authorization': f"Bearer {st.secrets.get('POLYGON_KEY', '')}"}
+        headers = {'Authorization': f"Bearer {self._key('POLYGON_KEY')}"}
+        scheduler.acquire('polygon', priority, timeout)
         response = requests.get(
             f"{self.endpoints['polygon']}/aggs/ticker/{symbol}/prev",
-            headers=headers
+            headers=headers,
+            timeout=10
+        )
+        if response.status_code == 429:
+            scheduler.report_throttled('polygon')
+            raise RateLimitExceeded('polygon', 60)
+        return response.json()
+
+    def get_snapshot(self, symbol: str, priority: int = INTERACTIVE,
+                         timeout: Optional[float] = -1) -> Dict[str, Any]:
+        """Obtener la instantánea actual (último precio y cambio del día) usando Polygon"""
+        headers = {'Authorization': f"Bearer {self._key('POLYGON_KEY')}"}
+        scheduler.acquire('polygon', priority, timeout)
+        response = requests.get(
+            f"{self.endpoints['polygon']}/snapshot/locale/us/markets/stocks/tickers/{symbol}",
+            headers=headers,
+            timeout=10
         )
+        if response.status_code == 429:
+            scheduler.report_throttled('polygon')
+            raise RateLimitExceeded('polygon', 60)
         return response.json()
@@ -1,88 +1,19 @@
 import streamlit as st
 from streamlit.components.v1 import components
-import bcrypt
 import jwt
 import psycopg2
 from datetime import datetime, timedelta
 import os
 from typing import Optional, Dict
 import secrets
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from .db import connection
+from .notifications import enqueue
 
 class AuthManager:
-    def __init__(self):
-        self.conn = None
-        self.connect_to_db()
-        if 'user' not in st.session_state:
-            st.session_state.user = None
-
-    def connect_to_db(self):
-        """Establecer conexión a la base de datos con reintentos"""
-        max_retries = 3
-        retry_count = 0
-
-        while retry_count < max_retries:
-            try:
-                db_url = os.environ.get('DATABASE_URL')
-                if not db_url:
-                    st.error("Error: DATABASE_URL no está configurada")
-                    return False
-
-                # Asegurar que la URL tiene los parámetros correctos
-                if '?' not in db_url:
-                    db_url += '?sslmode=require'
-
-                self.conn = psycopg2.connect(
-                    db_url,
-                    connect_timeout=10
-                )
-                self.setup_database()
-                return True
-            except psycopg2.Error as e:
-                retry_count += 1
-                if retry_count == max_retries:
-                    st.error(f"Error de conexión a la base de datos: {str(e)}")
-                    raise Exception("No se pudo establecer conexión con la base de datos")
-                st.warning(f"Reintentando conexión ({retry_count}/{max_retries})...")
-
-    def ensure_connection(self):
-        """Asegurar que la conexión está activa"""
-        try:
-            # Intentar una consulta simple para verificar la conexión
-            with self.conn.cursor() as cur:
-                cur.execute("SELECT 1")
-        except (psycopg2.Error, AttributeError):
-            # Reconectar si hay error
-            self.connect_to_db()
-
-    def setup_database(self):
-        """Configurar tablas necesarias en la base de datos"""
-        try:
-            with self.conn.cursor() as cur:
-                # Crear tabla de usuarios si no existe
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id SERIAL PRIMARY KEY,
-                        email VARCHAR(255) UNIQUE NOT NULL,
-                        password_hash VARCHAR(255) NOT NULL,
-                        name VARCHAR(255),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        last_login TIMESTAMP,
-                        role VARCHAR(50) DEFAULT 'user',
-                        email_verified BOOLEAN DEFAULT FALSE,
-                        verification_token VARCHAR(255),
-                        remember_token VARCHAR(255),
-                        token_expires_at TIMESTAMP
-                    )
-                """)
-                self.conn.commit()
-        except Exception as e:
-            st.error(f"Error configurando la base de datos: {str(e)}")
+    """Servicio sin estado propio: el usuario de cada sesión vive en st.session_state"""
 
     def send_verification_email(self, email: str, token: str):
-        """Enviar correo de verificación"""
+        """Dejar el correo de verificación en la bandeja de salida; lo envía OutboxSender"""
         try:
             subject = "Verifica tu cuenta en BROKER.IA"
             body = f"""
@@ -97,11 +28,7 @@ class AuthManager:
             El equipo de BROKER.IA
             """
 
-            msg = MIMEMultipart()
-            msg['From'] = "noreply@broker-ia.com"
-            msg['To'] = email
-            msg['Subject'] = subject
-            msg.attach(MIMEText(body, 'plain'))
+            enqueue(email, subject, body, kind='verification')
 
             # Para demostración, guardar el token en la sesión
             st.session_state.verification_token = token
@@ -113,11 +40,10 @@ class AuthManager:
     def generate_token(self, user_id: int, token_type: str = "verification") -> str:
         """Generar token único"""
         try:
-            self.ensure_connection()
             token = secrets.token_urlsafe(32)
             expires_at = datetime.now() + timedelta(days=1)
 
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 if token_type == "verification":
                     cur.execute(
                         "UPDATE users SET verification_token = %s WHERE id = %s",
@@ -128,7 +54,7 @@ class AuthManager:
                         "UPDATE users SET remember_token = %s, token_expires_at = %s WHERE id = %s",
                         (token, expires_at, user_id)
                     )
-                self.conn.commit()
+                conn.commit()
             return token
         except Exception as e:
             st.error(f"Error generando token: {str(e)}")
@@ -137,8 +63,7 @@ class AuthManager:
     def verify_email(self, token: str) -> bool:
         """Verificar email con token"""
         try:
-            self.ensure_connection()
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 cur.execute(
                     """
                     UPDATE users 
@@ -149,7 +74,7 @@ class AuthManager:
                     (token,)
                 )
                 result = cur.fetchone()
-                self.conn.commit()
+                conn.commit()
                 return result is not None
         except Exception as e:
             st.error(f"Error verificando email: {str(e)}")
@@ -162,8 +87,7 @@ class AuthManager:
     def check_remember_token(self, token: str) -> Optional[Dict]:
         """Verificar token de recordar sesión"""
         try:
-            self.ensure_connection()
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 cur.execute(
                     """
                     SELECT id, email, name, role 
@@ -187,11 +111,13 @@ class AuthManager:
 
     def hash_password(self, password: str) -> str:
         """Hash la contraseña usando bcrypt"""
+        import bcrypt
         salt = bcrypt.gensalt()
         return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
     def verify_password(self, password: str, password_hash: str) -> bool:
         """Verificar si la contraseña coincide con el hash"""
+        import bcrypt
         return bcrypt.checkpw(
             password.encode('utf-8'),
             password_hash.encode('utf-8')
@@ -200,17 +126,15 @@ class AuthManager:
     def register_user(self, email: str, password: str, name: str) -> bool:
         """Registrar un nuevo usuario"""
         try:
-            self.ensure_connection()
-
             # Verificar si el email ya existe
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 cur.execute("SELECT id FROM users WHERE email = %s", (email,))
                 if cur.fetchone():
                     st.error("Este email ya está registrado")
                     return False
 
             password_hash = self.hash_password(password)
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 cur.execute(
                     """
                     INSERT INTO users (email, password_hash, name, email_verified)
@@ -225,16 +149,15 @@ class AuthManager:
                     return False
 
                 user_id = result[0]
-                self.conn.commit()
-
-                # Generar y enviar token de verificación
-                token = self.generate_token(user_id)
-                if token:
-                    self.send_verification_email(email, token)
-                    return True
-                return False
+                conn.commit()
+
+            # Generar y enviar token de verificación
+            token = self.generate_token(user_id)
+            if token:
+                self.send_verification_email(email, token)
+                return True
+            return False
         except psycopg2.Error as e:
-            self.conn = None  # Forzar reconexión en el próximo intento
             st.error(f"Error en la base de datos: {str(e)}")
             return False
         except Exception as e:
@@ -244,8 +167,7 @@ class AuthManager:
     def login_user(self, email: str, password: str, remember: bool = False) -> bool:
         """Iniciar sesión de usuario"""
         try:
-            self.ensure_connection()
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 cur.execute(
                     "SELECT id, password_hash, name, role, email_verified FROM users WHERE email = %s",
                     (email,)
@@ -270,26 +192,26 @@ class AuthManager:
                     "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %s",
                     (user[0],)
                 )
-                self.conn.commit()
+                conn.commit()
 
-                # Guardar información del usuario en la sesión
-                st.session_state.user = {
-                    'id': user[0],
-                    'email': email,
-                    'name': user[2],
-                    'role': user[3]
-                }
+            # Guardar información del usuario en la sesión
+            st.session_state.user = {
+                'id': user[0],
+                'email': email,
+                'name': user[2],
+                'role': user[3]
+            }
 
-                # Cargar carteras del usuario
-                from utils.portfolio import Portfolio
-                st.session_state.portfolios = Portfolio.load_user_portfolios(user[0])
+            # Cargar carteras del usuario
+            from utils.portfolio import Portfolio
+            st.session_state.portfolios = Portfolio.load_user_portfolios(user[0])
 
-                # Crear token de recordar si se solicitó
-                if remember:
-                    remember_token = self.create_remember_token(user[0])
-                    st.session_state.remember_token = remember_token
+            # Crear token de recordar si se solicitó
+            if remember:
+                remember_token = self.create_remember_token(user[0])
+                st.session_state.remember_token = remember_token
 
-                return True
+            return True
         except psycopg2.Error as e:
             st.error(f"Error al iniciar sesión: {str(e)}")
             return False
@@ -298,13 +220,12 @@ class AuthManager:
         """Cerrar sesión de usuario"""
         if 'remember_token' in st.session_state:
             try:
-                self.ensure_connection()
-                with self.conn.cursor() as cur:
+                with connection() as conn, conn.cursor() as cur:
                     cur.execute(
                         "UPDATE users SET remember_token = NULL, token_expires_at = NULL WHERE id = %s",
                         (st.session_state.user['id'],)
                     )
-                    self.conn.commit()
+                    conn.commit()
                 del st.session_state.remember_token
             except Exception as e:
                 st.error(f"Error al cerrar sesión: {str(e)}")
@@ -2,6 +2,8 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 from typing import Dict, List
+from .db import connection
+from .registry import services
 
 class BrokerConnection:
     def __init__(self, broker_name: str, user_id: str = None):
@@ -84,7 +86,7 @@ class PortfolioAggregator:
         st.subheader("📊 Gestión de Carteras")
         
         # Obtener carteras del usuario actual
-        user = st.session_state.auth_manager.get_current_user()
+        user = services.auth_manager.get_current_user()
         portfolios = st.session_state.portfolios
         
         if not portfolios:
@@ -129,12 +131,12 @@ class PortfolioAggregator:
                 if st.button("🗑️ Eliminar Cartera", key=f"delete_{name}"):
                     try:
                         # Eliminar de la base de datos
-                        with portfolio.conn.cursor() as cur:
+                        with connection() as conn, conn.cursor() as cur:
                             cur.execute("DELETE FROM positions WHERE portfolio_id IN (SELECT id FROM portfolios WHERE name = %s AND user_id = %s)", 
                                       (name, user['id']))
                             cur.execute("DELETE FROM portfolios WHERE name = %s AND user_id = %s", 
                                       (name, user['id']))
-                            portfolio.conn.commit()
+                            conn.commit()
                         
                         # Eliminar de la sesión
                         del st.session_state.portfolios[name]
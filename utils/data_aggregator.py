@@ -1,22 +1,29 @@
-import yfinance as yf
-from newsapi import NewsApiClient
 import streamlit as st
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import os
 import pandas as pd
+from .shared_cache import shared_cache
+from .data_sources import fetch_info, fetch_history
+from .replay import recorder
+from .rate_limiter import INTERACTIVE
 
 class DataAggregator:
-    def __init__(self):
+    def __init__(self, cache=shared_cache):
         """Initialize connections to various data sources"""
+        from newsapi import NewsApiClient
         self.newsapi = NewsApiClient(api_key=os.getenv("NEWS_API_KEY"))
+        self.cache = cache
+
+    def _get_info(self, symbol: str) -> Dict:
+        """Get ticker info through the shared process cache"""
+        return self.cache.get_or_load('info', symbol, lambda: fetch_info(symbol))
 
     def get_stock_data(self, symbol: str) -> Dict:
         """Get comprehensive stock data from multiple sources"""
         try:
             # Get data from Yahoo Finance
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
+            info = self._get_info(symbol)
 
             # Estructura la información
             return {
@@ -38,9 +45,10 @@ class DataAggregator:
     def get_historical_data(self, symbol: str, period: str = "1y") -> pd.DataFrame:
         """Get historical price data"""
         try:
-            ticker = yf.Ticker(symbol)
-            df = ticker.history(period=period)
-            return df
+            return self.cache.get_or_load(
+                'history', (symbol, period),
+                lambda: fetch_history(symbol, period=period)
+            )
         except Exception as e:
             st.error(f"Error obteniendo datos históricos de {symbol}: {str(e)}")
             return pd.DataFrame()
@@ -51,11 +59,14 @@ class DataAggregator:
             from_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
 
             # Get news from NewsAPI
-            news_response = self.newsapi.get_everything(
-                q=query,
-                from_param=from_date,
-                language='es',
-                sort_by='relevancy'
+            news_response = recorder.call(
+                'newsapi.everything', [query, days],
+                lambda: self.newsapi.get_everything(
+                    q=query,
+                    from_param=from_date,
+                    language='es',
+                    sort_by='relevancy'
+                )
             )
 
             news_items = []
@@ -74,23 +85,18 @@ class DataAggregator:
             st.error(f"Error obteniendo noticias: {str(e)}")
             return []
 
+    def get_market_snapshot(self, name: str) -> Dict:
+        """Get a pre-warmed snapshot ({'data', 'updated_at'}) from the shared cache"""
+        fetcher = SNAPSHOT_FETCHERS[name]
+        return self.cache.get_or_load(
+            'snapshot', name,
+            lambda: {'data': fetcher(), 'updated_at': datetime.now()}
+        )
+
     def get_market_movers(self) -> Dict:
         """Get market movers and trending stocks"""
         try:
-            # List of major indices
-            indices = ['^GSPC', '^IXIC', '^DJI']
-            market_data = {}
-
-            for index in indices:
-                ticker = yf.Ticker(index)
-                info = ticker.info
-                market_data[index] = {
-                    'name': info.get('shortName', ''),
-                    'price': info.get('regularMarketPrice', 0),
-                    'change': info.get('regularMarketChangePercent', 0)
-                }
-
-            return market_data
+            return self.get_market_snapshot('market_movers')['data']
         except Exception as e:
             st.error(f"Error obteniendo datos del mercado: {str(e)}")
             return {}
@@ -98,26 +104,54 @@ class DataAggregator:
     def get_sector_performance(self) -> Dict:
         """Get sector performance analysis"""
         try:
-            sectors = [
-                'XLF',  # Financial
-                'XLK',  # Technology
-                'XLV',  # Healthcare
-                'XLE',  # Energy
-                'XLI',  # Industrial
-                'XLP',  # Consumer Staples
-                'XLY'   # Consumer Discretionary
-            ]
-
-            sector_data = {}
-            for sector in sectors:
-                ticker = yf.Ticker(sector)
-                info = ticker.info
-                sector_data[sector] = {
-                    'name': info.get('shortName', ''),
-                    'change': info.get('regularMarketChangePercent', 0)
-                }
-
-            return sector_data
+            return self.get_market_snapshot('sector_performance')['data']
         except Exception as e:
             st.error(f"Error obteniendo rendimiento sectorial: {str(e)}")
-            return {}
\ No newline at end of file
+            return {}
+
+# List of major indices
+MARKET_INDICES = ['^GSPC', '^IXIC', '^DJI']
+
+SECTOR_ETFS = [
+    'XLF',  # Financial
+    'XLK',  # Technology
+    'XLV',  # Healthcare
+    'XLE',  # Energy
+    'XLI',  # Industrial
+    'XLP',  # Consumer Staples
+    'XLY'   # Consumer Discretionary
+]
+
+def _fetch_fresh_info(symbol: str, priority: int = INTERACTIVE) -> Dict:
+    """Fetch ticker info bypassing the cache TTL and refresh the cached copy"""
+    info = fetch_info(symbol, priority=priority)
+    shared_cache.set('info', symbol, info)
+    return info
+
+def fetch_market_movers(priority: int = INTERACTIVE) -> Dict:
+    """Fetch index snapshots"""
+    market_data = {}
+    for index in MARKET_INDICES:
+        info = _fetch_fresh_info(index, priority)
+        market_data[index] = {
+            'name': info.get('shortName', ''),
+            'price': info.get('regularMarketPrice', 0),
+            'change': info.get('regularMarketChangePercent', 0)
+        }
+    return market_data
+
+def fetch_sector_performance(priority: int = INTERACTIVE) -> Dict:
+    """Fetch sector ETF snapshots"""
+    sector_data = {}
+    for sector in SECTOR_ETFS:
+        info = _fetch_fresh_info(sector, priority)
+        sector_data[sector] = {
+            'name': info.get('shortName', ''),
+            'change': info.get('regularMarketChangePercent', 0)
+        }
+    return sector_data
+
+SNAPSHOT_FETCHERS = {
+    'market_movers': fetch_market_movers,
+    'sector_performance': fetch_sector_performance
+}
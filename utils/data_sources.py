@@ -0,0 +1,39 @@
+import pandas as pd
+from typing import Dict, List
+from .replay import recorded
+from .rate_limiter import scheduler, INTERACTIVE
+
+# Único punto de acceso a yfinance, para poder grabar y reproducir sus respuestas.
+# yfinance se importa en la primera llamada para no alargar el arranque. Cada llamada
+# real espera turno en el limitador según su prioridad (al reproducir no se llama).
+
+def _yf(priority: int = INTERACTIVE):
+    scheduler.acquire('yfinance', priority)
+    import yfinance as yf
+    return yf
+
+@recorded('yfinance.info')
+def fetch_info(symbol: str, priority: int = INTERACTIVE) -> Dict:
+    """Obtener el diccionario info completo de un ticker"""
+    return _yf(priority).Ticker(symbol).info
+
+@recorded('yfinance.history')
+def fetch_history(symbol: str, priority: int = INTERACTIVE, **kwargs) -> pd.DataFrame:
+    """Obtener el histórico de un ticker (period/start/end/interval)"""
+    return _yf(priority).Ticker(symbol).history(**kwargs)
+
+@recorded('yfinance.fast_info')
+def fetch_fast_info(symbol: str, priority: int = INTERACTIVE) -> Dict:
+    """Obtener la cotización ligera de un ticker"""
+    fast = _yf(priority).Ticker(symbol).fast_info
+    return {
+        'last_price': fast['last_price'],
+        'previous_close': fast['previous_close'],
+        'last_volume': fast['last_volume'],
+        'currency': fast['currency']
+    }
+
+@recorded('yfinance.download')
+def download(symbols: List[str], priority: int = INTERACTIVE, **kwargs) -> pd.DataFrame:
+    """Descargar varios tickers en una sola petición"""
+    return _yf(priority).download(tickers=symbols, progress=False, **kwargs)
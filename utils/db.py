@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    """Pool de conexiones Postgres compartido por todo el proceso
+
+    Las conexiones se piden con connection() y se devuelven al salir del bloque.
+    Al prestarlas se comprueba que siguen vivas; la consulta de prueba solo se lanza
+    si la conexión lleva más de validate_after segundos sin usarse.
+    """
+
+    def __init__(self, dsn: Optional[str] = None, minconn: int = 1, maxconn: Optional[int] = None,
+                 acquire_timeout: float = 10.0, validate_after: float = 30.0,
+                 leak_after: float = 30.0, connect_timeout: int = 10):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn or int(os.getenv('DB_POOL_SIZE', 10))
+        self.acquire_timeout = acquire_timeout
+        self.validate_after = validate_after
+        self.leak_after = leak_after
+        self.connect_timeout = connect_timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        # ThreadedConnectionPool falla al agotarse; el semáforo hace esperar en su lugar
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._checked_out: Dict[int, tuple] = {}
+        self._last_used: Dict[int, float] = {}
+        self._waits = deque(maxlen=1000)
+        self._metrics = {'checkouts': 0, 'timeouts': 0, 'reconnects': 0, 'leaks': 0}
+
+    def _dsn(self) -> str:
+        db_url = self.dsn or os.environ.get('DATABASE_URL')
+        if not db_url:
+            raise Exception("DATABASE_URL no está configurada")
+        # Asegurar que la URL tiene los parámetros correctos
+        if '?' not in db_url:
+            db_url += '?sslmode=require'
+        return db_url
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(
+                    self.minconn, self.maxconn, self._dsn(), connect_timeout=self.connect_timeout
+                )
+            return self._pool
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0.0) < self.validate_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Tomar una conexión sana del pool, esperando hasta acquire_timeout"""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self._metrics['timeouts'] += 1
+            raise PoolTimeout(f"Sin conexiones libres tras {self.acquire_timeout:g}s")
+
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            if not self._healthy(conn):
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+                with self._lock:
+                    self._metrics['reconnects'] += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        caller = traceback.extract_stack(limit=4)[0]
+        with self._lock:
+            self._metrics['checkouts'] += 1
+            self._waits.append(time.monotonic() - started)
+            self._checked_out[id(conn)] = (time.monotonic(), f"{os.path.basename(caller.filename)}:{caller.lineno}")
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        """Devolver una conexión al pool deshaciendo cualquier transacción abierta"""
+        try:
+            if not conn.closed and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            close = True
+        with self._lock:
+            checked_out_at, _ = self._checked_out.pop(id(conn), (time.monotonic(), None))
+            if time.monotonic() - checked_out_at > self.leak_after:
+                self._metrics['leaks'] += 1
+            self._last_used[id(conn)] = time.monotonic()
+            if close or conn.closed:
+                self._last_used.pop(id(conn), None)
+        try:
+            self._get_pool().putconn(conn, close=close or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Prestar una conexión durante el bloque with"""
+        conn = self.getconn()
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+            raise
+        finally:
+            self.putconn(conn)
+
+    def stats(self) -> Dict:
+        """Obtener tamaño, espera para conseguir conexión y préstamos sospechosos de fuga"""
+        now = time.monotonic()
+        with self._lock:
+            waits = sorted(self._waits)
+            held = [
+                {'since_s': round(now - started, 1), 'caller': caller}
+                for started, caller in self._checked_out.values()
+                if now - started > self.leak_after
+            ]
+            return {
+                'max_size': self.maxconn,
+                'open': (len(self._pool._pool) + len(self._pool._used)) if self._pool else 0,
+                'in_use': len(self._checked_out),
+                'avg_wait_ms': (sum(waits) / len(waits) * 1000) if waits else 0.0,
+                'p95_wait_ms': waits[int(len(waits) * 0.95)] * 1000 if waits else 0.0,
+                'max_wait_ms': waits[-1] * 1000 if waits else 0.0,
+                'suspected_leaks': held,
+                **self._metrics
+            }
+
+# Pool compartido por el proceso; se conecta en el primer préstamo
+db_pool = ConnectionPool()
+
+def connection():
+    """Prestar una conexión del pool compartido"""
+    return db_pool.connection()
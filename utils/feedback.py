@@ -2,6 +2,7 @@
 import streamlit as st
 from datetime import datetime
 from typing import Dict, List
+from .registry import services
 
 class FeedbackManager:
     def __init__(self):
@@ -50,7 +51,7 @@ class FeedbackManager:
             
             if st.form_submit_button("Enviar Feedback"):
                 if content:
-                    user = st.session_state.auth_manager.get_current_user()
+                    user = services.auth_manager.get_current_user()
                     self.add_feedback(feedback_type, content, user['email'])
                     st.success("¡Gracias por tu feedback!")
                 else:
@@ -0,0 +1,186 @@
+import pandas as pd
+from psycopg2.extras import execute_values
+import threading
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+from .shared_cache import shared_cache
+from .data_sources import download
+from .db import connection
+from .rate_limiter import BATCH
+
+# Periodos de yfinance y los días naturales que cubren, de menor a mayor
+DOWNLOAD_PERIODS = (
+    (7, '5d'), (30, '1mo'), (90, '3mo'), (180, '6mo'), (365, '1y'),
+    (730, '2y'), (1825, '5y'), (3650, '10y')
+)
+
+def download_period(start: date, today: Optional[date] = None) -> str:
+    """Periodo de yfinance más corto que cubre desde start hasta hoy"""
+    days = ((today or date.today()) - start).days
+    for span, period in DOWNLOAD_PERIODS:
+        if days <= span:
+            return period
+    return 'max'
+
+class HistoryStore:
+    # Segundos entre comprobaciones de nuevos cierres para un mismo símbolo
+    SYNC_TTL = 900
+
+    def __init__(self, cache=shared_cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+
+    def _stored_ranges(self, symbols: List[str]) -> Dict[str, tuple]:
+        """Obtener la primera y la última fecha almacenadas de cada símbolo"""
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT symbol, MIN(date), MAX(date)
+                FROM price_history
+                WHERE symbol = ANY(%s)
+                GROUP BY symbol
+            """, (symbols,))
+            return {symbol: (first, last) for symbol, first, last in cur.fetchall()}
+
+    def _download(self, symbols: List[str], start: date, today: Optional[date] = None,
+                  priority: int = BATCH) -> List[tuple]:
+        """Descargar barras diarias de un lote de símbolos desde una fecha
+
+        Se pide un periodo relativo (period='1y', '5d'...) en vez de fechas: los
+        argumentos no cambian de un día a otro y una grabación del modo replay sigue
+        valiendo. Las barras anteriores a start se descartan al leer el resultado.
+        """
+        data = download(
+            symbols,
+            priority=priority,
+            period=download_period(start, today),
+            interval="1d",
+            group_by="column",
+            auto_adjust=False,
+            threads=True
+        )
+        if data.empty:
+            return []
+
+        rows = []
+        for symbol in symbols:
+            if isinstance(data.columns, pd.MultiIndex):
+                if symbol not in data.columns.get_level_values(1):
+                    continue
+                bars = data.xs(symbol, axis=1, level=1)
+            else:
+                bars = data
+            bars = bars.dropna(subset=['Close'])
+            for timestamp, bar in bars.iterrows():
+                if timestamp.date() < start:
+                    continue
+                rows.append((
+                    symbol,
+                    timestamp.date(),
+                    float(bar['Open']),
+                    float(bar['High']),
+                    float(bar['Low']),
+                    float(bar['Close']),
+                    int(bar['Volume']) if pd.notna(bar['Volume']) else None
+                ))
+        return rows
+
+    def sync(self, symbols: Iterable[str], start_date: date, priority: int = BATCH):
+        """Descargar solo los días que faltan al final del histórico de cada símbolo
+
+        Las descargas van con prioridad BATCH por defecto: ceden el turno de yfinance
+        a las consultas interactivas y a los procesos de fondo.
+        """
+        symbols = [s for s in dict.fromkeys(str(s).strip().upper() for s in symbols) if s]
+        pending = [s for s in symbols if self.cache.get('history_sync', s) is None]
+        if not pending:
+            return
+
+        with self._lock:
+            ranges = self._stored_ranges(pending)
+
+            # Agrupar por fecha de inicio para descargar cada grupo en una sola petición.
+            # Se vuelve a pedir el último día guardado porque su cierre puede estar incompleto;
+            # si el histórico guardado empieza después del rango pedido se descarga completo.
+            groups: Dict[date, List[str]] = {}
+            for symbol in pending:
+                first, last = ranges.get(symbol, (None, None))
+                if first is None or first > start_date + timedelta(days=7):
+                    start = start_date
+                else:
+                    start = max(last, start_date)
+                groups.setdefault(start, []).append(symbol)
+
+            for start, group in groups.items():
+                try:
+                    rows = self._download(group, start, priority=priority)
+                    if rows:
+                        with connection() as conn, conn.cursor() as cur:
+                            execute_values(cur, """
+                                INSERT INTO price_history (symbol, date, open, high, low, close, volume)
+                                VALUES %s
+                                ON CONFLICT (symbol, date) DO UPDATE SET
+                                    open = EXCLUDED.open,
+                                    high = EXCLUDED.high,
+                                    low = EXCLUDED.low,
+                                    close = EXCLUDED.close,
+                                    volume = EXCLUDED.volume
+                            """, rows)
+                            conn.commit()
+                    for symbol in group:
+                        self.cache.set('history_sync', symbol, True, ttl=self.SYNC_TTL)
+                except Exception as e:
+                    print(f"Error syncing history for {', '.join(group)}: {str(e)}")
+
+    def get_close_matrix(self, symbols: Iterable[str], start_date: date,
+                         end_date: Optional[date] = None) -> pd.DataFrame:
+        """Obtener una matriz fecha×símbolo de cierres alineados"""
+        symbols = [s for s in dict.fromkeys(str(s).strip().upper() for s in symbols) if s]
+        if not symbols:
+            return pd.DataFrame()
+
+        self.sync(symbols, start_date)
+        end_date = end_date or date.today()
+
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT date, symbol, close
+                FROM price_history
+                WHERE symbol = ANY(%s) AND date BETWEEN %s AND %s
+                ORDER BY date
+            """, (symbols, start_date, end_date))
+            rows = cur.fetchall()
+
+        if not rows:
+            return pd.DataFrame()
+
+        frame = pd.DataFrame(rows, columns=['date', 'symbol', 'close'])
+        matrix = frame.pivot(index='date', columns='symbol', values='close')
+        matrix.index = pd.to_datetime(matrix.index)
+        return matrix.reindex(columns=[s for s in symbols if s in matrix.columns]).ffill()
+
+    def get_bars(self, symbols: Iterable[str], start_date: date) -> List[tuple]:
+        """Obtener barras (símbolo, fecha, cierre, volumen) ordenadas por fecha"""
+        symbols = [s for s in dict.fromkeys(str(s).strip().upper() for s in symbols) if s]
+        if not symbols:
+            return []
+
+        self.sync(symbols, start_date)
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT symbol, date, close, volume
+                FROM price_history
+                WHERE symbol = ANY(%s) AND date >= %s AND close IS NOT NULL
+                ORDER BY date, symbol
+            """, (symbols, start_date))
+            return cur.fetchall()
+
+_history_store = None
+_history_store_lock = threading.Lock()
+
+def get_history_store() -> HistoryStore:
+    """Obtener el almacén de históricos compartido por el proceso"""
+    global _history_store
+    with _history_store_lock:
+        if _history_store is None:
+            _history_store = HistoryStore()
+        return _history_store
@@ -0,0 +1,97 @@
+import builtins
+import importlib.util
+import sys
+import threading
+import time
+from typing import Dict, List
+
+class ImportProfiler:
+    """Mide el tiempo de la primera importación de cada módulo
+
+    Envuelve builtins.__import__: solo cronometra los módulos que aún no están en
+    sys.modules, así que las importaciones ya resueltas apenas cuestan una búsqueda.
+    El tiempo propio descuenta el de los módulos importados desde el módulo medido.
+    """
+
+    def __init__(self):
+        self._original_import = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.records: Dict[str, Dict] = {}
+        self.phase = 'arranque'
+
+    def _resolve(self, name: str, globals_, level: int) -> str:
+        if level == 0:
+            return name
+        package = (globals_ or {}).get('__package__') or ''
+        try:
+            return importlib.util.resolve_name('.' * level + name, package)
+        except (ImportError, ValueError):
+            return name
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module_name = self._resolve(name, globals, level)
+        if not module_name or module_name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                if module_name not in self.records:
+                    self.records[module_name] = {
+                        'module': module_name,
+                        'cumulative_ms': elapsed * 1000,
+                        'self_ms': max(0.0, elapsed - children) * 1000,
+                        'phase': self.phase,
+                        'thread': threading.current_thread().name
+                    }
+
+    def start(self):
+        """Empezar a medir; debe llamarse antes de las importaciones que interesan"""
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def stop(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def set_phase(self, phase: str):
+        """Etiquetar las importaciones siguientes (p. ej. 'diferida' tras el arranque)"""
+        self.phase = phase
+
+    def report(self, limit: int = 30) -> List[Dict]:
+        """Módulos más caros por tiempo acumulado"""
+        with self._lock:
+            rows = sorted(self.records.values(), key=lambda r: r['cumulative_ms'], reverse=True)
+        return [
+            {**row, 'cumulative_ms': round(row['cumulative_ms'], 1), 'self_ms': round(row['self_ms'], 1)}
+            for row in rows[:limit]
+        ]
+
+    def by_package(self) -> List[Dict]:
+        """Tiempo propio sumado por paquete de primer nivel y fase"""
+        totals: Dict[tuple, float] = {}
+        with self._lock:
+            for row in self.records.values():
+                key = (row['module'].split('.')[0], row['phase'])
+                totals[key] = totals.get(key, 0.0) + row['self_ms']
+        rows = [
+            {'package': package, 'phase': phase, 'self_ms': round(ms, 1)}
+            for (package, phase), ms in totals.items()
+        ]
+        return sorted(rows, key=lambda r: r['self_ms'], reverse=True)
+
+# Perfilador compartido por el proceso; app.py lo arranca antes de sus importaciones
+import_profiler = ImportProfiler()
@@ -0,0 +1,221 @@
+from collections import deque
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+
+# Métricas que puede vigilar una alerta. Los cruces de medias se expresan como la
+# distancia porcentual entre la media rápida y la lenta: 'above 0' es un cruce alcista
+# y 'below 0' uno bajista.
+ALERT_METRICS = {
+    'price': "Precio",
+    'volume': "Volumen de la sesión",
+    'volume_ratio': "Volumen / media de 20 sesiones",
+    'rsi': "RSI (14)",
+    'sma_spread': "Cruce SMA 20/50 (% de separación)",
+    'ema_spread': "Cruce EMA 12/26 (% de separación)"
+}
+
+# Métricas que ofrece cada tipo de alerta del formulario; la primera es la predeterminada
+METRICS_BY_TYPE = {
+    'precio': ('price',),
+    'price': ('price',),
+    'volumen': ('volume', 'volume_ratio'),
+    'indicador técnico': ('rsi', 'sma_spread', 'ema_spread')
+}
+
+# Métricas que pueden ser negativas (el resto exige un objetivo mayor que cero)
+SIGNED_METRICS = ('sma_spread', 'ema_spread')
+
+def resolve_metric(alert_type: str, metric: Optional[str] = None) -> Optional[str]:
+    """Métrica que evalúa una alerta; las alertas antiguas no guardan métrica"""
+    allowed = METRICS_BY_TYPE.get(alert_type)
+    if not allowed:
+        return None
+    if metric is None:
+        return allowed[0]
+    return metric if metric in allowed else None
+
+class RollingMean:
+    """Media de las últimas `period` barras con suma acumulada: O(1) por barra
+
+    push() incorpora una barra cerrada; peek() calcula el valor que tendría la media
+    si la siguiente barra fuese x, sin modificar el estado. Así la barra en curso se
+    puede revisar en cada cotización sin rehacer la ventana.
+    """
+
+    __slots__ = ('period', '_window', '_sum')
+
+    def __init__(self, period: int):
+        self.period = period
+        self._window = deque()
+        self._sum = 0.0
+
+    def push(self, x: float):
+        self._window.append(x)
+        self._sum += x
+        if len(self._window) > self.period - 1:
+            self._sum -= self._window.popleft()
+
+    def peek(self, x: float) -> Optional[float]:
+        if len(self._window) < self.period - 1:
+            return None
+        return (self._sum + x) / self.period
+
+    def value(self) -> Optional[float]:
+        """Media de las barras cerradas que guarda la ventana (sin la barra en curso)"""
+        if not self._window:
+            return None
+        return self._sum / len(self._window)
+
+class EMA:
+    """Media exponencial sembrada con la media simple de las primeras `period` barras"""
+
+    __slots__ = ('alpha', '_seed', '_value')
+
+    def __init__(self, period: int):
+        self.alpha = 2.0 / (period + 1)
+        self._seed = RollingMean(period)
+        self._value = None
+
+    def push(self, x: float):
+        if self._value is None:
+            self._value = self._seed.peek(x)
+            self._seed.push(x)
+        else:
+            self._value += self.alpha * (x - self._value)
+
+    def peek(self, x: float) -> Optional[float]:
+        if self._value is None:
+            return self._seed.peek(x)
+        return self._value + self.alpha * (x - self._value)
+
+class RSI:
+    """RSI de Wilder: medias suavizadas de subidas y bajadas, O(1) por barra"""
+
+    __slots__ = ('period', '_last', '_count', '_gain', '_loss')
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self._last = None
+        self._count = 0
+        self._gain = 0.0
+        self._loss = 0.0
+
+    def _next(self, x: float) -> Tuple[int, float, float]:
+        change = x - self._last
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        count = self._count + 1
+        if count < self.period:
+            # Durante el arranque se acumulan sumas; al llegar a period pasan a medias
+            return count, self._gain + gain, self._loss + loss
+        if count == self.period:
+            return count, (self._gain + gain) / self.period, (self._loss + loss) / self.period
+        return (count,
+                (self._gain * (self.period - 1) + gain) / self.period,
+                (self._loss * (self.period - 1) + loss) / self.period)
+
+    def push(self, x: float):
+        if self._last is not None:
+            self._count, self._gain, self._loss = self._next(x)
+        self._last = x
+
+    def peek(self, x: float) -> Optional[float]:
+        if self._last is None:
+            return None
+        count, gain, loss = self._next(x)
+        if count < self.period:
+            return None
+        if loss == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + gain / loss)
+
+class IndicatorState:
+    """Indicadores de un símbolo actualizados barra a barra
+
+    La última barra recibida queda abierta: si llega otra con la misma fecha la
+    sustituye (cotización intradía) y solo se incorpora a los indicadores cuando
+    llega una barra de una fecha posterior.
+    """
+
+    __slots__ = ('sma_fast', 'sma_slow', 'ema_fast', 'ema_slow', 'rsi', 'avg_volume',
+                 'last_date', '_close', '_volume')
+
+    def __init__(self):
+        self.sma_fast = RollingMean(20)
+        self.sma_slow = RollingMean(50)
+        self.ema_fast = EMA(12)
+        self.ema_slow = EMA(26)
+        self.rsi = RSI(14)
+        # La ventana guarda period - 1 barras cerradas: 21 deja las 20 sesiones anteriores
+        self.avg_volume = RollingMean(21)
+        self.last_date: Optional[date] = None
+        self._close = None
+        self._volume = None
+
+    def update(self, bar_date: date, close: float, volume: Optional[float] = None) -> bool:
+        """Recibir una barra; las anteriores a la barra abierta se ignoran"""
+        if self.last_date is not None and bar_date < self.last_date:
+            return False
+        if self.last_date is not None and bar_date > self.last_date:
+            self._commit()
+        self.last_date = bar_date
+        self._close = float(close)
+        if volume is not None:
+            self._volume = float(volume)
+        return True
+
+    def _commit(self):
+        close = self._close
+        for indicator in (self.sma_fast, self.sma_slow, self.ema_fast, self.ema_slow, self.rsi):
+            indicator.push(close)
+        if self._volume is not None:
+            self.avg_volume.push(self._volume)
+        self._volume = None
+
+    def metrics(self) -> Dict[str, Optional[float]]:
+        """Valor de cada métrica de ALERT_METRICS con la barra abierta"""
+        if self._close is None:
+            return {}
+        close = self._close
+        average_volume = self.avg_volume.value()
+        return {
+            'price': close,
+            'volume': self._volume,
+            'volume_ratio': (self._volume / average_volume
+                             if self._volume is not None and average_volume else None),
+            'rsi': self.rsi.peek(close),
+            'sma_spread': _spread(self.sma_fast.peek(close), self.sma_slow.peek(close)),
+            'ema_spread': _spread(self.ema_fast.peek(close), self.ema_slow.peek(close))
+        }
+
+def _spread(fast: Optional[float], slow: Optional[float]) -> Optional[float]:
+    if fast is None or not slow:
+        return None
+    return (fast / slow - 1.0) * 100.0
+
+class IndicatorBook:
+    """Estado de indicadores por símbolo, para evaluar muchas alertas por cotización"""
+
+    def __init__(self):
+        self._states: Dict[str, IndicatorState] = {}
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.upper() in self._states
+
+    def last_date(self, symbol: str) -> Optional[date]:
+        state = self._states.get(symbol.upper())
+        return state.last_date if state else None
+
+    def update(self, symbol: str, bar_date: date, close: float, volume: Optional[float] = None) -> bool:
+        symbol = symbol.upper()
+        state = self._states.get(symbol)
+        if state is None:
+            state = self._states[symbol] = IndicatorState()
+        return state.update(bar_date, close, volume)
+
+    def update_many(self, bars: Iterable[Tuple[str, date, float, Optional[float]]]) -> int:
+        """Recibir barras (símbolo, fecha, cierre, volumen) en orden de fecha"""
+        return sum(self.update(*bar) for bar in bars)
+
+    def metrics(self, symbol: str) -> Dict[str, Optional[float]]:
+        state = self._states.get(symbol.upper())
+        return state.metrics() if state else {}
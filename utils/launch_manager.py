@@ -1,13 +1,11 @@
 import streamlit as st
-import psycopg2
 import os
 from datetime import datetime
 from typing import Dict, List, Optional
+from .db import connection
 
 class LaunchManager:
     def __init__(self):
-        self.conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        self.setup_database()
         self.phases = {
             'beta': {
                 'name': 'Beta',
@@ -29,54 +27,10 @@ class LaunchManager:
             }
         }
 
-    def setup_database(self):
-        """Configurar tablas necesarias"""
-        try:
-            with self.conn.cursor() as cur:
-                # Tabla para control de fases
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS launch_phases (
-                        id SERIAL PRIMARY KEY,
-                        phase_name VARCHAR(50) NOT NULL,
-                        is_active BOOLEAN DEFAULT false,
-                        start_date TIMESTAMP,
-                        end_date TIMESTAMP,
-                        max_users INTEGER,
-                        current_users INTEGER DEFAULT 0
-                    )
-                """)
-
-                # Tabla para lista de espera
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS waitlist (
-                        id SERIAL PRIMARY KEY,
-                        email VARCHAR(255) UNIQUE NOT NULL,
-                        registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        status VARCHAR(50) DEFAULT 'pending',
-                        invitation_sent BOOLEAN DEFAULT false,
-                        invitation_date TIMESTAMP
-                    )
-                """)
-
-                # Tabla para métricas de fase
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS phase_metrics (
-                        id SERIAL PRIMARY KEY,
-                        phase_name VARCHAR(50) NOT NULL,
-                        metric_name VARCHAR(50) NOT NULL,
-                        metric_value FLOAT,
-                        recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-
-                self.conn.commit()
-        except Exception as e:
-            st.error(f"Error en setup: {str(e)}")
-
     def check_access_allowed(self, user_id: int) -> bool:
         """Verificar si un usuario tiene acceso permitido"""
         try:
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 cur.execute("""
                     SELECT w.status, lp.is_active, lp.max_users, lp.current_users
                     FROM waitlist w
@@ -123,7 +77,7 @@ class LaunchManager:
         # Métricas de la fase actual
         col1, col2, col3 = st.columns(3)
         try:
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 # Usuarios activos
                 cur.execute("SELECT COUNT(*) FROM users WHERE last_login > NOW() - INTERVAL '7 days'")
                 active_users = cur.fetchone()[0]
@@ -146,7 +100,7 @@ class LaunchManager:
         st.subheader("Control de Acceso")
         with st.expander("Gestionar Lista de Espera"):
             try:
-                with self.conn.cursor() as cur:
+                with connection() as conn, conn.cursor() as cur:
                     cur.execute("""
                         SELECT email, registration_date, status
                         FROM waitlist
@@ -168,7 +122,7 @@ class LaunchManager:
                                         invitation_date = CURRENT_TIMESTAMP
                                     WHERE email = %s
                                 """, (email,))
-                                self.conn.commit()
+                                conn.commit()
                                 st.success(f"Usuario {email} aprobado")
                                 st.rerun()
                     else:
@@ -179,14 +133,14 @@ class LaunchManager:
     def add_to_waitlist(self, email: str, name: str = None, notes: str = None) -> bool:
         """Añadir usuario a la lista de espera con información adicional"""
         try:
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO waitlist (email, name, notes, registration_date)
                     VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
                     ON CONFLICT (email) DO NOTHING
                     RETURNING id
                 """, (email, name, notes))
-                self.conn.commit()
+                conn.commit()
                 
                 # Notificar al admin por email (implementar después)
                 return cur.fetchone() is not None
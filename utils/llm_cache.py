@@ -0,0 +1,289 @@
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from .db import connection
+
+# Segundos que vale una respuesta en cada punto de llamada. También fijan el tramo de
+# tiempo que entra en la clave: dentro de un tramo se reutiliza la respuesta aunque el
+# contexto de mercado del prompt haya cambiado ligeramente.
+CALL_SITE_TTLS = {
+    'advice': 900,
+    'market_analysis': 3600,
+    'recommendations': 3600
+}
+DEFAULT_TTL = 900
+
+# Precio en dólares por 1.000 tokens (entrada, salida) para estimar el coste ahorrado
+MODEL_PRICES = {
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+    'gpt-4': (0.03, 0.06),
+    'gpt-4o': (0.0025, 0.01)
+}
+
+def complete_chat(client, request: Dict) -> Tuple[str, Dict]:
+    """Llamar a chat.completions y devolver el texto y el consumo de tokens"""
+    response = client.chat.completions.create(**request)
+    usage = getattr(response, 'usage', None)
+    return response.choices[0].message.content, {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+        'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0
+    }
+
+def stream_chat(client, request: Dict, usage: Dict) -> Iterator[str]:
+    """Llamar a chat.completions en modo stream; al terminar deja el consumo en usage"""
+    stream = client.chat.completions.create(
+        **request, stream=True, stream_options={'include_usage': True}
+    )
+    for chunk in stream:
+        if getattr(chunk, 'usage', None):
+            usage['prompt_tokens'] = chunk.usage.prompt_tokens or 0
+            usage['completion_tokens'] = chunk.usage.completion_tokens or 0
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def estimate_cost(model: str, usage: Dict) -> float:
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (usage.get('prompt_tokens', 0) * input_price
+            + usage.get('completion_tokens', 0) * output_price) / 1000
+
+class LLMCache:
+    """Respuestas de OpenAI guardadas en Postgres por el hash de su petición
+
+    La clave es sha256 del punto de llamada, el modelo, los parámetros, el contexto y
+    el tramo de tiempo. El contexto lo elige quien llama (p. ej. la pregunta, o la
+    composición de la cartera sin precios) para que dos peticiones equivalentes
+    compartan respuesta aunque el prompt lleve datos que cambian a cada segundo.
+    Las entradas caducan con el TTL de su punto de llamada; además se conservan como
+    mucho max_entries, descartando las usadas hace más tiempo.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, int]] = None, max_entries: int = 5000,
+                 evict_every: int = 50):
+        self.ttls = dict(CALL_SITE_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._stats: Dict[str, Dict[str, float]] = {}
+        # Por punto de llamada: (ms hasta el primer fragmento, ms totales, servida del caché)
+        self._latencies: Dict[str, deque] = {}
+
+    def _site_stats(self, call_site: str) -> Dict[str, float]:
+        return self._stats.setdefault(call_site, {
+            'hits': 0, 'misses': 0, 'errors': 0, 'cost_saved_usd': 0.0,
+            'time_saved_ms': 0.0, 'cost_spent_usd': 0.0
+        })
+
+    def ttl(self, call_site: str) -> int:
+        return self.ttls.get(call_site, DEFAULT_TTL)
+
+    def key(self, call_site: str, request: Dict, context: Any = None,
+            now: Optional[float] = None) -> str:
+        """Clave de una petición; sin contexto se usan los mensajes completos"""
+        params = {name: value for name, value in request.items() if name not in ('messages', 'stream')}
+        bucket = int((now or time.time()) // self.ttl(call_site))
+        payload = json.dumps({
+            'call_site': call_site,
+            'params': params,
+            'context': request.get('messages') if context is None else context,
+            'bucket': bucket
+        }, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, call_site: str, key: str) -> Optional[str]:
+        """Respuesta vigente para la clave, o None; cuenta el acierto o el fallo"""
+        try:
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE llm_cache
+                    SET hits = hits + 1, last_hit_at = NOW()
+                    WHERE key = %s AND expires_at > NOW()
+                    RETURNING response, cost_usd, generation_ms
+                """, (key,))
+                row = cur.fetchone()
+                conn.commit()
+        except Exception as e:
+            print(f"Error reading LLM cache: {str(e)}")
+            with self._lock:
+                self._site_stats(call_site)['errors'] += 1
+            return None
+
+        with self._lock:
+            stats = self._site_stats(call_site)
+            if row is None:
+                stats['misses'] += 1
+                return None
+            response, cost_usd, generation_ms = row
+            stats['hits'] += 1
+            stats['cost_saved_usd'] += cost_usd or 0.0
+            stats['time_saved_ms'] += generation_ms or 0.0
+        return response
+
+    def put(self, call_site: str, key: str, model: str, response: str,
+            usage: Optional[Dict] = None, generation_ms: float = 0.0):
+        """Guardar una respuesta recién generada"""
+        usage = usage or {}
+        cost_usd = estimate_cost(model, usage)
+        with self._lock:
+            self._site_stats(call_site)['cost_spent_usd'] += cost_usd
+            self._puts += 1
+            evict = self._puts % self.evict_every == 0
+        try:
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO llm_cache (key, call_site, model, response, prompt_tokens,
+                                           completion_tokens, cost_usd, generation_ms, expires_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW() + make_interval(secs => %s))
+                    ON CONFLICT (key) DO UPDATE SET
+                        response = EXCLUDED.response,
+                        cost_usd = EXCLUDED.cost_usd,
+                        generation_ms = EXCLUDED.generation_ms,
+                        expires_at = EXCLUDED.expires_at
+                """, (key, call_site, model, response, usage.get('prompt_tokens', 0),
+                      usage.get('completion_tokens', 0), cost_usd, generation_ms,
+                      self.ttl(call_site)))
+                conn.commit()
+            if evict:
+                self.evict()
+        except Exception as e:
+            print(f"Error writing LLM cache: {str(e)}")
+
+    def evict(self) -> int:
+        """Borrar las caducadas y, por encima de max_entries, las usadas hace más tiempo"""
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM llm_cache WHERE expires_at <= NOW()")
+            removed = cur.rowcount
+            cur.execute("""
+                DELETE FROM llm_cache
+                WHERE key IN (
+                    SELECT key FROM llm_cache
+                    ORDER BY COALESCE(last_hit_at, created_at) DESC
+                    OFFSET %s
+                )
+            """, (self.max_entries,))
+            removed += cur.rowcount
+            conn.commit()
+        return removed
+
+    def get_or_create(self, call_site: str, request: Dict,
+                      create: Callable[[], Tuple[str, Dict]], context: Any = None) -> str:
+        """Devolver la respuesta guardada o generarla con create() y guardarla
+
+        create devuelve (texto, consumo de tokens); las grabaciones antiguas del
+        DataRecorder traen solo el texto. Si falla no se guarda nada.
+        """
+        key = self.key(call_site, request, context)
+        cached = self.get(call_site, key)
+        if cached is not None:
+            return cached
+
+        started = time.perf_counter()
+        result = create()
+        response, usage = result if isinstance(result, tuple) else (result, {})
+        self.put(call_site, key, request.get('model', ''), response, usage,
+                 (time.perf_counter() - started) * 1000)
+        return response
+
+    def stream(self, call_site: str, request: Dict, create: Callable[[], Tuple[str, Dict]],
+               stream_create: Optional[Callable[[Dict], Iterator[str]]] = None,
+               context: Any = None, started: Optional[float] = None,
+               timing: Optional[Dict] = None) -> Iterator[str]:
+        """Como get_or_create, pero entregando el texto por fragmentos según llega
+
+        stream_create(usage) devuelve los fragmentos y deja el consumo de tokens en
+        usage; sin él se usa create() y el texto llega en un único fragmento. started
+        (perf_counter) marca desde cuándo se mide el primer fragmento: quien llama lo
+        fija antes de preparar el prompt para medir la espera que percibe el usuario.
+        timing recibe ttft_ms, total_ms y cached. Una respuesta interrumpida o fallida
+        no se guarda.
+        """
+        started = started or time.perf_counter()
+        timing = timing if timing is not None else {}
+        key = self.key(call_site, request, context)
+        cached = self.get(call_site, key)
+        if cached is not None:
+            self._record_latency(call_site, started, time.perf_counter(), True, timing)
+            yield cached
+            return
+
+        requested = time.perf_counter()
+        first_chunk = None
+        chunks = []
+        usage: Dict = {}
+        if stream_create is None:
+            result = create()
+            text, usage = result if isinstance(result, tuple) else (result, {})
+            fragments = [text]
+        else:
+            fragments = stream_create(usage)
+        for fragment in fragments:
+            if not fragment:
+                continue
+            if first_chunk is None:
+                first_chunk = time.perf_counter()
+            chunks.append(fragment)
+            yield fragment
+
+        self.put(call_site, key, request.get('model', ''), ''.join(chunks), usage,
+                 (time.perf_counter() - requested) * 1000)
+        self._record_latency(call_site, started, first_chunk, False, timing)
+
+    def _record_latency(self, call_site: str, started: float, first_chunk: Optional[float],
+                        cached: bool, timing: Dict):
+        finished = time.perf_counter()
+        ttft_ms = ((first_chunk or finished) - started) * 1000
+        total_ms = (finished - started) * 1000
+        timing.update(ttft_ms=ttft_ms, total_ms=total_ms, cached=cached)
+        with self._lock:
+            self._latencies.setdefault(call_site, deque(maxlen=500)).append((ttft_ms, total_ms, cached))
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """Tiempo hasta el primer fragmento frente al de la respuesta completa, por punto de llamada"""
+        def percentile(values, q):
+            return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+        with self._lock:
+            samples = {site: list(values) for site, values in self._latencies.items()}
+        stats = {}
+        for site, values in samples.items():
+            ttft = sorted(sample[0] for sample in values)
+            total = sorted(sample[1] for sample in values)
+            stats[site] = {
+                'responses': len(values),
+                'cached': sum(1 for sample in values if sample[2]),
+                'ttft_p50_ms': round(percentile(ttft, 0.5), 1),
+                'ttft_p95_ms': round(percentile(ttft, 0.95), 1),
+                'total_p50_ms': round(percentile(total, 0.5), 1),
+                'total_p95_ms': round(percentile(total, 0.95), 1)
+            }
+        return stats
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Aciertos, fallos y coste y tiempo ahorrados por punto de llamada en este proceso"""
+        with self._lock:
+            stats = {site: dict(values) for site, values in self._stats.items()}
+        for values in stats.values():
+            lookups = values['hits'] + values['misses']
+            values['hit_rate'] = values['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def storage_stats(self) -> Dict[str, Dict[str, float]]:
+        """Entradas guardadas y aciertos acumulados por punto de llamada"""
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT call_site, COUNT(*), COALESCE(SUM(hits), 0),
+                       COALESCE(SUM(hits * cost_usd), 0)
+                FROM llm_cache
+                WHERE expires_at > NOW()
+                GROUP BY call_site
+            """)
+            return {
+                call_site: {'entries': entries, 'hits': hits, 'cost_saved_usd': saved}
+                for call_site, entries, hits, saved in cur.fetchall()
+            }
+
+# Caché compartido por el proceso
+llm_cache = LLMCache()
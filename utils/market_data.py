@@ -1,16 +1,22 @@
-import yfinance as yf
 import pandas as pd
 from datetime import datetime, timedelta
+from .shared_cache import shared_cache
+from .data_sources import fetch_info, fetch_history
+from .provider_router import quote_router
 
 class MarketData:
-    def __init__(self):
+    def __init__(self, cache=shared_cache, router=quote_router):
         self.sp500_symbol = "^GSPC"
+        self.cache = cache
+        self.router = router
     
     def get_market_return(self) -> float:
         """Get S&P 500 daily return"""
         try:
-            sp500 = yf.Ticker(self.sp500_symbol)
-            hist = sp500.history(period="2d")
+            hist = self.cache.get_or_load(
+                'history', (self.sp500_symbol, '2d'),
+                lambda: fetch_history(self.sp500_symbol, period="2d")
+            )
             if len(hist) >= 2:
                 yesterday_close = hist['Close'].iloc[-2]
                 today_close = hist['Close'].iloc[-1]
@@ -20,21 +26,41 @@ class MarketData:
             print(f"Error getting market return: {str(e)}")
             return 0.0
     
+    def get_quote(self, symbol: str) -> dict:
+        """Get price, change, volume and currency from the fastest healthy provider"""
+        quote = self.cache.get_or_load('live_quote', symbol, lambda: self.router.get_quote(symbol))
+        return {**quote, 'timestamp': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+    def get_fundamental_data(self, symbol: str) -> dict:
+        """Get slow-moving fundamentals (market cap, P/E...) from a long-TTL cache"""
+        def load():
+            info = self.cache.get_or_load('info', symbol, lambda: fetch_info(symbol))
+            return {
+                'market_cap': info.get('marketCap', 0),
+                'pe_ratio': info.get('forwardPE', 0.0),
+                'trailing_pe': info.get('trailingPE', 0.0),
+                'price_to_book': info.get('priceToBook', 0.0),
+                'profit_margin': info.get('profitMargins', 0.0),
+                'dividend_yield': info.get('dividendYield', 0.0),
+                'sector': info.get('sector', '')
+            }
+
+        return self.cache.get_or_load('fundamentals', symbol, load)
+
     def get_stock_data(self, symbol: str) -> dict:
-        """Get detailed stock data with real-time price"""
+        """Get a lean real-time quote plus cached fundamentals"""
         try:
-            stock = yf.Ticker(symbol)
-            info = stock.info
-            live_price = stock.history(period='1d', interval='1m').iloc[-1]['Close']
+            quote = self.get_quote(symbol)
+            fundamentals = self.get_fundamental_data(symbol)
             
             return {
-                'price': live_price,
-                'change': info.get('regularMarketChangePercent', 0.0),
-                'volume': info.get('regularMarketVolume', 0),
-                'market_cap': info.get('marketCap', 0),
-                'pe_ratio': info.get('forwardPE', 0.0),
-                'currency': info.get('currency', 'USD'),
-                'timestamp': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+                'price': quote['price'],
+                'change': quote['change'],
+                'volume': quote['volume'],
+                'market_cap': fundamentals['market_cap'],
+                'pe_ratio': fundamentals['pe_ratio'],
+                'currency': quote['currency'],
+                'timestamp': quote['timestamp']
             }
         except Exception as e:
             raise Exception(f"Error fetching stock data: {str(e)}")
@@ -42,7 +68,7 @@ class MarketData:
     def get_real_time_quote(self, symbol: str) -> str:
         """Get real-time quote with formatted output"""
         try:
-            data = self.get_stock_data(symbol)
+            data = self.get_quote(symbol)
             return f"${data['price']:.2f} {data['currency']} ({data['change']:.2f}%) - Actualizado: {data['timestamp']}"
         except Exception as e:
             return f"Error obteniendo cotización: {str(e)}"
@@ -0,0 +1,315 @@
+import threading
+from typing import List
+from .db import connection
+
+# Clave del bloqueo consultivo que serializa las migraciones entre procesos
+MIGRATION_LOCK_KEY = 0x42524B52
+
+# Migraciones en orden: (versión, descripción, sentencias). Nunca se editan una vez
+# publicadas; cualquier cambio de esquema se añade como una versión nueva.
+MIGRATIONS = [
+    (1, "esquema inicial", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            name VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP,
+            role VARCHAR(50) DEFAULT 'user',
+            email_verified BOOLEAN DEFAULT FALSE,
+            verification_token VARCHAR(255),
+            remember_token VARCHAR(255),
+            token_expires_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS portfolios (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            name VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS positions (
+            id SERIAL PRIMARY KEY,
+            portfolio_id INTEGER REFERENCES portfolios(id),
+            symbol VARCHAR(20),
+            shares FLOAT,
+            cost_basis FLOAT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS launch_phases (
+            id SERIAL PRIMARY KEY,
+            phase_name VARCHAR(50) NOT NULL,
+            is_active BOOLEAN DEFAULT false,
+            start_date TIMESTAMP,
+            end_date TIMESTAMP,
+            max_users INTEGER,
+            current_users INTEGER DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS waitlist (
+            id SERIAL PRIMARY KEY,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status VARCHAR(50) DEFAULT 'pending',
+            invitation_sent BOOLEAN DEFAULT false,
+            invitation_date TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS phase_metrics (
+            id SERIAL PRIMARY KEY,
+            phase_name VARCHAR(50) NOT NULL,
+            metric_name VARCHAR(50) NOT NULL,
+            metric_value FLOAT,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS price_history (
+            symbol VARCHAR(20) NOT NULL,
+            date DATE NOT NULL,
+            open FLOAT,
+            high FLOAT,
+            low FLOAT,
+            close FLOAT,
+            volume BIGINT,
+            PRIMARY KEY (symbol, date)
+        )
+        """
+    ]),
+    (2, "carteras y posiciones únicas", [
+        # Las versiones anteriores de save() duplicaban carteras: conservar la más reciente
+        """
+        DELETE FROM positions
+        WHERE portfolio_id IN (
+            SELECT p.id FROM portfolios p
+            JOIN portfolios newer
+              ON newer.user_id = p.user_id AND newer.name = p.name AND newer.id > p.id
+        )
+        """,
+        """
+        DELETE FROM portfolios p
+        USING portfolios newer
+        WHERE newer.user_id = p.user_id AND newer.name = p.name AND newer.id > p.id
+        """,
+        """
+        DELETE FROM positions p
+        USING positions newer
+        WHERE newer.portfolio_id = p.portfolio_id AND newer.symbol = p.symbol AND newer.id > p.id
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS portfolios_user_name_key ON portfolios (user_id, name)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS positions_portfolio_symbol_key ON positions (portfolio_id, symbol)"
+    ]),
+    (3, "tablas de monetización", [
+        """
+        CREATE TABLE IF NOT EXISTS conversions (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            event_type VARCHAR(50) NOT NULL,
+            value FLOAT DEFAULT 0,
+            source VARCHAR(100),
+            metadata JSONB DEFAULT '{}',
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS memberships (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            plan_type VARCHAR(50) NOT NULL,
+            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_date TIMESTAMP,
+            status VARCHAR(50) DEFAULT 'active'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS premium_ads (
+            id SERIAL PRIMARY KEY,
+            title VARCHAR(255) NOT NULL,
+            description TEXT,
+            category VARCHAR(100),
+            target_audience VARCHAR(100),
+            active BOOLEAN DEFAULT true,
+            conversion_rate FLOAT DEFAULT 0
+        )
+        """
+    ]),
+    (4, "nombre y notas en la lista de espera", [
+        "ALTER TABLE waitlist ADD COLUMN IF NOT EXISTS name VARCHAR(255)",
+        "ALTER TABLE waitlist ADD COLUMN IF NOT EXISTS notes TEXT"
+    ]),
+    (5, "índices de las consultas frecuentes", [
+        # users.email ya tiene índice por su restricción UNIQUE y positions.portfolio_id
+        # es la primera columna de positions_portfolio_symbol_key
+        "CREATE INDEX IF NOT EXISTS users_remember_token_idx ON users (remember_token)",
+        "CREATE INDEX IF NOT EXISTS waitlist_status_idx ON waitlist (status, registration_date)",
+        "CREATE INDEX IF NOT EXISTS memberships_user_status_idx ON memberships (user_id, status, start_date)",
+        "CREATE INDEX IF NOT EXISTS conversions_timestamp_idx ON conversions (timestamp)"
+    ]),
+    (6, "alertas persistentes", [
+        """
+        CREATE TABLE IF NOT EXISTS alerts (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            symbol VARCHAR(20) NOT NULL,
+            alert_type VARCHAR(50) NOT NULL,
+            condition VARCHAR(10) NOT NULL,
+            target_value FLOAT NOT NULL,
+            user_email VARCHAR(255),
+            active BOOLEAN DEFAULT true,
+            triggered BOOLEAN DEFAULT false,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_check TIMESTAMP,
+            triggered_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS alerts_user_idx ON alerts (user_id, created_at)",
+        # El evaluador solo recorre las alertas pendientes
+        "CREATE INDEX IF NOT EXISTS alerts_pending_idx ON alerts (symbol) WHERE active AND NOT triggered",
+        """
+        CREATE TABLE IF NOT EXISTS alert_events (
+            id SERIAL PRIMARY KEY,
+            alert_id INTEGER REFERENCES alerts(id) ON DELETE CASCADE,
+            user_id INTEGER REFERENCES users(id),
+            symbol VARCHAR(20) NOT NULL,
+            observed_value FLOAT,
+            target_value FLOAT,
+            condition VARCHAR(10),
+            triggered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS alert_events_alert_idx ON alert_events (alert_id)"
+    ]),
+    (7, "métrica de las alertas de volumen e indicadores", [
+        # NULL en las alertas existentes: se usa la métrica predeterminada de su tipo
+        "ALTER TABLE alerts ADD COLUMN IF NOT EXISTS metric VARCHAR(30)"
+    ]),
+    (8, "bandeja de salida de notificaciones", [
+        """
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id SERIAL PRIMARY KEY,
+            recipient VARCHAR(255) NOT NULL,
+            kind VARCHAR(30) NOT NULL DEFAULT 'general',
+            subject VARCHAR(255) NOT NULL,
+            body TEXT NOT NULL,
+            digest_key VARCHAR(100),
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS notification_outbox_due_idx ON notification_outbox (next_attempt_at) WHERE status = 'pending'",
+        # Búsqueda del aviso más antiguo de cada resumen pendiente
+        "CREATE INDEX IF NOT EXISTS notification_outbox_digest_idx ON notification_outbox (recipient, digest_key, created_at) WHERE status = 'pending'"
+    ]),
+    (9, "rearme de alertas con histéresis y enfriamiento", [
+        "ALTER TABLE alerts ADD COLUMN IF NOT EXISTS rearm BOOLEAN NOT NULL DEFAULT false",
+        "ALTER TABLE alerts ADD COLUMN IF NOT EXISTS hysteresis FLOAT NOT NULL DEFAULT 0",
+        "ALTER TABLE alerts ADD COLUMN IF NOT EXISTS cooldown_minutes INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE alerts ADD COLUMN IF NOT EXISTS armed_at TIMESTAMP",
+        "ALTER TABLE alerts ADD COLUMN IF NOT EXISTS trigger_count INTEGER NOT NULL DEFAULT 0",
+        # Las alertas disparadas que esperan rearme también las recorre el evaluador
+        "CREATE INDEX IF NOT EXISTS alerts_rearm_idx ON alerts (symbol) WHERE active AND triggered AND rearm"
+    ]),
+    (10, "caché de respuestas de OpenAI", [
+        """
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key CHAR(64) PRIMARY KEY,
+            call_site VARCHAR(50) NOT NULL,
+            model VARCHAR(50),
+            response TEXT NOT NULL,
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            cost_usd FLOAT DEFAULT 0,
+            generation_ms FLOAT DEFAULT 0,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_hit_at TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS llm_cache_expires_idx ON llm_cache (expires_at)",
+        "CREATE INDEX IF NOT EXISTS llm_cache_recency_idx ON llm_cache ((COALESCE(last_hit_at, created_at)))"
+    ]),
+    (11, "latido del evaluador de alertas", [
+        """
+        CREATE TABLE IF NOT EXISTS worker_heartbeats (
+            name VARCHAR(50) PRIMARY KEY,
+            interval_seconds FLOAT NOT NULL,
+            last_seen TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    ]),
+    (12, "plazo de los envíos en curso de la bandeja de salida", [
+        # Los lotes en envío ('sending') guardan su plazo en next_attempt_at; al vencer se reclaman
+        "CREATE INDEX IF NOT EXISTS notification_outbox_sending_idx ON notification_outbox (next_attempt_at) WHERE status = 'sending'"
+    ])
+]
+
+_migrated = False
+_migrate_lock = threading.Lock()
+
+def run_migrations() -> List[int]:
+    """Aplicar las migraciones pendientes; devuelve las versiones aplicadas en esta llamada"""
+    global _migrated
+    with _migrate_lock:
+        if _migrated:
+            return []
+
+        applied_now = []
+        with connection() as conn:
+            with conn.cursor() as cur:
+                # Varios procesos pueden arrancar a la vez: solo uno aplica cada versión
+                cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS schema_migrations (
+                            version INTEGER PRIMARY KEY,
+                            name VARCHAR(255),
+                            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    cur.execute("SELECT version FROM schema_migrations")
+                    applied = {row[0] for row in cur.fetchall()}
+                conn.commit()
+
+                for version, name, statements in MIGRATIONS:
+                    if version in applied:
+                        continue
+                    # Cada versión se aplica en su propia transacción junto con su registro
+                    with conn.cursor() as cur:
+                        for statement in statements:
+                            cur.execute(statement)
+                        cur.execute(
+                            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                            (version, name)
+                        )
+                    conn.commit()
+                    applied_now.append(version)
+                    print(f"Migración {version} aplicada: {name}")
+            finally:
+                conn.rollback()
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+                conn.commit()
+
+        _migrated = True
+        return applied_now
+
+def current_version() -> int:
+    """Última versión de esquema registrada en la base de datos"""
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        return cur.fetchone()[0]
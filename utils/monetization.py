@@ -2,13 +2,12 @@ import streamlit as st
 import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
-import psycopg2
 import os
 import pandas as pd
+from .db import connection
 
 class MonetizationManager:
     def __init__(self):
-        self.conn = psycopg2.connect(os.environ['DATABASE_URL'])
         self.membership_plans = {
             "basic": {
                 "name": "Plan Básico",
@@ -46,12 +45,12 @@ class MonetizationManager:
     def track_conversion(self, user_id: int, event_type: str, value: float, source: str, metadata: Dict = None):
         """Registrar una conversión"""
         try:
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO conversions (user_id, event_type, value, source, metadata)
                     VALUES (%s, %s, %s, %s, %s)
                 """, (user_id, event_type, value, source, json.dumps(metadata or {})))
-                self.conn.commit()
+                conn.commit()
             return True
         except Exception as e:
             st.error(f"Error tracking conversion: {str(e)}")
@@ -60,7 +59,7 @@ class MonetizationManager:
     def get_user_membership(self, user_id: int) -> Dict:
         """Obtener membresía actual del usuario"""
         try:
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 cur.execute("""
                     SELECT plan_type, start_date, end_date, status
                     FROM memberships
@@ -126,7 +125,7 @@ class MonetizationManager:
     def render_premium_ads(self, user_data: Dict):
         """Renderizar anuncios premium basados en el perfil del usuario"""
         try:
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 cur.execute("""
                     SELECT id, title, description, category, target_audience
                     FROM premium_ads
@@ -170,7 +169,7 @@ class MonetizationManager:
     def get_conversion_metrics(self) -> Dict:
         """Obtener métricas de conversión"""
         try:
-            with self.conn.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 cur.execute("""
                     SELECT 
                         COUNT(*) as total_conversions,
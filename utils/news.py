@@ -3,41 +3,55 @@ import requests
 from datetime import datetime, timedelta
 import streamlit as st
 import json
+from .rate_limiter import scheduler, RateLimitExceeded, INTERACTIVE
+from .replay import recorder
 
 class NewsService:
     def __init__(self):
         self.alpha_vantage_key = os.getenv("ALPHA_VANTAGE_API_KEY")
-        if not self.alpha_vantage_key:
+        if not self.alpha_vantage_key and not recorder.offline:
             raise ValueError("Alpha Vantage API key not found")
 
     @st.cache_data(ttl=300)  # Cache por 5 minutos
-    def _fetch_news(_self, limit: int = 10) -> list:
+    def _fetch_news(_self, limit: int = 10, _priority: int = INTERACTIVE) -> list:
         """Función interna para obtener noticias (compatible con cache)"""
+        # Esperar turno en el limitador de Alpha Vantage; si la espera se agota
+        # se lanza RateLimitExceeded, que st.cache_data no guarda en caché
+        if not recorder.offline:
+            scheduler.acquire('alpha_vantage', _priority)
         try:
             # Construir URL con parámetros específicos
             url = "https://www.alphavantage.co/query"
             params = {
                 "function": "NEWS_SENTIMENT",
-                "apikey": _self.alpha_vantage_key,
                 "topics": "financial_markets",  # Simplificado a un solo tema
                 "sort": "LATEST"
             }
 
-            # Realizar la petición con timeout
-            response = requests.get(url, params=params, timeout=10)
+            def request():
+                # Realizar la petición con timeout
+                response = requests.get(url, params={**params, "apikey": _self.alpha_vantage_key}, timeout=10)
 
-            # Verificar si la respuesta es exitosa
-            if response.status_code != 200:
-                return []
+                # Verificar si la respuesta es exitosa
+                if response.status_code != 200:
+                    return None
+
+                # Parsear la respuesta JSON
+                try:
+                    return response.json()
+                except json.JSONDecodeError:
+                    return None
 
-            # Parsear la respuesta JSON
-            try:
-                data = response.json()
-            except json.JSONDecodeError:
+            data = recorder.call('alpha_vantage.news', params, request)
+            if data is None:
                 return []
 
-            # Verificar mensajes de la API
-            if 'Information' in data or 'Note' in data or 'feed' not in data:
+            # Mensajes de limitación de la API: pausar el proveedor y avisar al llamador
+            if 'Information' in data or 'Note' in data:
+                scheduler.report_throttled('alpha_vantage')
+                raise RateLimitExceeded('alpha_vantage', 60)
+
+            if 'feed' not in data:
                 return []
 
             # Procesar las noticias
@@ -64,6 +78,8 @@ class NewsService:
 
             return news_items
 
+        except RateLimitExceeded:
+            raise
         except requests.exceptions.Timeout:
             return []
         except requests.exceptions.RequestException:
@@ -71,6 +87,10 @@ class NewsService:
         except Exception:
             return []
 
-    def get_market_news(self, limit: int = 10) -> list:
+    def get_market_news(self, limit: int = 10, priority: int = INTERACTIVE) -> list:
         """Método público para obtener noticias"""
-        return self._fetch_news(limit)
\ No newline at end of file
+        try:
+            return self._fetch_news(limit, priority)
+        except RateLimitExceeded as e:
+            st.warning(f"Noticias no disponibles temporalmente: {str(e)}")
+            return []
\ No newline at end of file
@@ -0,0 +1,383 @@
+"""Bandeja de salida de correos
+
+Las páginas y el evaluador de alertas solo insertan filas en notification_outbox;
+un hilo de fondo (OutboxSender) las envía por lotes, agrupa en un resumen los avisos
+seguidos de un mismo destinatario y reintenta los fallos con espera creciente.
+
+Con SMTP_HOST=memory los correos se guardan en MemorySMTP.sent en lugar de enviarse.
+"""
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from email.message import EmailMessage
+from typing import Dict, Iterable, List, Optional
+from psycopg2.extras import execute_values
+from .db import connection
+
+DEFAULT_SENDER = "noreply@broker-ia.com"
+
+def enqueue(recipient: str, subject: str, body: str, kind: str = 'general',
+            digest_key: Optional[str] = None, conn=None) -> int:
+    """Guardar un correo en la bandeja de salida sin enviarlo
+
+    Con conn se inserta en la transacción del llamador, así el correo solo existe si
+    esa transacción se confirma. Los correos con el mismo digest_key y destinatario
+    se envían juntos en un resumen.
+    """
+    query = """
+        INSERT INTO notification_outbox (recipient, kind, subject, body, digest_key)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING id
+    """
+    params = (recipient, kind, subject, body, digest_key)
+    if conn is not None:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchone()[0]
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(query, params)
+        message_id = cur.fetchone()[0]
+        conn.commit()
+    return message_id
+
+def enqueue_many(messages: Iterable[tuple], conn) -> int:
+    """Encolar varias tuplas (recipient, kind, subject, body, digest_key) en la transacción de conn"""
+    messages = list(messages)
+    if messages:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO notification_outbox (recipient, kind, subject, body, digest_key)
+                VALUES %s
+            """, messages)
+    return len(messages)
+
+class MemorySMTP:
+    """Sustituto de smtplib.SMTP que guarda los mensajes en memoria
+
+    fail_next hace fallar los siguientes envíos para probar los reintentos.
+    """
+
+    sent: List[EmailMessage] = []
+    fail_next = 0
+    _lock = threading.Lock()
+
+    def __init__(self, host: str = '', port: int = 0, timeout: Optional[float] = None):
+        self.closed = False
+
+    def starttls(self, *args, **kwargs):
+        pass
+
+    def login(self, user: str, password: str):
+        pass
+
+    def noop(self):
+        if self.closed:
+            raise smtplib.SMTPServerDisconnected("Conexión cerrada")
+        return 250, b'OK'
+
+    def send_message(self, msg: EmailMessage):
+        with MemorySMTP._lock:
+            if MemorySMTP.fail_next > 0:
+                MemorySMTP.fail_next -= 1
+                raise smtplib.SMTPRecipientsRefused({msg['To']: (450, b'Fallo simulado')})
+            MemorySMTP.sent.append(msg)
+        return {}
+
+    def quit(self):
+        self.closed = True
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.sent = []
+            cls.fail_next = 0
+
+class SMTPPool:
+    """Conexiones SMTP reutilizadas entre lotes
+
+    Una conexión ociosa se descarta si lleva más de idle_timeout segundos sin usarse
+    o si no responde a NOOP; una conexión que falla a mitad de lote no se devuelve.
+    """
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None,
+                 user: Optional[str] = None, password: Optional[str] = None,
+                 size: int = 2, idle_timeout: float = 60.0, timeout: float = 10.0):
+        self.host = host if host is not None else os.getenv('SMTP_HOST', '')
+        self.port = port or int(os.getenv('SMTP_PORT', 587))
+        self.user = user if user is not None else os.getenv('SMTP_USER')
+        self.password = password if password is not None else os.getenv('SMTP_PASSWORD')
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.stats = {'connects': 0, 'reuses': 0, 'discarded': 0}
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host)
+
+    def _connect(self):
+        if self.host == 'memory':
+            smtp = MemorySMTP()
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.port != 25:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password or '')
+        self.stats['connects'] += 1
+        return smtp
+
+    def _close(self, smtp):
+        self.stats['discarded'] += 1
+        try:
+            smtp.quit()
+        except Exception:
+            pass
+
+    def _take_idle(self):
+        while True:
+            try:
+                smtp, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if time.monotonic() - last_used > self.idle_timeout:
+                self._close(smtp)
+                continue
+            try:
+                if smtp.noop()[0] == 250:
+                    self.stats['reuses'] += 1
+                    return smtp
+            except Exception:
+                pass
+            self._close(smtp)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        smtp = None
+        try:
+            smtp = self._take_idle() or self._connect()
+            yield smtp
+        except Exception:
+            if smtp is not None:
+                self._close(smtp)
+            raise
+        else:
+            self._idle.put((smtp, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                smtp, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(smtp)
+
+class OutboxSender:
+    """Vacía notification_outbox por lotes
+
+    Cada lote se reclama con FOR UPDATE SKIP LOCKED y se marca como 'sending' con un
+    plazo (lease) antes de hablar con el servidor SMTP: la transacción se confirma y
+    no se retienen bloqueos durante el envío. Si el proceso muere a mitad de lote, los
+    mensajes vuelven a poder reclamarse cuando vence el plazo. Los avisos con digest_key esperan a que el
+    más antiguo de su grupo tenga digest_window segundos y se envían juntos.
+    Solo los rechazos de un mensaje gastan sus max_attempts; si falla la conexión el
+    lote se aplaza sin contar intento, así un corte largo del servidor no los descarta.
+    """
+
+    def __init__(self, pool: Optional[SMTPPool] = None, batch_size: int = 100,
+                 digest_window: float = 60.0, max_attempts: int = 6,
+                 base_delay: float = 30.0, max_delay: float = 3600.0,
+                 interval: float = 10.0, sender: Optional[str] = None,
+                 lease: float = 300.0):
+        self.pool = pool or SMTPPool()
+        self.batch_size = batch_size
+        self.digest_window = digest_window
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.interval = interval
+        self.lease = lease
+        self.sender = sender or os.getenv('SMTP_FROM', DEFAULT_SENDER)
+        self.totals = {'sent': 0, 'digests': 0, 'retried': 0, 'failed': 0, 'deferred': 0}
+        # Lotes seguidos que no han podido usar la conexión SMTP
+        self._outages = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _claim(self, cur) -> List[tuple]:
+        """Marcar un lote como 'sending' hasta que venza el plazo; next_attempt_at guarda ese plazo"""
+        cur.execute("""
+            WITH claimed AS (
+                SELECT o.id
+                FROM notification_outbox o
+                WHERE o.next_attempt_at <= NOW()
+                  AND (o.status = 'sending' OR (o.status = 'pending' AND (o.digest_key IS NULL OR EXISTS (
+                      SELECT 1 FROM notification_outbox oldest
+                      WHERE oldest.recipient = o.recipient AND oldest.digest_key = o.digest_key
+                        AND oldest.status = 'pending'
+                        AND oldest.created_at <= NOW() - make_interval(secs => %s)
+                  ))))
+                ORDER BY o.id
+                LIMIT %s
+                FOR UPDATE OF o SKIP LOCKED
+            )
+            UPDATE notification_outbox n
+            SET status = 'sending', next_attempt_at = NOW() + make_interval(secs => %s)
+            FROM claimed
+            WHERE n.id = claimed.id
+            RETURNING n.id, n.recipient, n.subject, n.body, n.digest_key, n.attempts
+        """, (self.digest_window, self.batch_size, self.lease))
+        return sorted(cur.fetchall())
+
+    def _group(self, rows: List[tuple]) -> List[Dict]:
+        """Un correo por mensaje suelto y uno por destinatario y digest_key"""
+        groups: Dict[tuple, Dict] = {}
+        for message_id, recipient, subject, body, digest_key, attempts in rows:
+            key = (recipient, digest_key) if digest_key else (recipient, message_id)
+            group = groups.setdefault(key, {'recipient': recipient, 'ids': [], 'subjects': [],
+                                            'bodies': [], 'attempts': 0})
+            group['ids'].append(message_id)
+            group['subjects'].append(subject)
+            group['bodies'].append(body.strip())
+            group['attempts'] = max(group['attempts'], attempts)
+        return list(groups.values())
+
+    def _render(self, group: Dict) -> EmailMessage:
+        msg = EmailMessage()
+        msg['From'] = self.sender
+        msg['To'] = group['recipient']
+        if len(group['ids']) == 1:
+            msg['Subject'] = group['subjects'][0]
+            msg.set_content(group['bodies'][0])
+        else:
+            msg['Subject'] = f"BROKER.IA: {len(group['ids'])} avisos nuevos"
+            msg.set_content("\n\n---\n\n".join(group['bodies']))
+        return msg
+
+    def _retry_delay(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** attempts)
+        # Reparto aleatorio para que los reintentos de un corte no lleguen todos a la vez
+        return delay * random.uniform(0.5, 1.0)
+
+    def drain_once(self) -> Dict:
+        """Enviar un lote; devuelve cuántos mensajes se han enviado, reintentado o descartado"""
+        stats = {'claimed': 0, 'emails': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'deferred': 0}
+        with connection() as conn:
+            with conn.cursor() as cur:
+                rows = self._claim(cur)
+            conn.commit()
+        stats['claimed'] = len(rows)
+        if not rows:
+            return stats
+
+        pending = self._group(rows)
+        sent_ids: List[int] = []
+        failures: List[tuple] = []
+        deferred: List[int] = []
+        error = None
+        try:
+            with self.pool.connection() as smtp:
+                while pending:
+                    group = pending[0]
+                    try:
+                        smtp.send_message(self._render(group))
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError,
+                            smtplib.SMTPSenderRefused, ValueError) as e:
+                        # El servidor rechaza este correo (o no se puede componer); la
+                        # conexión sigue sirviendo
+                        failures.append((group, str(e)))
+                    else:
+                        sent_ids.extend(group['ids'])
+                        stats['emails'] += 1
+                        if len(group['ids']) > 1:
+                            self.totals['digests'] += 1
+                    pending.pop(0)
+            self._outages = 0
+        except Exception as e:
+            # Conexión caída o imposible: no es culpa de los mensajes, así que lo que
+            # quede del lote se aplaza sin gastar intentos, con espera creciente por corte
+            error = str(e)
+            deferred = [message_id for group in pending for message_id in group['ids']]
+
+        # Solo se tocan las filas que siguen reclamadas por este lote
+        with connection() as conn:
+            with conn.cursor() as cur:
+                if sent_ids:
+                    cur.execute("""
+                        UPDATE notification_outbox
+                        SET status = 'sent', sent_at = NOW(), last_error = NULL
+                        WHERE id = ANY(%s) AND status = 'sending'
+                    """, (sent_ids,))
+                for group, reason in failures:
+                    attempts = group['attempts'] + 1
+                    status = 'failed' if attempts >= self.max_attempts else 'pending'
+                    cur.execute("""
+                        UPDATE notification_outbox
+                        SET attempts = attempts + 1, last_error = %s, status = %s,
+                            next_attempt_at = NOW() + make_interval(secs => %s)
+                        WHERE id = ANY(%s) AND status = 'sending'
+                    """, (reason[:1000], status, self._retry_delay(group['attempts']), group['ids']))
+                    stats['failed' if status == 'failed' else 'retried'] += len(group['ids'])
+                if deferred:
+                    cur.execute("""
+                        UPDATE notification_outbox
+                        SET status = 'pending', last_error = %s,
+                            next_attempt_at = NOW() + make_interval(secs => %s)
+                        WHERE id = ANY(%s) AND status = 'sending'
+                    """, (error[:1000], self._retry_delay(self._outages), deferred))
+                    stats['deferred'] = len(deferred)
+                    self._outages += 1
+            conn.commit()
+
+        stats['sent'] = len(sent_ids)
+        for key in ('sent', 'retried', 'failed', 'deferred'):
+            self.totals[key] += stats[key]
+        return stats
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # Mientras haya lotes completos se sigue vaciando sin esperar
+                while not self._stop.is_set() and self.drain_once()['claimed'] >= self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"Error sending notifications: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Arrancar el envío periódico en un hilo de fondo"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.pool.close_all()
+
+_sender = None
+_sender_lock = threading.Lock()
+
+def start_outbox_sender(**kwargs) -> Optional[OutboxSender]:
+    """Arrancar (una sola vez por proceso) el envío de la bandeja de salida
+
+    Sin SMTP_HOST no se arranca: los correos se quedan pendientes en la tabla.
+    """
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            sender = OutboxSender(**kwargs)
+            if not sender.pool.configured:
+                return None
+            sender.start()
+            _sender = sender
+        return _sender
@@ -1,99 +1,132 @@
-import yfinance as yf
 import pandas as pd
-import plotly.graph_objects as go
-import psycopg2
-import os
+from psycopg2.extras import execute_values
+import threading
+import time
 from datetime import datetime, timedelta
+from typing import Optional
+from .quote_engine import QuoteEngine
+from .valuation import PortfolioSnapshot, empty_snapshot, value_positions
+from .history_store import get_history_store
+from .shared_cache import shared_cache
+from .db import connection
 
 class Portfolio:
+    quote_engine = QuoteEngine()
+
+    # Contadores de reutilización de valoraciones, compartidos por todas las carteras
+    snapshot_stats = {'hits': 0, 'misses': 0}
+    _snapshot_stats_lock = threading.Lock()
+
     def __init__(self, name, user_id=None):
         self.name = name
         self.user_id = user_id
+        self.id = None
+        # Última versión guardada de cada posición: symbol -> (shares, cost_basis)
+        self._persisted = {}
+        self._version = 0
+        self._snapshot = None
         self.positions = pd.DataFrame(columns=['symbol', 'shares', 'cost_basis'])
-        self.conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        
-        # Crear tabla si no existe
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS portfolios (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id),
-                    name VARCHAR(255),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS positions (
-                    id SERIAL PRIMARY KEY,
-                    portfolio_id INTEGER REFERENCES portfolios(id),
-                    symbol VARCHAR(20),
-                    shares FLOAT,
-                    cost_basis FLOAT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            self.conn.commit()
-            
+
+    def _position_rows(self) -> dict:
+        """Posiciones actuales agrupadas por símbolo: symbol -> (shares, cost_basis)"""
+        if self.positions.empty:
+            return {}
+        positions = self.positions.assign(
+            shares=self.positions['shares'].astype(float),
+            cost=self.positions['shares'].astype(float) * self.positions['cost_basis'].astype(float)
+        )
+        grouped = positions.groupby('symbol')[['shares', 'cost']].sum()
+        # Coste medio ponderado si el mismo símbolo aparece en varias filas
+        cost_basis = (grouped['cost'] / grouped['shares']).where(grouped['shares'] != 0, 0.0)
+        return {
+            symbol: (float(shares), float(basis))
+            for symbol, shares, basis in zip(grouped.index, grouped['shares'], cost_basis)
+        }
+
+    def _mark_persisted(self, portfolio_id: int):
+        """Tomar las posiciones actuales como el estado guardado en la base de datos"""
+        self.id = portfolio_id
+        self._persisted = self._position_rows()
+
     def save(self):
-        """Guardar cartera y posiciones en la base de datos"""
+        """Guardar la cartera escribiendo solo las posiciones que han cambiado"""
         try:
-            with self.conn.cursor() as cur:
-                # Guardar o actualizar cartera
-                cur.execute("""
-                    INSERT INTO portfolios (user_id, name)
-                    VALUES (%s, %s)
-                    RETURNING id
-                """, (self.user_id, self.name))
-                portfolio_id = cur.fetchone()[0]
-                
-                # Eliminar posiciones anteriores
-                cur.execute("DELETE FROM positions WHERE portfolio_id = %s", (portfolio_id,))
-                
-                # Guardar nuevas posiciones
-                for _, position in self.positions.iterrows():
+            current = self._position_rows()
+            changed = [
+                (symbol, shares, cost_basis)
+                for symbol, (shares, cost_basis) in current.items()
+                if self._persisted.get(symbol) != (shares, cost_basis)
+            ]
+            removed = [symbol for symbol in self._persisted if symbol not in current]
+
+            with connection() as conn, conn.cursor() as cur:
+                # Sin id conocido la fila puede existir ya: se sincronizan todas sus posiciones
+                full_sync = self.id is None
+                if full_sync:
                     cur.execute("""
+                        INSERT INTO portfolios (user_id, name)
+                        VALUES (%s, %s)
+                        ON CONFLICT (user_id, name) DO UPDATE SET name = EXCLUDED.name
+                        RETURNING id
+                    """, (self.user_id, self.name))
+                    portfolio_id = cur.fetchone()[0]
+                else:
+                    portfolio_id = self.id
+
+                if changed:
+                    execute_values(cur, """
                         INSERT INTO positions (portfolio_id, symbol, shares, cost_basis)
-                        VALUES (%s, %s, %s, %s)
-                    """, (portfolio_id, position['symbol'], position['shares'], position['cost_basis']))
-                
-                self.conn.commit()
+                        VALUES %s
+                        ON CONFLICT (portfolio_id, symbol) DO UPDATE SET
+                            shares = EXCLUDED.shares,
+                            cost_basis = EXCLUDED.cost_basis
+                    """, [(portfolio_id, symbol, shares, cost_basis) for symbol, shares, cost_basis in changed])
+
+                if full_sync:
+                    cur.execute("""
+                        DELETE FROM positions
+                        WHERE portfolio_id = %s AND NOT (symbol = ANY(%s))
+                    """, (portfolio_id, list(current)))
+                elif removed:
+                    cur.execute("""
+                        DELETE FROM positions
+                        WHERE portfolio_id = %s AND symbol = ANY(%s)
+                    """, (portfolio_id, removed))
+
+                conn.commit()
+
+            self.id = portfolio_id
+            self._persisted = current
         except Exception as e:
             print(f"Error saving portfolio: {str(e)}")
-            self.conn.rollback()
             
     @staticmethod
     def load_user_portfolios(user_id):
-        """Cargar todas las carteras de un usuario"""
+        """Cargar todas las carteras de un usuario y sus posiciones en una sola consulta"""
         try:
-            conn = psycopg2.connect(os.environ['DATABASE_URL'])
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT p.id, p.name, pos.symbol, pos.shares, pos.cost_basis
+                    FROM portfolios p
+                    LEFT JOIN positions pos ON pos.portfolio_id = p.id
+                    WHERE p.user_id = %s
+                    ORDER BY p.id, pos.id
+                """, (user_id,))
+                rows = pd.DataFrame(
+                    cur.fetchall(),
+                    columns=['portfolio_id', 'name', 'symbol', 'shares', 'cost_basis']
+                )
+
             portfolios = {}
-            
-            with conn.cursor() as cur:
-                cur.execute("SELECT id, name FROM portfolios WHERE user_id = %s", (user_id,))
-                for portfolio_id, name in cur.fetchall():
-                    portfolio = Portfolio(name, user_id)
-                    
-                    # Cargar posiciones
-                    cur.execute("""
-                        SELECT symbol, shares, cost_basis 
-                        FROM positions 
-                        WHERE portfolio_id = %s
-                    """, (portfolio_id,))
-                    
-                    positions_data = []
-                    for symbol, shares, cost_basis in cur.fetchall():
-                        positions_data.append({
-                            'symbol': symbol,
-                            'shares': shares,
-                            'cost_basis': cost_basis
-                        })
-                    
-                    if positions_data:
-                        portfolio.positions = pd.DataFrame(positions_data)
-                    
-                    portfolios[name] = portfolio
-                    
+            for (portfolio_id, name), group in rows.groupby(['portfolio_id', 'name'], sort=False):
+                portfolio = Portfolio(name, user_id)
+                # El LEFT JOIN devuelve una fila sin símbolo para las carteras vacías
+                positions_data = group.loc[group['symbol'].notna(), ['symbol', 'shares', 'cost_basis']]
+                if not positions_data.empty:
+                    portfolio.positions = positions_data.reset_index(drop=True)
+                portfolio._mark_persisted(int(portfolio_id))
+                portfolios[name] = portfolio
+
             return portfolios
         except Exception as e:
             print(f"Error loading portfolios: {str(e)}")
@@ -103,12 +136,12 @@ class Portfolio:
         """Add a new position or update existing one"""
         try:
             # Verify the symbol exists
-            stock = yf.Ticker(symbol)
-            current_price = stock.info['regularMarketPrice']
+            current_price = self.quote_engine.get_price(symbol)
             
             # Update existing position or add new one
             if symbol in self.positions['symbol'].values:
                 self.positions.loc[self.positions['symbol'] == symbol, 'shares'] += shares
+                self.mark_changed()
             else:
                 new_position = pd.DataFrame({
                     'symbol': [symbol],
@@ -120,60 +153,95 @@ class Portfolio:
         except Exception as e:
             raise Exception(f"Error adding position: {str(e)}")
     
-    def get_positions(self) -> pd.DataFrame:
-        """Get current positions with latest market values"""
+    def get_prices(self) -> pd.Series:
+        """Get latest prices for every position in one batched request"""
         if self.positions.empty:
-            return pd.DataFrame()
-        
-        result = []
-        for _, position in self.positions.iterrows():
-            try:
-                stock = yf.Ticker(position['symbol'])
-                current_price = stock.info['regularMarketPrice']
-                market_value = current_price * position['shares']
-                gain_loss = market_value - (position['cost_basis'] * position['shares'])
-                
-                result.append({
-                    'Symbol': position['symbol'],
-                    'Shares': position['shares'],
-                    'Current Price': current_price,
-                    'Market Value': market_value,
-                    'Gain/Loss': gain_loss,
-                    'Return %': (gain_loss / (position['cost_basis'] * position['shares'])) * 100
-                })
-            except Exception as e:
-                print(f"Error getting position data for {position['symbol']}: {str(e)}")
-                
-        return pd.DataFrame(result)
+            return pd.Series(dtype=float)
+        return self.quote_engine.get_prices(self.positions['symbol'])
+
+    @property
+    def positions(self) -> pd.DataFrame:
+        return self._positions
+
+    @positions.setter
+    def positions(self, value: pd.DataFrame):
+        self._positions = value
+        self.mark_changed()
+
+    @property
+    def version(self) -> int:
+        """Version counter bumped on every change to the positions"""
+        return self._version
+
+    def mark_changed(self):
+        """Invalidate the memoized valuation after an in-place change to positions"""
+        self._version += 1
+        self._snapshot = None
+
+    @classmethod
+    def _count_snapshot(cls, hit: bool):
+        with cls._snapshot_stats_lock:
+            cls.snapshot_stats['hits' if hit else 'misses'] += 1
+
+    def get_snapshot(self, prices: Optional[pd.Series] = None) -> PortfolioSnapshot:
+        """Value all positions against a price vector in one vectorized step"""
+        if self.positions.empty:
+            return empty_snapshot()
+
+        # With live prices, reuse the last valuation until positions change or quotes expire
+        if prices is None:
+            cached = self._snapshot
+            if cached is not None:
+                version, computed_at, snapshot = cached
+                if version == self._version and time.monotonic() - computed_at < shared_cache.ttls['quote']:
+                    self._count_snapshot(True)
+                    return snapshot
+            self._count_snapshot(False)
+            version = self._version
+            prices = self.get_prices()
+        else:
+            version = None
+
+        snapshot = value_positions(self.positions, prices)
+        if snapshot.missing_symbols:
+            print(f"Error getting position data for {', '.join(snapshot.missing_symbols)}: no price available")
+        if version is not None:
+            self._snapshot = (version, time.monotonic(), snapshot)
+        return snapshot
+
+    def get_positions(self, prices: Optional[pd.Series] = None) -> pd.DataFrame:
+        """Get current positions with latest market values"""
+        return self.get_snapshot(prices).positions
     
-    def get_total_value(self) -> float:
+    def get_total_value(self, prices: Optional[pd.Series] = None) -> float:
         """Calculate total portfolio value"""
-        positions = self.get_positions()
-        return positions['Market Value'].sum() if not positions.empty else 0.0
+        return self.get_snapshot(prices).total_value
     
     def get_performance_history(self) -> pd.DataFrame:
         """Get historical performance data"""
         if self.positions.empty:
             return pd.DataFrame()
         
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=365)
+        start_date = (datetime.now() - timedelta(days=365)).date()
         
-        portfolio_history = pd.DataFrame()
-        for _, position in self.positions.iterrows():
-            try:
-                stock = yf.Ticker(position['symbol'])
-                history = stock.history(start=start_date, end=end_date)
-                if not history.empty:
-                    portfolio_history[position['symbol']] = history['Close'] * position['shares']
-            except Exception as e:
-                print(f"Error getting history for {position['symbol']}: {str(e)}")
+        try:
+            closes = get_history_store().get_close_matrix(self.positions['symbol'], start_date)
+        except Exception as e:
+            print(f"Error getting history for {self.name}: {str(e)}")
+            return pd.DataFrame()
         
+        if closes.empty:
+            return pd.DataFrame()
+        
+        shares = self.positions.groupby(self.positions['symbol'].str.strip().str.upper())['shares'].sum()
+        portfolio_history = closes * shares.reindex(closes.columns)
         portfolio_history['Total'] = portfolio_history.sum(axis=1)
         return portfolio_history
     
-    def create_performance_chart(self, performance_data: pd.DataFrame) -> go.Figure:
+    def create_performance_chart(self, performance_data: pd.DataFrame) -> 'go.Figure':
         """Create an interactive performance chart"""
+        import plotly.graph_objects as go
+
         if performance_data.empty:
             return go.Figure()
         
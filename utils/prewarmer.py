@@ -0,0 +1,64 @@
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from .shared_cache import shared_cache
+from .data_aggregator import SNAPSHOT_FETCHERS
+from .rate_limiter import BACKGROUND
+
+class MarketPrewarmer:
+    def __init__(self, fetchers: Dict[str, Callable[..., Dict]] = SNAPSHOT_FETCHERS,
+                 interval: float = 60, cache=shared_cache):
+        self.fetchers = fetchers
+        self.interval = interval
+        self.cache = cache
+        self.last_refresh: Dict[str, datetime] = {}
+        self.last_error: Dict[str, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self, name: str):
+        """Actualizar una instantánea y guardarla en el caché compartido"""
+        try:
+            # Con prioridad de fondo para no quitar turno a las consultas de la interfaz
+            data = self.fetchers[name](priority=BACKGROUND)
+            updated_at = datetime.now()
+            # El TTL cubre varios ciclos para que la página nunca espere mientras se refresca
+            self.cache.set('snapshot', name, {'data': data, 'updated_at': updated_at},
+                           ttl=self.interval * 5)
+            self.last_refresh[name] = updated_at
+            self.last_error.pop(name, None)
+        except Exception as e:
+            self.last_error[name] = str(e)
+            print(f"Error refreshing snapshot {name}: {str(e)}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            for name in self.fetchers:
+                self.refresh(name)
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        """Arrancar el refresco periódico en un hilo de fondo"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="market-prewarmer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detener el refresco periódico"""
+        self._stop.set()
+
+_prewarmer = None
+_prewarmer_lock = threading.Lock()
+
+def start_prewarmer(interval: float = 60) -> MarketPrewarmer:
+    """Arrancar (una sola vez por proceso) el precalentador de índices y sectores"""
+    global _prewarmer
+    with _prewarmer_lock:
+        if _prewarmer is None:
+            _prewarmer = MarketPrewarmer(interval=interval)
+            _prewarmer.start()
+        return _prewarmer
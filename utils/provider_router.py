@@ -0,0 +1,276 @@
+import streamlit as st
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Optional
+from .api_integrations import APIIntegrations
+from .rate_limiter import scheduler, RateLimitExceeded
+from .data_sources import fetch_fast_info
+
+class QuoteProvider:
+    """Proveedor de cotizaciones; las subclases implementan fetch_quote"""
+    name = "base"
+    # Cubo del ProviderScheduler que limita al proveedor (None si no tiene límite)
+    rate_limit = None
+
+    def is_available(self) -> bool:
+        """Indica si el proveedor está configurado (claves, dependencias)"""
+        return True
+
+    def has_capacity(self) -> bool:
+        """Indica si puede atender ya una petición sin esperar a su límite"""
+        return self.rate_limit is None or scheduler.has_capacity(self.rate_limit)
+
+    def fetch_quote(self, symbol: str) -> Dict:
+        """Devolver {'price', 'change', 'volume', 'currency'} del símbolo"""
+        raise NotImplementedError
+
+class YFinanceProvider(QuoteProvider):
+    name = "yfinance"
+    rate_limit = "yfinance"
+
+    def fetch_quote(self, symbol: str) -> Dict:
+        # fast_info hace una única petición pequeña al endpoint de gráficos
+        fast = fetch_fast_info(symbol)
+        price = float(fast['last_price'])
+        previous_close = float(fast['previous_close'] or 0)
+        return {
+            'price': price,
+            'change': ((price - previous_close) / previous_close * 100) if previous_close else 0.0,
+            'volume': int(fast['last_volume'] or 0),
+            'currency': fast['currency'] or 'USD'
+        }
+
+class AlphaVantageProvider(QuoteProvider):
+    name = "alpha_vantage"
+    rate_limit = "alpha_vantage"
+
+    def is_available(self) -> bool:
+        return bool(_secret("ALPHA_VANTAGE_KEY"))
+
+    def fetch_quote(self, symbol: str) -> Dict:
+        # La clave se lee una sola vez y se pasa a la petición: la misma que decide is_available
+        api = APIIntegrations({'ALPHA_VANTAGE_KEY': _secret("ALPHA_VANTAGE_KEY")})
+        # timeout=0: en los hilos del router no se espera turno; sin token, falla al momento
+        quote = api.get_stock_data(symbol, timeout=0).get('Global Quote') or {}
+        if not quote.get('05. price'):
+            raise Exception(f"Alpha Vantage sin cotización para {symbol}")
+        return {
+            'price': float(quote['05. price']),
+            'change': float(quote.get('10. change percent', '0%').rstrip('%') or 0),
+            'volume': int(quote.get('06. volume', 0) or 0),
+            'currency': 'USD'
+        }
+
+class PolygonProvider(QuoteProvider):
+    name = "polygon"
+    rate_limit = "polygon"
+
+    def is_available(self) -> bool:
+        return bool(_secret("POLYGON_KEY"))
+
+    def fetch_quote(self, symbol: str) -> Dict:
+        # La instantánea trae la última operación; el agregado /prev es la sesión anterior
+        api = APIIntegrations({'POLYGON_KEY': _secret("POLYGON_KEY")})
+        ticker = api.get_snapshot(symbol, timeout=0).get('ticker') or {}
+        price = (ticker.get('lastTrade') or {}).get('p')
+        if not price:
+            raise Exception(f"Polygon sin cotización para {symbol}")
+        return {
+            'price': float(price),
+            'change': float(ticker.get('todaysChangePerc') or 0.0),
+            'volume': int((ticker.get('day') or {}).get('v') or 0),
+            'currency': 'USD'
+        }
+
+class StaticQuoteProvider(QuoteProvider):
+    """Proveedor local con latencia y errores simulados, para pruebas y benchmarks"""
+
+    def __init__(self, name: str, quotes: Dict[str, Dict], latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0):
+        self.name = name
+        self.quotes = quotes
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def fetch_quote(self, symbol: str) -> Dict:
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if random.random() < self.error_rate or symbol not in self.quotes:
+            raise Exception(f"{self.name} sin cotización para {symbol}")
+        return dict(self.quotes[symbol])
+
+def _secret(name: str) -> str:
+    """Leer una clave de st.secrets o, si no existe, del entorno"""
+    try:
+        value = st.secrets.get(name, "")
+        if value:
+            return value
+    except Exception:
+        pass
+    return os.getenv(name, "")
+
+class ProviderStats:
+    def __init__(self, window: int = 200):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.requests = 0
+        self.wins = 0
+        self.hedged = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+class ProviderRouter:
+    def __init__(self, providers: List[QuoteProvider], hedge_after: float = 1.0,
+                 timeout: float = 8.0, max_error_rate: float = 0.5,
+                 failure_cooldown: float = 30.0, max_workers: int = 16,
+                 min_samples: int = 10):
+        self.providers = providers
+        self.hedge_after = hedge_after
+        self.timeout = timeout
+        self.max_error_rate = max_error_rate
+        self.failure_cooldown = failure_cooldown
+        self.min_samples = min_samples
+        self._stats = {provider.name: ProviderStats() for provider in providers}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quote-router")
+
+    def _healthy(self, provider: QuoteProvider, now: float) -> bool:
+        return now >= self._stats[provider.name].unhealthy_until
+
+    def ranked_providers(self) -> List[QuoteProvider]:
+        """Proveedores disponibles ordenados por latencia p50
+
+        Se excluyen los apartados (fallos seguidos o tasa de error por encima de
+        max_error_rate) y los que no tienen token libre en su límite de peticiones.
+        Si no queda ninguno se usan todos los disponibles, antes que no dar cotización.
+        """
+        now = time.monotonic()
+        available = [p for p in self.providers if p.is_available()]
+        with self._lock:
+            candidates = [p for p in available if self._healthy(p, now)]
+
+            def sort_key(provider):
+                p50 = self._stats[provider.name].percentile(0.5)
+                # Sin muestras se asume el umbral de cobertura para que el proveedor se pruebe
+                return self.hedge_after if p50 is None else p50
+            candidates = sorted(candidates or available, key=sort_key)
+        return [p for p in candidates if p.has_capacity()] or candidates
+
+    def _call(self, provider: QuoteProvider, symbol: str) -> Dict:
+        started = time.monotonic()
+        try:
+            quote = provider.fetch_quote(symbol)
+        except RateLimitExceeded:
+            # Sin token no es un fallo del proveedor: no cuenta para su salud
+            raise
+        except Exception:
+            self._record(provider, time.monotonic() - started, False)
+            raise
+        self._record(provider, time.monotonic() - started, True)
+        return quote
+
+    def _record(self, provider: QuoteProvider, latency: float, ok: bool):
+        with self._lock:
+            stats = self._stats[provider.name]
+            stats.requests += 1
+            stats.outcomes.append(ok)
+            if ok:
+                stats.latencies.append(latency)
+                stats.consecutive_failures = 0
+            else:
+                stats.consecutive_failures += 1
+                error_rate_exceeded = (len(stats.outcomes) >= self.min_samples
+                                       and stats.error_rate() > self.max_error_rate)
+                if stats.consecutive_failures >= 3 or error_rate_exceeded:
+                    # Tras el enfriamiento vuelve a probarse; otro fallo lo aparta de nuevo
+                    stats.unhealthy_until = time.monotonic() + self.failure_cooldown
+
+    def get_quote(self, symbol: str) -> Dict:
+        """Pedir la cotización al proveedor más rápido y cubrirla con un segundo si tarda"""
+        candidates = self.ranked_providers()
+        if not candidates:
+            raise Exception("No hay proveedores de cotizaciones disponibles")
+
+        deadline = time.monotonic() + self.timeout
+        pending = {}
+        errors = []
+
+        def launch(is_hedge: bool):
+            provider = candidates.pop(0)
+            if is_hedge:
+                with self._lock:
+                    self._stats[provider.name].hedged += 1
+            pending[self._executor.submit(self._call, provider, symbol)] = provider
+
+        launch(False)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # Mientras queden alternativas, esperar solo hasta el umbral de cobertura
+            done, _ = wait(
+                pending,
+                timeout=min(self.hedge_after, remaining) if candidates else remaining,
+                return_when=FIRST_COMPLETED
+            )
+            if not done:
+                if candidates:
+                    launch(True)
+                continue
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    quote = future.result()
+                except Exception as e:
+                    errors.append(f"{provider.name}: {str(e)}")
+                    continue
+                with self._lock:
+                    self._stats[provider.name].wins += 1
+                quote['provider'] = provider.name
+                return quote
+
+            # Todas las respuestas recibidas fallaron: pasar al siguiente proveedor
+            if not pending and candidates:
+                launch(False)
+
+        # Plazo agotado: lo que no haya empezado no se ejecuta
+        for future in pending:
+            future.cancel()
+        raise Exception(f"No se pudo obtener la cotización de {symbol}: {'; '.join(errors) or 'tiempo agotado'}")
+
+    def stats(self) -> Dict:
+        """Obtener latencias p50/p99, tasa de error y coberturas por proveedor"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                provider.name: {
+                    'available': provider.is_available(),
+                    'healthy': self._healthy(provider, now),
+                    'requests': self._stats[provider.name].requests,
+                    'wins': self._stats[provider.name].wins,
+                    'hedged': self._stats[provider.name].hedged,
+                    'p50_ms': (self._stats[provider.name].percentile(0.5) or 0.0) * 1000,
+                    'p99_ms': (self._stats[provider.name].percentile(0.99) or 0.0) * 1000,
+                    'error_rate': self._stats[provider.name].error_rate() * 100
+                }
+                for provider in self.providers
+            }
+
+# Router compartido por el proceso
+quote_router = ProviderRouter([YFinanceProvider(), AlphaVantageProvider(), PolygonProvider()])
@@ -0,0 +1,72 @@
+import pandas as pd
+from typing import Iterable, List
+from .shared_cache import shared_cache
+from .data_sources import download
+from .rate_limiter import INTERACTIVE
+
+class QuoteEngine:
+    def __init__(self, batch_size: int = 100, cache=shared_cache):
+        self.batch_size = batch_size
+        self.cache = cache
+
+    def _normalize(self, symbols: Iterable[str]) -> List[str]:
+        """Normalizar y deduplicar símbolos conservando el orden"""
+        seen = {}
+        for symbol in symbols:
+            if not isinstance(symbol, str) or not symbol.strip():
+                continue
+            seen.setdefault(symbol.strip().upper(), None)
+        return list(seen)
+
+    def _download_closes(self, symbols: List[str], priority: int = INTERACTIVE) -> pd.Series:
+        """Descargar el último cierre de un lote de símbolos en una sola petición"""
+        data = download(
+            symbols,
+            priority=priority,
+            period="5d",
+            interval="1d",
+            group_by="column",
+            auto_adjust=False,
+            threads=True
+        )
+        if data.empty:
+            return pd.Series(dtype=float)
+
+        closes = data['Close']
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(symbols[0])
+
+        # El último valor válido de cada columna es la cotización más reciente
+        return closes.ffill().iloc[-1].dropna()
+
+    def get_prices(self, symbols: Iterable[str], priority: int = INTERACTIVE) -> pd.Series:
+        """Obtener un vector de precios indexado por símbolo con peticiones por lotes"""
+        symbols = self._normalize(symbols)
+        if not symbols:
+            return pd.Series(dtype=float)
+
+        # Solo se descargan los símbolos que no están vigentes en el caché compartido
+        cached = self.cache.get_many('quote', symbols)
+        missing = [symbol for symbol in symbols if symbol not in cached]
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            try:
+                fetched = self._download_closes(batch, priority)
+                self.cache.set_many('quote', fetched.to_dict())
+                cached.update(fetched.to_dict())
+            except Exception as e:
+                print(f"Error fetching quotes for {', '.join(batch)}: {str(e)}")
+
+        return pd.Series(
+            {symbol: cached[symbol] for symbol in symbols if symbol in cached},
+            dtype=float
+        )
+
+    def get_price(self, symbol: str) -> float:
+        """Obtener el precio de un único símbolo"""
+        prices = self.get_prices([symbol])
+        symbol = symbol.strip().upper()
+        if symbol not in prices.index:
+            raise Exception(f"No hay cotización disponible para {symbol}")
+        return float(prices[symbol])
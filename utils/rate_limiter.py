@@ -0,0 +1,182 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+# Prioridades: un número menor se atiende antes
+INTERACTIVE = 0
+BACKGROUND = 1
+BATCH = 2
+
+PRIORITY_NAMES = {
+    INTERACTIVE: 'interactive',
+    BACKGROUND: 'background',
+    BATCH: 'batch'
+}
+
+# Espera máxima por defecto antes de rechazar la petición (None = esperar siempre)
+DEFAULT_TIMEOUTS = {
+    INTERACTIVE: 10.0,
+    BACKGROUND: 120.0,
+    BATCH: None
+}
+
+class RateLimitExceeded(Exception):
+    def __init__(self, provider: str, retry_after: float):
+        self.provider = provider
+        self.retry_after = retry_after
+        super().__init__(
+            f"Límite de peticiones alcanzado para {provider}, reintentar en {retry_after:.0f}s"
+        )
+
+class TokenBucket:
+    def __init__(self, capacity: float, per_seconds: float):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        if now < self.paused_until:
+            self.updated_at = now
+            return
+        start = max(self.updated_at, self.paused_until)
+        self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated_at = now
+
+    def try_take(self, now: float) -> bool:
+        """Consumir un token si hay alguno disponible"""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def time_until_token(self, now: float) -> float:
+        """Segundos hasta que haya un token disponible"""
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now + 1 / self.rate
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def drain(self, now: float, pause: float = 0.0):
+        """Vaciar el cubo tras una respuesta de limitación del proveedor"""
+        self.tokens = 0.0
+        self.updated_at = now
+        self.paused_until = max(self.paused_until, now + pause)
+
+class _ProviderState:
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.queue = []
+        self.granted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.waits = deque(maxlen=1000)
+
+class ProviderScheduler:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._providers: Dict[str, _ProviderState] = {}
+        self._sequence = itertools.count()
+
+    def register(self, provider: str, capacity: float, per_seconds: float):
+        """Registrar un proveedor con su límite de peticiones"""
+        with self._cond:
+            self._providers[provider] = _ProviderState(TokenBucket(capacity, per_seconds))
+
+    def acquire(self, provider: str, priority: int = INTERACTIVE, timeout: Optional[float] = -1):
+        """Esperar turno y token para el proveedor; lanza RateLimitExceeded si se agota la espera"""
+        if timeout == -1:
+            timeout = DEFAULT_TIMEOUTS.get(priority)
+
+        with self._cond:
+            state = self._providers.get(provider)
+            if state is None:
+                return
+
+            started = time.monotonic()
+            entry = (priority, next(self._sequence))
+            heapq.heappush(state.queue, entry)
+
+            while True:
+                now = time.monotonic()
+                if state.queue[0] == entry and state.bucket.try_take(now):
+                    heapq.heappop(state.queue)
+                    state.granted += 1
+                    state.waits.append(now - started)
+                    self._cond.notify_all()
+                    return
+
+                wait = state.bucket.time_until_token(now) if state.queue[0] == entry else None
+                if timeout is not None:
+                    remaining = timeout - (now - started)
+                    if remaining <= 0:
+                        state.queue.remove(entry)
+                        heapq.heapify(state.queue)
+                        state.rejected += 1
+                        self._cond.notify_all()
+                        raise RateLimitExceeded(provider, state.bucket.time_until_token(now))
+                    wait = remaining if wait is None else min(wait, remaining)
+
+                self._cond.wait(wait)
+
+    def has_capacity(self, provider: str) -> bool:
+        """Indica si el proveedor podría atender ahora una petición sin esperar"""
+        with self._cond:
+            state = self._providers.get(provider)
+            if state is None:
+                return True
+            return not state.queue and state.bucket.time_until_token(time.monotonic()) == 0
+
+    def submit(self, provider: str, fn: Callable[[], Any], priority: int = INTERACTIVE,
+               timeout: Optional[float] = -1) -> Any:
+        """Ejecutar fn cuando el proveedor lo permita"""
+        self.acquire(provider, priority, timeout)
+        return fn()
+
+    def report_throttled(self, provider: str, pause: float = 60.0):
+        """Registrar una respuesta de limitación y pausar el proveedor"""
+        with self._cond:
+            state = self._providers.get(provider)
+            if state is None:
+                return
+            state.throttled += 1
+            state.bucket.drain(time.monotonic(), pause)
+
+    def stats(self) -> Dict:
+        """Obtener profundidad de cola y tiempos de espera por proveedor"""
+        with self._cond:
+            now = time.monotonic()
+            result = {}
+            for provider, state in self._providers.items():
+                waits = sorted(state.waits)
+                depth_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+                for priority, _ in state.queue:
+                    depth_by_priority[PRIORITY_NAMES[priority]] += 1
+                result[provider] = {
+                    'queue_depth': len(state.queue),
+                    'queue_by_priority': depth_by_priority,
+                    'tokens': round(min(state.bucket.capacity, state.bucket.tokens), 2),
+                    'next_token_in': round(state.bucket.time_until_token(now), 2),
+                    'granted': state.granted,
+                    'rejected': state.rejected,
+                    'throttled': state.throttled,
+                    'avg_wait': (sum(waits) / len(waits)) if waits else 0.0,
+                    'p95_wait': waits[int(len(waits) * 0.95)] if waits else 0.0,
+                    'max_wait': waits[-1] if waits else 0.0
+                }
+            return result
+
+# Límites de los planes gratuitos de cada proveedor
+scheduler = ProviderScheduler()
+scheduler.register('alpha_vantage', capacity=5, per_seconds=60)
+scheduler.register('polygon', capacity=5, per_seconds=60)
+scheduler.register('coingecko', capacity=30, per_seconds=60)
+# yfinance no publica un límite; este margen evita que los procesos de fondo lo saturen
+scheduler.register('yfinance', capacity=100, per_seconds=60)
@@ -1,21 +1,46 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from typing import Optional
 from .portfolio import Portfolio
 from .market_data import MarketData
+from .history_store import get_history_store
 from .ai_advisor import AIAdvisor
 import json
+import os
 from openai import OpenAI
+from .replay import recorder
+from .llm_cache import llm_cache, complete_chat
 
 class RecommendationEngine:
     def __init__(self):
         self.market_data = MarketData()
         self.ai_advisor = AIAdvisor()
-        self.openai = OpenAI()
+        self.openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY") or ("offline" if recorder.offline else None))
 
-    def analyze_portfolio_risk(self, portfolio: Portfolio) -> dict:
+    def _complete(self, call_site: str, context, messages, **params) -> str:
+        """Llamar a OpenAI a través del caché y del grabador y devolver el texto generado
+
+        messages puede ser una función: el prompt, con los datos de mercado que lleve,
+        solo se prepara si el caché no tiene ya la respuesta.
+        """
+        def create():
+            request = dict(params, messages=messages() if callable(messages) else messages)
+            return recorder.call('openai.chat', request, lambda: complete_chat(self.openai, request))
+
+        return llm_cache.get_or_create(call_site, params, create, context=context)
+
+    def _holdings(self, positions: pd.DataFrame) -> list:
+        """Composición de la cartera sin precios, para identificar respuestas en el caché"""
+        if positions.empty:
+            return []
+        return sorted([symbol, round(float(shares), 6)]
+                      for symbol, shares in zip(positions['Symbol'], positions['Shares']))
+
+    def analyze_portfolio_risk(self, portfolio: Portfolio, prices: Optional[pd.Series] = None) -> dict:
         """Analizar el riesgo del portafolio actual"""
-        positions = portfolio.get_positions()
+        snapshot = portfolio.get_snapshot(prices)
+        positions = snapshot.positions
         if positions.empty:
             return {
                 "risk_level": "N/A",
@@ -24,8 +49,7 @@ class RecommendationEngine:
             }
 
         # Calcular métricas de riesgo
-        total_value = positions['Market Value'].sum()
-        position_weights = positions['Market Value'] / total_value
+        position_weights = snapshot.weights()
 
         # Riesgo de concentración
         max_weight = position_weights.max()
@@ -50,18 +74,22 @@ class RecommendationEngine:
             "concentration_risk": concentration_risk
         }
 
-    def get_ai_market_analysis(self, portfolio: Portfolio) -> str:
+    def get_ai_market_analysis(self, portfolio: Portfolio, prices: Optional[pd.Series] = None) -> str:
         """Obtener análisis de mercado avanzado usando GPT-4"""
         try:
-            positions = portfolio.get_positions()
-            market_data = self.market_data.get_market_data()
+            positions = portfolio.get_positions(prices)
+        except Exception as e:
+            return f"Error en análisis de IA: {str(e)}"
 
-            # Obtener datos históricos y fundamentales para cada posición
-            historical_data = {}
-            fundamental_data = {}
-            for symbol in positions['Symbol'].unique():
-                historical_data[symbol] = self.market_data.get_historical_data(symbol, days=365)
-                fundamental_data[symbol] = self.market_data.get_fundamental_data(symbol)
+        def messages():
+            symbols = list(positions['Symbol'].unique())
+            market_data = {
+                'sp500_return_pct': round(self.market_data.get_market_return(), 2),
+                'quotes': {symbol: self._quote_summary(symbol) for symbol in symbols}
+            }
+            # Datos históricos (un año de cierres guardados) y fundamentales de cada posición
+            historical_data = self._history_summary(symbols)
+            fundamental_data = {symbol: self.market_data.get_fundamental_data(symbol) for symbol in symbols}
 
             prompt = f"""
             Por favor, realiza un análisis detallado y profundo del siguiente portafolio y condiciones de mercado:
@@ -73,7 +101,7 @@ class RecommendationEngine:
             {json.dumps(market_data, indent=2)}
 
             DATOS HISTÓRICOS Y FUNDAMENTALES:
-            {json.dumps(fundamental_data, indent=2)}
+            {json.dumps({'historicos': historical_data, 'fundamentales': fundamental_data}, indent=2, default=str)}
 
             Proporciona un análisis exhaustivo que incluya:
 
@@ -111,36 +139,63 @@ class RecommendationEngine:
             Incluye cifras específicas y justificación para cada recomendación.
             """
 
-            response = self.openai.chat.completions.create(
+            return [{
+                "role": "system",
+                "content": """Eres un analista financiero experto con más de 20 años de experiencia.
+                Proporcionas análisis detallados y basados en datos, siempre incluyendo:
+                - Métricas específicas y cuantitativas
+                - Contexto histórico y comparativo
+                - Proyecciones fundamentadas
+                - Riesgos y oportunidades concretas"""
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }]
+
+        try:
+            return self._complete(
+                'market_analysis', self._holdings(positions), messages,
                 model="gpt-4",  # Último modelo de OpenAI
-                messages=[{
-                    "role": "system",
-                    "content": """Eres un analista financiero experto con más de 20 años de experiencia.
-                    Proporcionas análisis detallados y basados en datos, siempre incluyendo:
-                    - Métricas específicas y cuantitativas
-                    - Contexto histórico y comparativo
-                    - Proyecciones fundamentadas
-                    - Riesgos y oportunidades concretas"""
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }],
                 temperature=0.7,
                 max_tokens=2000
             )
-
-            return response.choices[0].message.content
-
         except Exception as e:
             return f"Error en análisis de IA: {str(e)}"
 
-    def generate_personalized_recommendations(self, portfolio: Portfolio, risk_profile: dict) -> dict:
+    def _quote_summary(self, symbol: str) -> dict:
+        """Precio, variación y volumen actuales de un símbolo (vacío si no hay cotización)"""
+        try:
+            quote = self.market_data.get_quote(symbol)
+        except Exception as e:
+            print(f"Error getting quote for {symbol}: {str(e)}")
+            return {}
+        return {key: quote.get(key) for key in ('price', 'change', 'volume', 'currency')}
+
+    def _history_summary(self, symbols: list) -> dict:
+        """Rentabilidad, máximo, mínimo y medias de un año de cierres por símbolo"""
+        closes = get_history_store().get_close_matrix(symbols, date.today() - timedelta(days=365))
+        summary = {}
+        for symbol in closes.columns:
+            series = closes[symbol].dropna()
+            if series.empty:
+                continue
+            summary[symbol] = {
+                'return_1y_pct': round((series.iloc[-1] / series.iloc[0] - 1) * 100, 2),
+                'high_52w': round(series.max(), 2),
+                'low_52w': round(series.min(), 2),
+                'sma_50': round(series.tail(50).mean(), 2),
+                'sma_200': round(series.tail(200).mean(), 2)
+            }
+        return summary
+
+    def generate_personalized_recommendations(self, portfolio: Portfolio, risk_profile: dict,
+                                              prices: Optional[pd.Series] = None) -> dict:
         """Generar recomendaciones personalizadas basadas en IA"""
         try:
-            current_positions = portfolio.get_positions()
-            risk_analysis = self.analyze_portfolio_risk(portfolio)
-            market_analysis = self.get_ai_market_analysis(portfolio)
+            current_positions = portfolio.get_positions(prices)
+            risk_analysis = self.analyze_portfolio_risk(portfolio, prices)
+            market_analysis = self.get_ai_market_analysis(portfolio, prices)
 
             prompt = f"""
             Basándote en la siguiente información, genera recomendaciones de inversión altamente personalizadas:
@@ -174,7 +229,13 @@ class RecommendationEngine:
             - Plan de implementación
             """
 
-            response = self.openai.chat.completions.create(
+            response = self._complete(
+                'recommendations',
+                {
+                    'holdings': self._holdings(current_positions),
+                    'profile': risk_profile['profile'],
+                    'score': risk_profile['score']
+                },
                 model="gpt-4o",
                 messages=[{
                     "role": "system",
@@ -193,7 +254,7 @@ class RecommendationEngine:
                 max_tokens=2000
             )
 
-            recommendations = response.choices[0].message.content
+            recommendations = response
             return {
                 "ai_recommendations": recommendations,
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -205,9 +266,9 @@ class RecommendationEngine:
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
 
-    def generate_trade_recommendations(self, portfolio: Portfolio) -> list:
+    def generate_trade_recommendations(self, portfolio: Portfolio, prices: Optional[pd.Series] = None) -> list:
         """Generar recomendaciones específicas de trading"""
-        positions = portfolio.get_positions()
+        positions = portfolio.get_positions(prices)
         recommendations = []
         
         if positions.empty:
@@ -217,50 +278,56 @@ class RecommendationEngine:
                 "description": "Considere iniciar posiciones en diferentes sectores del mercado para construir un portafolio diversificado."
             }]
         
-        # Analizar cada posición
-        for _, position in positions.iterrows():
-            symbol = position['Symbol']
-            current_price = position['Current Price']
-            market_value = position['Market Value']
-            
-            # Obtener datos de mercado adicionales
+        # Obtener datos de mercado adicionales (cotización ligera + fundamentales en caché)
+        market_metrics = []
+        for symbol in positions['Symbol'].unique():
             try:
                 stock_data = self.market_data.get_stock_data(symbol)
-                
-                # Analizar métricas
-                pe_ratio = stock_data.get('pe_ratio', 0)
-                price_change = stock_data.get('change', 0)
-                
-                # Generar recomendación basada en métricas
-                if price_change < -5 and pe_ratio < 15:
-                    recommendations.append({
-                        "type": "BUY",
-                        "symbol": symbol,
-                        "reason": "Oportunidad de compra: Caída significativa de precio y valuación atractiva",
-                        "metrics": {
-                            "price_change": f"{price_change:.2f}%",
-                            "pe_ratio": pe_ratio
-                        }
-                    })
-                elif price_change > 10 and pe_ratio > 30:
-                    recommendations.append({
-                        "type": "SELL",
-                        "symbol": symbol,
-                        "reason": "Considerar toma de ganancias: Fuerte subida y valuación elevada",
-                        "metrics": {
-                            "price_change": f"{price_change:.2f}%",
-                            "pe_ratio": pe_ratio
-                        }
-                    })
-                
+                market_metrics.append({
+                    'symbol': symbol,
+                    'price_change': stock_data.get('change', 0),
+                    'pe_ratio': stock_data.get('pe_ratio', 0)
+                })
             except Exception:
                 continue
+
+        if not market_metrics:
+            return recommendations
+
+        # Generar recomendaciones evaluando las métricas de todas las posiciones a la vez
+        signals = pd.DataFrame(market_metrics)
+        price_change = pd.to_numeric(signals['price_change'], errors='coerce')
+        pe_ratio = pd.to_numeric(signals['pe_ratio'], errors='coerce')
+        signals['type'] = np.select(
+            [(price_change < -5) & (pe_ratio < 15), (price_change > 10) & (pe_ratio > 30)],
+            ['BUY', 'SELL'],
+            default=''
+        )
+        signals = signals[signals['type'] != '']
+
+        reasons = {
+            'BUY': "Oportunidad de compra: Caída significativa de precio y valuación atractiva",
+            'SELL': "Considerar toma de ganancias: Fuerte subida y valuación elevada"
+        }
+        recommendations.extend(
+            {
+                "type": signal['type'],
+                "symbol": signal['symbol'],
+                "reason": reasons[signal['type']],
+                "metrics": {
+                    "price_change": f"{signal['price_change']:.2f}%",
+                    "pe_ratio": signal['pe_ratio']
+                }
+            }
+            for signal in signals.to_dict('records')
+        )
         
         return recommendations
     
 
     def get_portfolio_recommendations(self, portfolio: Portfolio) -> dict:
         """Obtener recomendaciones completas para el portafolio"""
+        # Todos los análisis reutilizan la misma valoración memoizada de la cartera
         # Análisis de riesgo
         risk_analysis = self.analyze_portfolio_risk(portfolio)
 
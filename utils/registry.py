@@ -0,0 +1,118 @@
+import streamlit as st
+import importlib
+import threading
+import time
+from typing import Any, Callable, Dict, List, Union
+
+# Ámbitos de los servicios
+SHARED = 'shared'    # sin estado de usuario: una instancia por proceso
+SESSION = 'session'  # con estado del usuario: una instancia por sesión, creada al primer uso
+
+class ServiceRegistry:
+    """Registro de servicios creados bajo demanda
+
+    Los servicios se declaran con su fábrica y su ámbito y se obtienen como atributos
+    (services.auth_manager). La fábrica puede ser una ruta 'modulo:Clase' para no
+    importar el módulo hasta el primer uso. Cada creación se cronometra para el
+    desglose de arranque.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, tuple] = {}
+        self._shared: Dict[str, Any] = {}
+        self._shared_ms: Dict[str, float] = {}
+        # Reentrante: la fábrica de un servicio puede pedir otro
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Union[str, Callable[[], Any]], scope: str = SESSION):
+        """Declarar un servicio sin crearlo"""
+        if scope not in (SHARED, SESSION):
+            raise ValueError(f"Ámbito de servicio no válido: {scope}")
+        self._factories[name] = (factory, scope)
+
+    def _create(self, name: str, factory) -> tuple:
+        started = time.perf_counter()
+        if isinstance(factory, str):
+            module_name, attribute = factory.split(':')
+            factory = getattr(importlib.import_module(module_name), attribute)
+        instance = factory()
+        return instance, (time.perf_counter() - started) * 1000
+
+    def get(self, name: str) -> Any:
+        """Obtener un servicio, creándolo la primera vez que se pide en su ámbito"""
+        if name not in self._factories:
+            raise KeyError(f"Servicio no registrado: {name}")
+        factory, scope = self._factories[name]
+
+        if scope == SHARED:
+            instance = self._shared.get(name)
+            if instance is None:
+                with self._lock:
+                    instance = self._shared.get(name)
+                    if instance is None:
+                        instance, elapsed_ms = self._create(name, factory)
+                        self._shared[name] = instance
+                        self._shared_ms[name] = elapsed_ms
+            return instance
+
+        services = st.session_state.setdefault('_services', {})
+        if name not in services:
+            instance, elapsed_ms = self._create(name, factory)
+            services[name] = instance
+            st.session_state.setdefault('_service_timings', {})[name] = elapsed_ms
+        return services[name]
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.get(name)
+
+    def begin_run(self):
+        """Marcar el inicio de una ejecución del script"""
+        now = time.perf_counter()
+        st.session_state['_run_started'] = now
+        st.session_state['_run_last_mark'] = now
+        st.session_state['_run_timings'] = []
+
+    def mark(self, phase: str):
+        """Registrar el tiempo transcurrido desde la marca anterior"""
+        now = time.perf_counter()
+        last = st.session_state.get('_run_last_mark', now)
+        st.session_state.setdefault('_run_timings', []).append((phase, (now - last) * 1000))
+        st.session_state['_run_last_mark'] = now
+
+    def end_run(self):
+        """Cerrar la ejecución; la primera de cada sesión se conserva como primer pintado"""
+        self.mark('resto')
+        if '_first_run_timings' not in st.session_state:
+            st.session_state['_first_run_timings'] = list(st.session_state['_run_timings'])
+
+    def startup_report(self) -> Dict[str, List[Dict]]:
+        """Desglose de tiempos: primera ejecución, última ejecución y creación de servicios"""
+        session_timings = st.session_state.get('_service_timings', {})
+        services = []
+        for name, (_, scope) in self._factories.items():
+            if scope == SHARED:
+                created = name in self._shared
+                elapsed_ms = self._shared_ms.get(name)
+            else:
+                created = name in session_timings
+                elapsed_ms = session_timings.get(name)
+            services.append({
+                'service': name,
+                'scope': scope,
+                'created': created,
+                'ms': None if elapsed_ms is None else round(elapsed_ms, 2)
+            })
+
+        def phases(key):
+            return [{'phase': phase, 'ms': round(ms, 1)} for phase, ms in st.session_state.get(key, [])]
+
+        return {
+            'first_run': phases('_first_run_timings'),
+            'last_run': phases('_run_timings'),
+            'services': services
+        }
+
+# Registro compartido por el proceso; app.py declara los servicios
+services = ServiceRegistry()
@@ -0,0 +1,152 @@
+import functools
+import hashlib
+import importlib
+import json
+import os
+import pickle
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+class ReplayMiss(Exception):
+    pass
+
+def _error_entry(error: Exception) -> Dict:
+    """Guardar un error con su clase y atributos para reproducirlo igual"""
+    return {
+        'ok': False,
+        'error': str(error),
+        'error_type': f"{type(error).__module__}:{type(error).__qualname__}",
+        'error_attrs': {name: value for name, value in getattr(error, '__dict__', {}).items()
+                        if _picklable(value)}
+    }
+
+def _picklable(value: Any) -> bool:
+    try:
+        pickle.dumps(value)
+        return True
+    except Exception:
+        return False
+
+def _restore_error(entry: Dict) -> Exception:
+    """Reconstruir el error grabado; si su clase ya no existe se usa Exception"""
+    error_class = Exception
+    module_name, _, qualname = entry.get('error_type', '').partition(':')
+    try:
+        found = importlib.import_module(module_name)
+        for part in qualname.split('.'):
+            found = getattr(found, part)
+        if isinstance(found, type) and issubclass(found, Exception):
+            error_class = found
+    except (ImportError, AttributeError, ValueError):
+        pass
+    # Sin llamar a __init__: la firma de cada clase es distinta (p. ej. RateLimitExceeded)
+    error = error_class.__new__(error_class)
+    Exception.__init__(error, entry['error'])
+    error.__dict__.update(entry.get('error_attrs') or {})
+    return error
+
+class DataRecorder:
+    """Graba respuestas reales de proveedores en disco y las reproduce sin red
+
+    Modos (variable BROKER_IA_DATA_MODE):
+    - live: llamada directa al proveedor
+    - record: llamada al proveedor y guardado de la respuesta (o del error)
+    - replay: respuesta leída de disco con la latencia configurada, sin red
+    """
+
+    MODES = ('live', 'record', 'replay')
+
+    def __init__(self, mode: Optional[str] = None, directory: Optional[str] = None,
+                 latency: Optional[float] = None, jitter: Optional[float] = None):
+        self.mode = (mode or os.getenv('BROKER_IA_DATA_MODE', 'live')).lower()
+        if self.mode not in self.MODES:
+            raise ValueError(f"Modo de datos no válido: {self.mode}")
+        self.directory = directory or os.getenv('BROKER_IA_REPLAY_DIR', '.replay')
+        self.latency = float(os.getenv('BROKER_IA_REPLAY_LATENCY_MS', 0)) / 1000 if latency is None else latency
+        self.jitter = float(os.getenv('BROKER_IA_REPLAY_JITTER_MS', 0)) / 1000 if jitter is None else jitter
+        self.namespace_latency: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.stats = {'recorded': 0, 'replayed': 0, 'misses': 0}
+
+    @property
+    def offline(self) -> bool:
+        """Indica si no se debe tocar la red"""
+        return self.mode == 'replay'
+
+    def set_latency(self, namespace: str, seconds: float):
+        """Fijar la latencia inyectada para un espacio de nombres concreto"""
+        self.namespace_latency[namespace] = seconds
+
+    def _path(self, namespace: str, key: Any) -> str:
+        digest = hashlib.sha256(
+            json.dumps([namespace, key], sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        return os.path.join(self.directory, namespace, f"{digest}.pkl")
+
+    def _inject_latency(self, namespace: str, path: str):
+        latency = self.namespace_latency.get(namespace, self.latency)
+        if self.jitter:
+            # Jitter determinista: la misma clave siempre tarda lo mismo
+            latency += random.Random(path).uniform(-self.jitter, self.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def call(self, namespace: str, key: Any, fn: Callable[[], Any]) -> Any:
+        """Ejecutar fn según el modo activo, identificando la respuesta por (namespace, key)"""
+        if self.mode == 'live':
+            return fn()
+
+        path = self._path(namespace, key)
+
+        if self.mode == 'replay':
+            try:
+                with open(path, 'rb') as f:
+                    entry = pickle.load(f)
+            except FileNotFoundError:
+                with self._lock:
+                    self.stats['misses'] += 1
+                raise ReplayMiss(f"Sin grabación para {namespace} {key}")
+            self._inject_latency(namespace, path)
+            with self._lock:
+                self.stats['replayed'] += 1
+            if not entry['ok']:
+                raise _restore_error(entry)
+            return entry['value']
+
+        error = None
+        try:
+            value = fn()
+            entry = {'ok': True, 'value': value}
+        except Exception as e:
+            error = e
+            entry = _error_entry(e)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump(entry, f)
+        with self._lock:
+            self.stats['recorded'] += 1
+
+        if error is not None:
+            raise error
+        return entry['value']
+
+# Grabador compartido por el proceso, configurado por variables de entorno
+recorder = DataRecorder()
+
+def recorded(namespace: str):
+    """Decorador que pasa la función por el grabador usando sus argumentos como clave
+
+    Los argumentos deben ser estables entre días (p. ej. period='1y' en lugar de una
+    fecha calculada a partir de hoy) para que la grabación siga valiendo. priority
+    solo ordena la espera en el limitador de peticiones, así que no entra en la clave.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key_kwargs = {name: value for name, value in kwargs.items() if name != 'priority'}
+            return recorder.call(namespace, [args, key_kwargs], lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
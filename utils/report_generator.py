@@ -1,5 +1,7 @@
 import streamlit as st
 from datetime import datetime
+from typing import Dict, Iterator, Optional
+import pandas as pd
 from .portfolio import Portfolio
 from .market_data import MarketData
 from .ai_advisor import AIAdvisor
@@ -19,17 +21,17 @@ class ReportGenerator:
         """Formatear porcentajes"""
         return f"{value:,.2f}%"
 
-    def generate_portfolio_analysis(self, portfolio: Portfolio) -> str:
+    def generate_portfolio_analysis(self, portfolio: Portfolio, prices: Optional[pd.Series] = None) -> str:
         """Generar análisis detallado del portafolio"""
-        positions = portfolio.get_positions()
-        total_value = portfolio.get_total_value()
-        performance_data = portfolio.get_performance_history()
+        snapshot = portfolio.get_snapshot(prices)
+        positions = snapshot.positions
+        total_value = snapshot.total_value
 
         # Calcular métricas adicionales
-        total_gain_loss = positions['Gain/Loss'].sum() if not positions.empty else 0
+        total_gain_loss = snapshot.total_gain_loss
         total_return = (total_gain_loss / total_value * 100) if total_value > 0 else 0
-        best_performer = positions.nlargest(1, 'Return %')['Symbol'].iloc[0] if not positions.empty else None
-        worst_performer = positions.nsmallest(1, 'Return %')['Symbol'].iloc[0] if not positions.empty else None
+        best_performer = snapshot.best_performer()
+        worst_performer = snapshot.worst_performer()
 
         portfolio_summary = f"""
         # 📊 Análisis de Portafolio: {portfolio.name}
@@ -48,7 +50,7 @@ class ReportGenerator:
         """
 
         if not positions.empty:
-            for _, position in positions.iterrows():
+            for position in positions.to_dict('records'):
                 portfolio_summary += f"""
                 ### {position['Symbol']}
                 - **Acciones:** {position['Shares']}
@@ -87,9 +89,13 @@ class ReportGenerator:
 
         return market_analysis
 
-    def generate_ai_recommendations(self, portfolio: Portfolio) -> str:
-        """Generar recomendaciones personalizadas usando IA"""
-        positions = portfolio.get_positions()
+    # Encabezado de la sección de IA, también al transmitirla por fragmentos
+    AI_SECTION_TITLE = "# 🤖 Recomendaciones Personalizadas de IA"
+
+    def _ai_prompt(self, portfolio: Portfolio, prices: Optional[pd.Series] = None) -> str:
+        snapshot = portfolio.get_snapshot(prices)
+        positions = snapshot.positions
+        total_value = snapshot.total_value
         symbols = positions['Symbol'].tolist() if not positions.empty else []
 
         analysis_prompt = f"""
@@ -97,7 +103,7 @@ class ReportGenerator:
 
         Portafolio: {portfolio.name}
         Símbolos: {', '.join(symbols)}
-        Valor Total: {self._format_currency(portfolio.get_total_value())}
+        Valor Total: {self._format_currency(total_value)}
 
         Incluye:
         1. Evaluación de la diversificación actual
@@ -106,22 +112,37 @@ class ReportGenerator:
         4. Análisis de riesgos
         5. Recomendaciones específicas para cada posición
         """
+        return analysis_prompt
 
-        recommendations = self.ai_advisor.get_advice(analysis_prompt)
+    def generate_ai_recommendations(self, portfolio: Portfolio, prices: Optional[pd.Series] = None) -> str:
+        """Generar recomendaciones personalizadas usando IA"""
+        recommendations = self.ai_advisor.get_advice(self._ai_prompt(portfolio, prices))
         return f"""
-        # 🤖 Recomendaciones Personalizadas de IA
+        {self.AI_SECTION_TITLE}
 
         {recommendations}
         """
 
-    def generate_complete_report(self, portfolio: Portfolio) -> dict:
-        """Generar informe completo"""
+    def stream_ai_recommendations(self, portfolio: Portfolio, prices: Optional[pd.Series] = None,
+                                  timing: Optional[Dict] = None) -> Iterator[str]:
+        """Como generate_ai_recommendations, pero por fragmentos (para st.write_stream)"""
+        yield f"{self.AI_SECTION_TITLE}\n\n"
+        yield from self.ai_advisor.stream_advice(self._ai_prompt(portfolio, prices), timing)
+
+    def generate_complete_report(self, portfolio: Portfolio, include_ai: bool = True) -> dict:
+        """Generar informe completo
+
+        Con include_ai=False 'ai_recommendations' queda en None para que la página la
+        transmita con stream_ai_recommendations en vez de esperar a la respuesta entera.
+        """
+        # Las secciones reutilizan la misma valoración memoizada de la cartera
         report = {
             'title': f"Informe de Inversión - {portfolio.name}",
+            'portfolio_name': portfolio.name,
             'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             'portfolio_analysis': self.generate_portfolio_analysis(portfolio),
             'market_analysis': self.generate_market_analysis(),
-            'ai_recommendations': self.generate_ai_recommendations(portfolio),
+            'ai_recommendations': self.generate_ai_recommendations(portfolio) if include_ai else None,
         }
 
         return report
\ No newline at end of file
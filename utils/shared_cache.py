@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+from .single_flight import SingleFlight, single_flight
+
+_MISSING = object()
+
+class SharedCache:
+    # TTL en segundos por tipo de dato
+    DEFAULT_TTLS = {
+        'quote': 60,
+        'live_quote': 30,
+        'intraday': 60,
+        'info': 900,
+        'history': 3600,
+        'fundamentals': 86400,
+        'snapshot': 300
+    }
+
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, max_entries: int = 5000,
+                 flight: SingleFlight = single_flight):
+        self.ttls = {**self.DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.flight = flight
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._evictions = 0
+
+    def _lookup(self, kind: str, key: Hashable, now: float) -> Any:
+        """Buscar una entrada vigente (requiere tener el lock)"""
+        entry = self._entries.get((kind, key))
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._entries[(kind, key)]
+            return _MISSING
+        self._entries.move_to_end((kind, key))
+        return value
+
+    def _store(self, kind: str, key: Hashable, value: Any, ttl: Optional[float], now: float):
+        """Guardar una entrada y aplicar el límite LRU (requiere tener el lock)"""
+        ttl = self.ttls.get(kind, 60) if ttl is None else ttl
+        self._entries[(kind, key)] = (now + ttl, value)
+        self._entries.move_to_end((kind, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def _count(self, kind: str, hits: int = 0, misses: int = 0):
+        self._hits[kind] = self._hits.get(kind, 0) + hits
+        self._misses[kind] = self._misses.get(kind, 0) + misses
+
+    def get(self, kind: str, key: Hashable, default: Any = None) -> Any:
+        """Obtener un valor vigente del caché"""
+        with self._lock:
+            value = self._lookup(kind, key, time.monotonic())
+            if value is _MISSING:
+                self._count(kind, misses=1)
+                return default
+            self._count(kind, hits=1)
+            return value
+
+    def set(self, kind: str, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Guardar un valor en el caché"""
+        with self._lock:
+            self._store(kind, key, value, ttl, time.monotonic())
+
+    def get_many(self, kind: str, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """Obtener los valores vigentes de varias claves a la vez"""
+        found = {}
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                value = self._lookup(kind, key, now)
+                if value is _MISSING:
+                    self._count(kind, misses=1)
+                else:
+                    self._count(kind, hits=1)
+                    found[key] = value
+        return found
+
+    def set_many(self, kind: str, values: Dict[Hashable, Any], ttl: Optional[float] = None):
+        """Guardar varios valores a la vez"""
+        with self._lock:
+            now = time.monotonic()
+            for key, value in values.items():
+                self._store(kind, key, value, ttl, now)
+
+    def get_or_load(self, kind: str, key: Hashable, loader: Callable[[], Any],
+                    ttl: Optional[float] = None) -> Any:
+        """Leer a través del caché, cargando el valor si no está vigente"""
+        value = self.get(kind, key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        def load():
+            # Quien llega mientras otro carga la misma clave espera y comparte el resultado
+            value = loader()
+            self.set(kind, key, value, ttl)
+            return value
+
+        return self.flight.do((kind, key), load)
+
+    def invalidate(self, kind: Optional[str] = None, key: Optional[Hashable] = None):
+        """Eliminar entradas por tipo, por clave o todas"""
+        with self._lock:
+            if kind is None:
+                self._entries.clear()
+            elif key is None:
+                for entry_key in [k for k in self._entries if k[0] == kind]:
+                    del self._entries[entry_key]
+            else:
+                self._entries.pop((kind, key), None)
+
+    def stats(self) -> Dict:
+        """Obtener contadores de aciertos y fallos por tipo"""
+        with self._lock:
+            by_kind = {}
+            for kind in set(self._hits) | set(self._misses):
+                hits = self._hits.get(kind, 0)
+                misses = self._misses.get(kind, 0)
+                total = hits + misses
+                by_kind[kind] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': (hits / total * 100) if total else 0.0
+                }
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'evictions': self._evictions,
+                'by_kind': by_kind
+            }
+
+# Instancia única por proceso, compartida por todas las sesiones de Streamlit
+shared_cache = SharedCache()
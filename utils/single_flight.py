@@ -0,0 +1,63 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats: Dict[Hashable, Dict[str, int]] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Ejecutar fn una sola vez por clave; las llamadas concurrentes comparten el resultado"""
+        with self._lock:
+            stats = self._stats.setdefault(key, {'requests': 0, 'executions': 0, 'deduplicated': 0})
+            stats['requests'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                stats['executions'] += 1
+            else:
+                stats['deduplicated'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self) -> int:
+        """Número de peticiones en curso"""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict:
+        """Obtener peticiones, ejecuciones reales y peticiones deduplicadas por clave"""
+        with self._lock:
+            by_key = {key: dict(values) for key, values in self._stats.items()}
+        return {
+            'requests': sum(v['requests'] for v in by_key.values()),
+            'executions': sum(v['executions'] for v in by_key.values()),
+            'deduplicated': sum(v['deduplicated'] for v in by_key.values()),
+            'by_key': by_key
+        }
+
+# Instancia única por proceso, compartida por todas las sesiones de Streamlit
+single_flight = SingleFlight()
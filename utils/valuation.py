@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import List, Optional
+
+POSITION_COLUMNS = ['Symbol', 'Shares', 'Current Price', 'Market Value', 'Gain/Loss', 'Return %']
+
+class PortfolioSnapshot:
+    """Valoración de una cartera en un instante, calculada sobre columnas completas"""
+
+    def __init__(self, positions: pd.DataFrame, total_value: float, total_cost: float,
+                 missing_symbols: List[str], as_of: Optional[datetime] = None):
+        self.positions: pd.DataFrame = positions
+        self.total_value: float = total_value
+        self.total_cost: float = total_cost
+        self.total_gain_loss: float = total_value - total_cost
+        self.total_return_pct: float = (self.total_gain_loss / total_cost * 100) if total_cost else 0.0
+        self.missing_symbols: List[str] = missing_symbols
+        self.as_of: datetime = as_of or datetime.now()
+
+    @property
+    def empty(self) -> bool:
+        return self.positions.empty
+
+    def weights(self) -> pd.Series:
+        """Peso de cada posición sobre el valor total"""
+        if self.empty or not self.total_value:
+            return pd.Series(dtype=float)
+        return self.positions['Market Value'] / self.total_value
+
+    def best_performer(self) -> Optional[str]:
+        return None if self.empty else self.positions.loc[self.positions['Return %'].idxmax(), 'Symbol']
+
+    def worst_performer(self) -> Optional[str]:
+        return None if self.empty else self.positions.loc[self.positions['Return %'].idxmin(), 'Symbol']
+
+def empty_snapshot() -> PortfolioSnapshot:
+    return PortfolioSnapshot(pd.DataFrame(), 0.0, 0.0, [])
+
+def value_positions(positions: pd.DataFrame, prices: pd.Series) -> PortfolioSnapshot:
+    """Unir las posiciones con el vector de precios y valorarlas sin bucles por fila"""
+    if positions is None or positions.empty:
+        return empty_snapshot()
+
+    symbols = positions['symbol'].astype(str).str.strip().str.upper()
+    current_price = symbols.map(prices).astype(float)
+    priced = current_price.notna().to_numpy()
+
+    shares = positions['shares'].astype(float).to_numpy()
+    cost = shares * positions['cost_basis'].astype(float).to_numpy()
+    market_value = current_price.to_numpy() * shares
+    gain_loss = market_value - cost
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return_pct = np.where(cost != 0, gain_loss / cost * 100, 0.0)
+
+    valued = pd.DataFrame({
+        'Symbol': positions['symbol'].to_numpy()[priced],
+        'Shares': shares[priced],
+        'Current Price': current_price.to_numpy()[priced],
+        'Market Value': market_value[priced],
+        'Gain/Loss': gain_loss[priced],
+        'Return %': return_pct[priced]
+    }, columns=POSITION_COLUMNS)
+
+    return PortfolioSnapshot(
+        positions=valued,
+        total_value=float(market_value[priced].sum()),
+        total_cost=float(cost[priced].sum()),
+        missing_symbols=sorted(set(symbols[~priced]))
+    )